@@ -0,0 +1,55 @@
+"""Checks the cold start time of importing the builder module.
+
+Every run imports statblock_builder in a fresh interpreter and makes one basic
+statblock. The fastest of the runs must stay under the budget, and scipy must
+not have been imported. Exits with status 1 otherwise.
+
+Run from the repository root:
+    python benchmarks/bench_import.py [budget_ms] [runs]
+"""
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+# Includes importing NumPy, which the builder needs for its random generators.
+DEFAULT_BUDGET_MS = 300
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import statblock_builder
+statblock_builder.StatblockBuilder().make_statblock_basic(5)
+print((time.perf_counter() - start) * 1000, 'scipy' in sys.modules)
+'''
+
+def measure(runs):
+    """Import times in ms of each run, and whether any run imported scipy"""
+    times = []
+    scipy_loaded = False
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=SRC, check=True, capture_output=True, text=True
+        ).stdout.split()
+        times.append(float(out[0]))
+        scipy_loaded |= out[1] == 'True'
+    return times, scipy_loaded
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    times, scipy_loaded = measure(runs)
+
+    print(f'import statblock_builder: best {min(times):.1f} ms, '
+          f'worst {max(times):.1f} ms over {runs} runs (budget {budget:.0f} ms)')
+    failed = False
+    if min(times) > budget:
+        print('FAIL: cold start is over budget')
+        failed = True
+    if scipy_loaded:
+        print('FAIL: scipy was imported on the default path')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
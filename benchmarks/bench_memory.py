@@ -0,0 +1,75 @@
+"""Compares the memory use of Statblock with the old dict based layout.
+
+Run from the repository root:
+    python benchmarks/bench_memory.py [n_statblocks]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from abilities import Attack # pylint: disable=wrong-import-position
+from damage_types import DamageType # pylint: disable=wrong-import-position
+from statblock import Statblock # pylint: disable=wrong-import-position
+
+class DictAttack():
+    """Attack as it was before __slots__"""
+    def __init__(self, name, tohit, n_dice, die_size, modifier, damage_type, n_attacks=1):
+        self.name = name
+        self.tohit = tohit
+        self.n_dice = n_dice
+        self.die_size = die_size
+        self.modifier = modifier
+        self.damage_type = damage_type
+        self.n_attacks = n_attacks
+
+class DictStatblock():
+    """Statblock as it was before __slots__, one dict and four lists per instance"""
+    def __init__(self, stats):
+        self.attributes = {}
+        self.proficiencies = []
+        self.actions = []
+        self.abilities = []
+        self.spellcasting = None
+        self.senses = []
+        self.basic_attack = None
+
+        for k, v in stats.items():
+            if k in Statblock.num_attributes:
+                self.attributes[k] = v
+            elif k == 'actions':
+                self.actions = v
+            elif k == 'basic_attack':
+                self.basic_attack = v
+
+def make_stats(i, attack_class):
+    """Stats as made by StatblockBuilder.make_statblock_basic"""
+    attack = attack_class('Slam', 5 + i % 7, 1 + i % 8, 8, i % 5, DamageType.BLUDGEONING, 1)
+    return {
+        'cr': i % 30, 'hp_max': 10 + i % 400, 'hp_cur': 10 + i % 400, 'ac': 12 + i % 10,
+        'tohit': 5 + i % 7, 'damage': 10 + i % 90, 'save_dc': 10 + i % 8,
+        'strong_save': i % 9, 'weak_save': i % 4, 'speed': 30,
+        'actions': [attack], 'basic_attack': attack,
+    }
+
+def measure(statblock_class, attack_class, n):
+    """Bytes allocated per statblock, including its attack"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    statblocks = [statblock_class(make_stats(i, attack_class)) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del statblocks
+    return (after - before) / n
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    old = measure(DictStatblock, DictAttack, n)
+    new = measure(Statblock, Attack, n)
+    print(f'{n} statblocks')
+    print(f'dict layout:  {old:8.1f} bytes per statblock')
+    print(f'slots layout: {new:8.1f} bytes per statblock ({new/old:.0%})')
+
+if __name__ == '__main__':
+    main()
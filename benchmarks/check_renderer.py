@@ -0,0 +1,54 @@
+"""Checks that CompactRenderer prints the same cards as Statblock.format.
+
+The renderer caches the text of numbers, so equal int and float values such as
+16 and 16.0 must not share an entry: Statblock.format prints float stats as
+floats. The monsters are rendered from Statblock objects and from a
+StatblockTable, once with int and once with float stats. Exits with status 1 if
+any card differs.
+
+Run from the repository root:
+    python benchmarks/check_renderer.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+from statblock_builder import StatblockBuilder
+from statblock_renderer import CompactRenderer
+from statblock_table import StatblockTable
+# pylint: enable=wrong-import-position
+
+FLOAT_STATS = ('ac', 'hp_max', 'hp_cur', 'save_dc')
+
+def make_statblocks():
+    """Basic monsters of CR 1 to 20, the second half with float stats, and the
+    first half again"""
+    builder = StatblockBuilder(seed=0)
+    statblocks = [builder.make_statblock_basic(cr) for cr in range(1, 21)]
+    # The int renderings are cached first, the floats must still differ
+    for sb in statblocks[10:]:
+        for name in FLOAT_STATS:
+            sb.attributes[name] = float(sb.attributes[name])
+    return statblocks + statblocks[:10]
+
+def main():
+    statblocks = make_statblocks()
+    table = StatblockTable.from_statblocks(statblocks)
+    renderer = CompactRenderer()
+    failed = False
+    for label, source in (('statblocks', statblocks), ('table', table)):
+        expected = '\n'.join(sb.format() for sb in source).split('\n')
+        lines = renderer.render(source).split('\n')
+        differ = [i for i, (a, b) in enumerate(zip(lines, expected)) if a != b]
+        if differ or len(lines) != len(expected):
+            print(f'FAIL: {label}: output differs from Statblock.format, '
+                  f'first at line {differ[0] if differ else min(len(lines), len(expected))}')
+            failed = True
+        else:
+            print(f'{label}: {len(source)} cards match Statblock.format')
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
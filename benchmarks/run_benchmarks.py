@@ -0,0 +1,299 @@
+"""Benchmark suite for the generation, optimization and formatting paths.
+
+Every benchmark runs a number of operations (the batch size) and reports the
+throughput of the median of several rounds, each the best of several repeats,
+the spread of the rounds as noise, and the memory allocated per operation,
+measured with tracemalloc in a separate run. Results are compared
+with a stored baseline; a benchmark whose throughput fell by more than the
+threshold is flagged, and the script exits with status 1.
+
+Only the standard library and the project's own dependencies are used, so the
+suite runs offline. Each timed run loops for at least 50 ms, and results are
+divided by the speed of a fixed calibration workload relative to the baseline,
+which evens out some of the difference between machines. Save a new baseline
+with --save after changing hardware.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py                  # compare with the baseline
+    python benchmarks/run_benchmarks.py --save           # store a new baseline
+    python benchmarks/run_benchmarks.py -k optimize --sizes 100 1000
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# pylint: disable=wrong-import-position
+import cr_curves
+from damage_types import DamageType
+from statblock import Statblock
+from statblock_builder import StatblockBuilder
+from statblock_renderer import CompactRenderer
+# pylint: enable=wrong-import-position
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_THRESHOLD = 0.4
+
+# Scalar builder methods the solvers call, with a typical argument
+CR_FROM_METHODS = (
+    ('cr_from_hp', 150), ('cr_from_ac', 15), ('cr_from_tohit', 7), ('cr_from_damage', 40),
+    ('cr_from_save_dc', 14), ('cr_from_strong_save', 6), ('cr_from_pb', 3),
+)
+FROM_CR_METHODS = (
+    'hp_from_cr', 'ac_from_cr', 'tohit_from_cr', 'damage_from_cr', 'save_dc_from_cr',
+    'strong_save_from_cr', 'weak_save_from_cr', 'pb_from_cr',
+)
+FROM_CR_CURVES = tuple(getattr(cr_curves, name) for name in FROM_CR_METHODS)
+# Largest batch size of the slow benchmarks
+MAX_SIZES = {'make_statblock_optimize_scipy': 100}
+
+#region benchmarks
+# Every benchmark takes the batch size n and returns a function that runs n
+# operations and returns their results, so the net allocations are the memory
+# the results keep. Setup work happens outside of the returned function.
+
+def bench_make_statblock_basic(n):
+    builder = StatblockBuilder(seed=0)
+    crs = np.random.default_rng(0).uniform(1, 20, n).tolist()
+    return lambda: [builder.make_statblock_basic(cr) for cr in crs]
+
+def _bench_optimize(n, stats, solver='closed_form'):
+    builder = StatblockBuilder(seed=0)
+    crs = np.random.default_rng(0).integers(1, 21, n).tolist()
+    return lambda: [
+        builder.make_statblock_optimize(cr, dict(stats), solver=solver) for cr in crs
+    ]
+
+def bench_make_statblock_optimize_0(n):
+    return _bench_optimize(n, {})
+
+def bench_make_statblock_optimize_1(n):
+    return _bench_optimize(n, {'ac': 16})
+
+def bench_make_statblock_optimize_3(n):
+    return _bench_optimize(n, {'ac': 16, 'hp': 120, 'tohit': 7})
+
+def bench_make_statblock_optimize_scipy(n):
+    return _bench_optimize(n, {'ac': 16}, solver='scipy')
+
+def bench_make_statblocks_basic(n):
+    builder = StatblockBuilder(seed=0)
+    crs = np.random.default_rng(0).uniform(1, 20, n)
+    return lambda: builder.make_statblocks_basic(crs)
+
+def bench_make_statblocks_optimize(n):
+    builder = StatblockBuilder(seed=0)
+    crs = np.random.default_rng(0).integers(1, 21, n)
+    return lambda: builder.make_statblocks_optimize(crs, {'ac': 16})
+
+def bench_make_attack(n):
+    builder = StatblockBuilder(seed=0)
+    targets = np.random.default_rng(0).uniform(3, 150, n).tolist()
+    return lambda: [
+        builder.make_attack('Slam', DamageType.BLUDGEONING, 7, damage) for damage in targets
+    ]
+
+def bench_cr_from_methods(n):
+    builder = StatblockBuilder(seed=0)
+    methods = [(getattr(builder, name), value) for name, value in CR_FROM_METHODS]
+    return lambda: [[method(value) for method, value in methods] for _ in range(n)]
+
+def bench_x_from_cr_methods(n):
+    builder = StatblockBuilder(seed=0)
+    methods = [getattr(builder, name) for name in FROM_CR_METHODS]
+    return lambda: [[method(7) for method in methods] for _ in range(n)]
+
+def bench_curves_array(n):
+    crs = np.random.default_rng(0).uniform(1, 20, n)
+    return lambda: [curve(crs) for curve in FROM_CR_CURVES]
+
+def bench_statblock_init(n):
+    builder = StatblockBuilder(seed=0)
+    sb = builder.make_statblock_basic(5)
+    stats = dict(sb.attributes)
+    stats['actions'] = sb.actions
+    stats['basic_attack'] = sb.basic_attack
+    return lambda: [Statblock(stats) for _ in range(n)]
+
+def bench_statblock_format(n):
+    builder = StatblockBuilder(seed=0)
+    statblocks = [builder.make_statblock_basic(cr) for cr in range(1, 21)]
+    statblocks = [statblocks[i % 20] for i in range(n)]
+    return lambda: [sb.format() for sb in statblocks]
+
+def bench_compact_renderer(n):
+    builder = StatblockBuilder(seed=0)
+    statblocks = [builder.make_statblock_basic(cr) for cr in range(1, 21)]
+    # Half of them with float ac, so both kinds of cached text are used. That
+    # the output matches Statblock.format is checked by check_renderer.py.
+    for sb in statblocks[10:]:
+        sb.attributes['ac'] = float(sb.attributes['ac'])
+    statblocks = [statblocks[i % 20] for i in range(n)]
+    renderer = CompactRenderer()
+    return lambda: renderer.render(statblocks)
+#endregion
+
+BENCHMARKS = {
+    name[len('bench_'):]: func for name, func in globals().items() if name.startswith('bench_')
+}
+
+def calibrate(repeats=5, rounds=5):
+    """Throughput of a fixed pure Python workload, to take out differences in
+    machine speed between a run and the baseline.
+
+    Returns:
+        float: Loops per second, the median of rounds best-of-repeats timings
+    """
+    def workload():
+        total = 0
+        for i in range(100000):
+            total += i % 7
+        return total
+    return 1 / _median_time(workload, repeats, rounds)[0]
+
+def _best_time(run, repeats, min_time=0.05):
+    # Runs are repeated in a loop that takes at least min_time, as timeit's
+    # autorange does, and the garbage collector is off while timing.
+    loops = 1
+    while True:
+        elapsed = _time_loops(run, loops)
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(repeats - 1):
+        best = min(best, _time_loops(run, loops))
+    return best / loops
+
+def _median_time(run, repeats, rounds):
+    # The best time of a round hides short hiccups, the median over rounds the
+    # slower phases of the machine. Also returns the spread of the rounds.
+    times = sorted(_best_time(run, repeats) for _ in range(rounds))
+    median = times[len(times) // 2]
+    return median, (times[-1] - times[0]) / median
+
+def _time_loops(run, loops):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+def measure(make, n, repeats, rounds=3):
+    """Median over rounds of the best time of several runs, and the allocations
+    of one more run.
+
+    Returns:
+        dict: ops_per_s, noise (spread of the rounds relative to their median),
+              peak_bytes_per_op (most memory in use at once during the run) and
+              net_bytes_per_op (memory still held by the results)
+    """
+    run = make(n)
+    run() # Warm up caches and lazy imports
+    best, noise = _median_time(run, repeats, rounds)
+
+    run = make(n)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = run()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {
+        'ops_per_s': n / best,
+        'noise': noise,
+        'peak_bytes_per_op': (peak - before) / n,
+        'net_bytes_per_op': (current - before) / n,
+    }
+
+def compare(results, baseline, threshold, speed=1.0):
+    """Names of the results whose throughput, divided by the relative machine
+    speed, fell by more than threshold"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old and result['ops_per_s'] / speed < old['ops_per_s'] * (1 - threshold):
+            regressions.append(key)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Batch sizes. Defaults to 100 1000 10000.')
+    parser.add_argument('-k', '--filter', default='',
+                        help='Only run benchmarks whose name contains this text.')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='Timed runs per round, the best one counts.')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Rounds per benchmark, the median one counts.')
+    parser.add_argument('--baseline', default=BASELINE, help='Baseline file.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed drop in throughput, 0.4 is 40%%, about twice the '
+                             'drift measured between runs.')
+    parser.add_argument('--save', action='store_true',
+                        help='Store the results as the new baseline.')
+    args = parser.parse_args(argv)
+
+    baseline, base_calibration = {}, None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            data = json.load(f)
+        baseline, base_calibration = data['results'], data['machine']['calibration']
+
+    calibration = calibrate(args.repeats)
+    speed = calibration / base_calibration if base_calibration and not args.save else 1.0
+    print(f'Machine speed relative to the baseline: {speed:.2f}')
+
+    results = {}
+    print(f'{"benchmark":<32}{"n":>7}{"ops/s":>14}{"noise":>7}{"vs base":>9}'
+          f'{"peak B/op":>11}{"net B/op":>10}')
+    for name, make in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        for n in args.sizes:
+            key = f'{name}[{n}]'
+            if n > MAX_SIZES.get(name, n):
+                continue
+            result = results[key] = measure(make, n, args.repeats, args.rounds)
+            old = baseline.get(key)
+            change = f'{result["ops_per_s"] / speed / old["ops_per_s"] - 1:+.0%}' if old else '-'
+            print(f'{name:<32}{n:>7}{result["ops_per_s"]:>14,.0f}{result["noise"]:>7.0%}'
+                  f'{change:>9}'
+                  f'{result["peak_bytes_per_op"]:>11,.0f}{result["net_bytes_per_op"]:>10,.0f}')
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'machine': {
+                    'platform': platform.platform(),
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'calibration': calibration,
+                },
+                'results': dict(sorted(baseline.items())),
+            }, f, indent=1)
+        print(f'Saved baseline to {args.baseline}')
+        return 0
+
+    regressions = compare(results, baseline, args.threshold, speed)
+    for key in regressions:
+        print(f'REGRESSION: {key} is more than {args.threshold:.0%} slower than the baseline')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
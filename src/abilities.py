@@ -1,12 +1,18 @@
+from damage_distribution import attack_distribution
+
 class Ability:
     """Base class for all abilities
     """
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
 class Attack(Ability):
     """Class to hold an attack ability
     """
+    __slots__ = ('tohit', 'n_dice', 'die_size', 'modifier', 'damage_type', 'n_attacks')
+
     def __init__(self, name, tohit, n_dice, die_size, modifier, damage_type, n_attacks=1):
         super().__init__(name)
 
@@ -18,4 +24,17 @@ class Attack(Ability):
         self.n_attacks = n_attacks
 
     def get_avg_damage(self):
-        return self.n_attacks * (self.n_dice * (self.die_size/2 + 0.5) + self.modifier)
\ No newline at end of file
+        return self.n_attacks * (self.n_dice * (self.die_size/2 + 0.5) + self.modifier)
+
+    def get_damage_distribution(self, ac=None):
+        """Exact distribution of the damage per round, see
+        damage_distribution.attack_distribution.
+
+        Args:
+            ac (int, optional): Armor class of the target. Defaults to None, i.e.
+                                every attack hits.
+
+        Returns:
+            DamageDistribution: Damage per round
+        """
+        return attack_distribution(self, ac)
@@ -0,0 +1,184 @@
+"""Contains the AttackIndex class
+"""
+import math
+from bisect import bisect_left
+
+import numpy as np
+
+class AttackIndex():
+    """Sorted index of all legal attacks, to find the attack that best fits a
+    damage target.
+
+    Every combination of number of attacks, number of dice, die size and modifier
+    within the limits is listed once, sorted by average damage. Among attacks with
+    the same average the ones with fewer attacks, then a smaller modifier, come
+    first. A lookup is a binary search, and a batch of targets is resolved with a
+    single searchsorted call per number of attacks.
+
+    Like make_attack, the damage is only split into several attacks if a single
+    attack cannot reach it, unless the number of attacks is given.
+
+    Constrained lookups (fixed die size, fixed number of attacks, lower max
+    modifier) use sub-indices that are built on first use and kept.
+
+    Example:
+        index = AttackIndex()
+        n_attacks, n_dice, die_size, modifier = index.lookup(27, die_size=8)
+    """
+    fields = ('n_attacks', 'n_dice', 'die_size', 'modifier')
+
+    def __init__(self, die_sizes=(4, 6, 8, 12), max_attacks=6, max_dice=8, max_modifier=5):
+        """
+        Args:
+            die_sizes (tuple, optional): Allowed die sizes. Defaults to (4, 6, 8, 12).
+            max_attacks (int, optional): Most attacks per action. Defaults to 6.
+            max_dice (int, optional): Most dice per attack. Defaults to 8.
+            max_modifier (int, optional): Largest damage modifier, the smallest is 0.
+                                          Defaults to 5.
+        """
+        self.die_sizes = tuple(die_sizes)
+        self.max_attacks = max_attacks
+        self.max_dice = max_dice
+        self.max_modifier = max_modifier
+
+        grids = np.meshgrid(
+            np.arange(1, max_attacks + 1),
+            np.arange(1, max_dice + 1),
+            np.array(self.die_sizes),
+            np.arange(0, max_modifier + 1),
+            indexing='ij',
+        )
+        self.combinations = {name: g.ravel() for name, g in zip(self.fields, grids)}
+        self._sub_indices = {}
+
+    def __len__(self):
+        return len(self.combinations['n_attacks'])
+
+    @staticmethod
+    def average_damage(n_attacks, n_dice, die_size, modifier):
+        """Average damage of an attack when it hits, as in Attack.get_avg_damage.
+        Works on scalars and arrays.
+        """
+        return n_attacks * (n_dice * (die_size//2 + 0.5) + modifier)
+
+    def lookup(self, damage_target, die_size=None, n_attacks=None, max_modifier=None):
+        """Finds the attack whose average damage is closest to damage_target.
+
+        Args:
+            damage_target (float): Desired average damage.
+            die_size (int, optional): Required die size. Defaults to None.
+            n_attacks (int, optional): Required number of attacks. Defaults to None.
+            max_modifier (int, optional): Largest allowed modifier. Defaults to None,
+                                          the limit of the index.
+
+        Returns:
+            tuple: (n_attacks, n_dice, die_size, modifier)
+        """
+        if n_attacks is None:
+            n_attacks = self.fewest_attacks(damage_target, die_size, max_modifier)
+        sub = self._sub_index(die_size, n_attacks, max_modifier)
+        damage = sub['damage_list']
+        i = bisect_left(damage, damage_target)
+        i = self._closer(i, damage_target, damage, sub['group_start_list'])
+        return sub['rows_list'][i]
+
+    def lookup_batch(self, damage_target, die_size=None, n_attacks=None, max_modifier=None):
+        """Vectorized lookup of many damage targets with the same constraints.
+
+        Args:
+            damage_target (ndarray): Desired average damages.
+            die_size (int, optional): Required die size. Defaults to None.
+            n_attacks (int, optional): Required number of attacks. Defaults to None.
+            max_modifier (int, optional): Largest allowed modifier. Defaults to None.
+
+        Returns:
+            dict: {field: ndarray} for the fields n_attacks, n_dice, die_size
+                  and modifier.
+        """
+        target = np.asarray(damage_target, dtype=float)
+        if n_attacks is not None:
+            return self._lookup_sorted(self._sub_index(die_size, n_attacks, max_modifier), target)
+
+        n_attacks = self.fewest_attacks(target, die_size, max_modifier)
+        found = {name: np.empty(target.shape, dtype=np.int64) for name in self.fields}
+        for n in np.unique(n_attacks).tolist():
+            rows = n_attacks == n
+            group = self._lookup_sorted(self._sub_index(die_size, n, max_modifier), target[rows])
+            for name, values in group.items():
+                found[name][rows] = values
+        return found
+
+    def fewest_attacks(self, damage_target, die_size=None, max_modifier=None):
+        """Smallest number of attacks that can reach damage_target.
+
+        Args:
+            damage_target (float or ndarray): Desired average damage.
+            die_size (int, optional): Die size. Defaults to None, the largest one.
+            max_modifier (int, optional): Largest allowed modifier. Defaults to None.
+
+        Returns:
+            int or ndarray: Number of attacks, at most max_attacks.
+        """
+        die_size = max(self.die_sizes) if die_size is None else die_size
+        max_modifier = self.max_modifier if max_modifier is None else min(max_modifier, self.max_modifier)
+        per_attack = self.average_damage(1, self.max_dice, die_size, max_modifier)
+        if np.ndim(damage_target) == 0:
+            return min(max(math.ceil(damage_target / per_attack), 1), self.max_attacks)
+        n_attacks = np.clip(np.ceil(np.asarray(damage_target) / per_attack), 1, self.max_attacks)
+        return n_attacks.astype(np.int64)
+
+    def _lookup_sorted(self, sub, target):
+        damage = sub['damage']
+        i = np.searchsorted(damage, target)
+        upper = np.minimum(i, len(damage) - 1)
+        lower = sub['group_start'][np.maximum(i - 1, 0)]
+        # Ties go to the lower group, whose first entry is the preferred attack
+        use_lower = (i > 0) & (target - damage[lower] <= damage[upper] - target)
+        use_lower |= i >= len(damage)
+        best = np.where(use_lower, lower, upper)
+        return {name: sub[name][best] for name in self.fields}
+
+    def _closer(self, i, target, damage, group_start):
+        if i >= len(damage):
+            return group_start[-1]
+        if i == 0:
+            return 0
+        lower = group_start[i - 1]
+        if target - damage[lower] <= damage[i] - target:
+            return lower
+        return i
+
+    def _sub_index(self, die_size, n_attacks, max_modifier):
+        key = (die_size, n_attacks, max_modifier)
+        if key in self._sub_indices:
+            return self._sub_indices[key]
+
+        combinations = self.combinations
+        mask = np.ones(len(self), dtype=bool)
+        if die_size is not None:
+            mask &= combinations['die_size'] == die_size
+        if n_attacks is not None:
+            mask &= combinations['n_attacks'] == n_attacks
+        if max_modifier is not None:
+            mask &= combinations['modifier'] <= max_modifier
+        if not mask.any():
+            raise ValueError(f'No attack in the index with die size {die_size}, '
+                             f'{n_attacks} attacks and modifier <= {max_modifier}')
+
+        columns = {name: col[mask] for name, col in combinations.items()}
+        damage = self.average_damage(*(columns[name] for name in self.fields))
+        order = np.lexsort((columns['modifier'], columns['n_attacks'], damage))
+        sub = {name: col[order] for name, col in columns.items()}
+        sub['damage'] = damage[order]
+
+        # Index of the first entry with the same damage, for every entry
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = sub['damage'][1:] != sub['damage'][:-1]
+        sub['group_start'] = np.maximum.accumulate(np.where(new_group, np.arange(len(order)), 0))
+
+        # Lists for the scalar lookup, which is faster on plain Python objects
+        sub['damage_list'] = sub['damage'].tolist()
+        sub['group_start_list'] = sub['group_start'].tolist()
+        sub['rows_list'] = list(zip(*(sub[name].tolist() for name in self.fields)))
+        self._sub_indices[key] = sub
+        return sub
@@ -0,0 +1,101 @@
+"""Contains the BestiaryGenerator class
+"""
+from concurrent.futures import ProcessPoolExecutor
+import math
+
+import numpy as np
+
+from statblock_builder import StatblockBuilder
+from statblock_table import StatblockTable
+
+class BestiaryGenerator():
+    """Generates large numbers of monsters in parallel.
+
+    The request is cut into shards of a fixed size, and every shard gets its own
+    builder seeded from a child of one SeedSequence. Since neither the shards nor
+    their seeds depend on the number of workers, the output is the same no matter
+    how many processes are used. Workers send back the columns of a
+    StatblockTable instead of pickled Statblock objects.
+    """
+    methods = ('basic', 'optimize')
+
+    def __init__(self, seed=None, workers=None, shard_size=10000, method='basic',
+                 solver='closed_form'):
+        """
+        Args:
+            seed (int, optional):       Seed of the whole run. Defaults to None.
+            workers (int, optional):    Number of worker processes. 1 runs
+                                        everything in this process. Defaults to
+                                        None, i.e. the number of CPUs.
+            shard_size (int, optional): Number of monsters per shard. Defaults
+                                        to 10000.
+            method (str, optional):     'basic' for make_statblocks_basic or
+                                        'optimize' for make_statblock_optimize.
+                                        Defaults to 'basic'.
+            solver (str, optional):     Solver used by 'optimize'. 'closed_form'
+                                        is solved in one batch per shard, other
+                                        solvers one monster at a time.
+                                        Defaults to 'closed_form'.
+        """
+        if method not in self.methods:
+            raise ValueError(f'Unknown method {method}')
+        if shard_size < 1:
+            raise ValueError('shard_size must be at least 1')
+        self.seed = seed
+        self.workers = workers
+        self.shard_size = shard_size
+        self.method = method
+        self.solver = solver
+
+    def generate(self, crs, stats: dict = None):
+        """Generates one monster per entry of crs.
+
+        Args:
+            crs (array_like): Challenge ratings of the monsters.
+            stats (dict, optional): Locked stats, either a scalar for every
+                                    monster or an array with one entry per
+                                    monster, where NaN leaves that monster free.
+
+        Returns:
+            StatblockTable: The monsters, in the order of crs.
+        """
+        crs = np.asarray(crs, dtype=float)
+        n = len(crs)
+        stats = {
+            name: np.array(np.broadcast_to(np.asarray(value, dtype=float), (n,)))
+            for name, value in (stats or {}).items()
+        }
+
+        n_shards = max(math.ceil(n / self.shard_size), 1)
+        seeds = np.random.SeedSequence(self.seed).spawn(n_shards)
+        shards = []
+        for k, seed in enumerate(seeds):
+            rows = slice(k * self.shard_size, (k + 1) * self.shard_size)
+            shard_stats = {name: value[rows] for name, value in stats.items()}
+            shards.append((self.method, self.solver, seed, crs[rows], shard_stats))
+
+        if self.workers == 1 or n_shards == 1:
+            results = [_generate_shard(shard) for shard in shards]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(_generate_shard, shards))
+
+        return StatblockTable.concatenate(StatblockTable(columns) for columns in results)
+
+def _generate_shard(shard):
+    method, solver, seed, crs, stats = shard
+    builder = StatblockBuilder(seed=seed)
+
+    if method == 'basic':
+        table = builder.make_statblocks_basic(crs, stats)
+    elif solver == 'closed_form':
+        table = builder.make_statblocks_optimize(crs, stats)
+    else:
+        statblocks = []
+        for i, cr in enumerate(crs):
+            row_stats = {
+                name: value[i].item() for name, value in stats.items() if not np.isnan(value[i])
+            }
+            statblocks.append(builder.make_statblock_optimize(cr.item(), row_stats, solver=solver))
+        table = StatblockTable.from_statblocks(statblocks)
+    return table.columns
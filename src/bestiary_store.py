@@ -0,0 +1,305 @@
+"""Binary file format for saving and loading many monsters.
+
+A bestiary file holds one fixed-width record per monster, followed by a string
+table. The layout is:
+
+    8 bytes   magic b'SBWBEST1'
+    4 bytes   little endian length of the JSON header
+    header    JSON with the record dtype, number of records and offsets
+    padding   up to a multiple of 8 bytes
+    records   n_records fixed-width records
+    padding   up to a multiple of 8 bytes
+    offsets   n_strings + 1 little endian uint64, where each string starts in the data
+    strings   all strings UTF-8 encoded back to back, referenced by index from the records
+
+Numeric attributes are stored as int64 if they are integer arrays in the table,
+i.e. every monster has them as ints, as float64 with NaN for missing values
+otherwise. Attack names and
+str_attributes are indices into the string table, -1 if not set.
+
+Loading memory-maps the records and the string table, so opening a file takes the
+same time for any number of monsters, and only the records and strings that are
+accessed are read from disk.
+"""
+import json
+import struct
+
+import numpy as np
+
+from abilities import Attack
+from statblock import Statblock
+from statblock_table import StatblockTable
+
+MAGIC = b'SBWBEST1'
+_LENGTH = struct.Struct('<I')
+_ALIGNMENT = 8
+
+# Basic attack fields, all stored as int32
+_ATTACK_FIELDS = StatblockTable.attack_columns
+
+def save_bestiary(path, statblocks, str_attributes=None, chunk_size=65536):
+    """Writes monsters to a bestiary file.
+
+    Args:
+        path (str): File to write.
+        statblocks (list or StatblockTable): The monsters.
+        str_attributes (list, optional): A dict per monster with values for the
+                            names in Statblock.str_attributes, e.g. {'Name': 'Ogre'}.
+                            Defaults to None.
+        chunk_size (int, optional): Records converted and written at a time.
+                            Defaults to 65536.
+    """
+    if isinstance(statblocks, StatblockTable):
+        table = statblocks
+        attack_names = table.attack_name_column()
+    else:
+        statblocks = list(statblocks)
+        table = StatblockTable.from_statblocks(statblocks)
+        attack_names = [
+            sb.get_basic_attack().name if sb.get_basic_attack() else None
+            for sb in statblocks
+        ]
+    n = len(table)
+    if str_attributes is not None and len(str_attributes) != n:
+        raise ValueError('str_attributes must have one entry per monster')
+
+    strings, string_index = [], {}
+    def intern(s):
+        if s is None:
+            return -1
+        if s not in string_index:
+            string_index[s] = len(strings)
+            strings.append(s)
+        return string_index[s]
+
+    fields, num_names = [], []
+    for name in Statblock.num_attributes:
+        if name not in table.names:
+            continue
+        is_int = np.issubdtype(table[name].dtype, np.integer)
+        fields.append((name, '<i8' if is_int else '<f8'))
+        num_names.append(name)
+    has_attack = all(name in table.names for name in _ATTACK_FIELDS)
+    if has_attack:
+        fields += [(name, '<i4') for name in _ATTACK_FIELDS]
+        fields += [('damage_type', 'i1'), ('attack_name', '<i4')]
+    fields += [(name, '<i4') for name in Statblock.str_attributes]
+    dtype = np.dtype(fields)
+
+    # Interned once per distinct name, then looked up per row
+    codes = {name: intern(name) for name in dict.fromkeys(attack_names)}
+    attack_codes = np.array(list(map(codes.__getitem__, attack_names)), dtype=np.int32)
+    str_codes = {}
+    for name in Statblock.str_attributes:
+        if str_attributes is None:
+            str_codes[name] = np.full(n, -1, dtype=np.int32)
+        else:
+            str_codes[name] = np.array(
+                [intern((attrs or {}).get(name)) for attrs in str_attributes], dtype=np.int32)
+
+    header = {
+        'version': 1,
+        'n_records': n,
+        'n_strings': len(strings),
+        'dtype': [[name, fmt] for name, fmt in fields],
+        'attack_name': table.attack_name,
+    }
+    # The header is padded so the records start at an aligned offset
+    with open(path, 'wb') as f:
+        records_offset = _records_offset(header)
+        header['records_offset'] = records_offset
+        records_end = records_offset + n * dtype.itemsize
+        header['strings_offset'] = -(-records_end // _ALIGNMENT) * _ALIGNMENT
+        header_bytes = json.dumps(header).encode('utf-8')
+        header_bytes += b' ' * (records_offset - len(MAGIC) - _LENGTH.size - len(header_bytes))
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header_bytes)))
+        f.write(header_bytes)
+
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            chunk = np.zeros(stop - start, dtype=dtype)
+            for name in num_names:
+                chunk[name] = table[name][start:stop]
+            if has_attack:
+                for name in _ATTACK_FIELDS:
+                    chunk[name] = table[name][start:stop]
+                chunk['damage_type'] = table['damage_type'][start:stop]
+                chunk['attack_name'] = attack_codes[start:stop]
+            for name, codes in str_codes.items():
+                chunk[name] = codes[start:stop]
+            chunk.tofile(f)
+
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        f.write(b'\0' * (header['strings_offset'] - records_end))
+        offsets.tofile(f)
+        f.write(b''.join(encoded))
+
+def _records_offset(header):
+    # Room for the header with both offsets filled in, rounded up to the alignment
+    provisional = dict(header, records_offset=2**62, strings_offset=2**62)
+    length = len(MAGIC) + _LENGTH.size + len(json.dumps(provisional).encode('utf-8'))
+    return -(-length // _ALIGNMENT) * _ALIGNMENT
+
+class BestiaryStore():
+    """Read access to a bestiary file written by save_bestiary.
+
+    The records are memory-mapped. Indexing with an int decodes a single record
+    into a Statblock, and table gives a StatblockTable whose columns are views of
+    the mapped file, so filters and aggregates only read the columns they use.
+
+    Example:
+        with BestiaryStore('monsters.sbw') as store:
+            ogre = store[41]
+            strong = store.table.where(cr=(10, None))
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): File written by save_bestiary.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a bestiary file')
+            (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+            self.header = json.loads(f.read(length).decode('utf-8'))
+
+        self.dtype = np.dtype([tuple(field) for field in self.header['dtype']])
+        n = self.header['n_records']
+        if n:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r',
+                                     offset=self.header['records_offset'], shape=(n,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+        self.strings = _StringTable(path, self.header['strings_offset'],
+                                    self.header['n_strings'])
+        self._table = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return self.get_statblock(i)
+        return self.table[i]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_statblock(i)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Releases the mapping of the store. The file is unmapped once tables
+        and arrays taken from the store are no longer referenced either."""
+        self._table = None
+        self.records = np.zeros(0, dtype=self.dtype)
+        self.strings = _StringTable(None, 0, 0)
+
+    @property
+    def table(self):
+        """StatblockTable over the mapped records"""
+        if self._table is None:
+            names = self.dtype.names
+            columns = {
+                name: self.records[name] for name in names
+                if name in Statblock.attribute_index or name in _ATTACK_FIELDS
+                or name == 'damage_type'
+            }
+            self._table = StatblockTable(columns, attack_name=self.header['attack_name'],
+                                         attack_names=self._attack_names())
+        return self._table
+
+    def _attack_names(self):
+        # Per-row names, only when the monsters do not all use the header name
+        if 'attack_name' not in self.dtype.names:
+            return None
+        codes, inverse = np.unique(self.records['attack_name'], return_inverse=True)
+        names = [self.strings[code] if code >= 0 else self.header['attack_name']
+                 for code in codes.tolist()]
+        if all(name == self.header['attack_name'] for name in names):
+            return None
+        return np.array(names, dtype=object)[inverse]
+
+    def get_statblock(self, i):
+        """Decodes one record.
+
+        Args:
+            i (int): Record index
+
+        Returns:
+            Statblock: The monster
+        """
+        record = self.records[i]
+        names = self.dtype.names
+        stats = {}
+        for name in names:
+            if name in Statblock.attribute_index:
+                value = record[name].item()
+                # NaN marks an attribute missing from this monster
+                if value == value:
+                    stats[name] = value
+        if 'attack_name' in names:
+            code = int(record['attack_name'])
+            attack = Attack(
+                self.strings[code] if code >= 0 else self.header['attack_name'],
+                int(record['tohit']),
+                int(record['n_dice']),
+                int(record['die_size']),
+                int(record['modifier']),
+                StatblockTable.damage_types[record['damage_type']],
+                int(record['n_attacks']),
+            )
+            stats['actions'] = [attack]
+            stats['basic_attack'] = attack
+        return Statblock(stats)
+
+    def get_str_attributes(self, i):
+        """The str_attributes of one monster.
+
+        Args:
+            i (int): Record index
+
+        Returns:
+            dict: {name: value} for the str_attributes that are set.
+        """
+        record = self.records[i]
+        return {
+            name: self.strings[int(record[name])]
+            for name in Statblock.str_attributes if int(record[name]) >= 0
+        }
+
+class _StringTable():
+    """The string table of a bestiary file. Offsets and data are memory-mapped, a
+    string is only decoded when it is looked up."""
+
+    def __init__(self, path, offset, n_strings):
+        if not n_strings:
+            self.offsets = np.zeros(1, dtype='<u8')
+            self.data = np.zeros(0, dtype=np.uint8)
+            return
+        self.offsets = np.memmap(path, dtype='<u8', mode='r', offset=offset,
+                                 shape=(n_strings + 1,))
+        size = int(self.offsets[-1])
+        data_offset = offset + self.offsets.nbytes
+        # A memmap cannot be empty, e.g. when every string is ''
+        self.data = np.memmap(path, dtype=np.uint8, mode='r', offset=data_offset,
+                              shape=(size,)) if size else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError('string index out of range')
+        i %= len(self)
+        start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.data[start:stop].tobytes().decode('utf-8')
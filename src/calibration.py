@@ -0,0 +1,314 @@
+"""Refits the coefficients of the CR curves from monster data.
+
+Every curve piece in cr_coefficients.DEFAULT_COEFFICIENTS is linear in its
+coefficients, so it is fitted by least squares from sufficient statistics: the
+sums X'X, X'y and y'y of its design matrix X and target y. These are added up
+chunk by chunk while the data streams past, so memory does not depend on the
+size of the data, and statistics of different files or processes can be merged.
+The statistics are saved in the coefficient table, so new data can be added to
+a calibration later without reading the old data again.
+
+The pieces and the rows they are fitted on:
+
+    defensive_cr        cr ~ 1 + hp_max*(1 + vri_score/100) + ac
+    cr_from_pb          cr ~ 1 + pb
+    cr_from_hp          cr ~ 1 + hp_max
+    cr_from_ac          cr ~ 1 + ac                 ac above 12
+    cr_from_tohit       cr ~ 1 + tohit              tohit from 5
+    cr_from_tohit_low   log(cr) ~ 1 + tohit         tohit below 5, cr above 0
+    cr_from_damage      cr ~ 1 + damage             damage from 10
+    cr_from_damage_low  log(cr) ~ 1 + damage        damage below 10, cr above 0
+
+A piece with fewer than min_rows rows, or with a slope that is not positive and
+so cannot be inverted, keeps its previous coefficients.
+
+Example:
+    python calibration.py monsters.csv more_monsters.jsonl -o coefficients.json
+    python calibration.py new_monsters.csv --update coefficients.json -o coefficients.json
+    python cli.py --coefficients coefficients.json --cr 5
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import cr_audit
+from cr_coefficients import CoefficientTable, DEFAULT_COEFFICIENTS, TOHIT_BREAKPOINT, \
+    DAMAGE_BREAKPOINT, AC_BREAKPOINT
+
+FIT_FIELDS = ('cr', 'hp_max', 'ac', 'tohit', 'damage', 'pb', 'vri_score')
+# cr_audit.DEFAULT_FIELD_MAP plus the fields only the fit uses
+FIT_FIELD_MAP = dict(cr_audit.DEFAULT_FIELD_MAP, pb='pb', proficiency_bonus='pb')
+
+class LeastSquares():
+    """Sufficient statistics of a linear least squares problem y ~ X b."""
+
+    def __init__(self, n_features):
+        """
+        Args:
+            n_features (int): Number of columns of X
+        """
+        self.n = 0
+        self.xtx = np.zeros((n_features, n_features))
+        self.xty = np.zeros(n_features)
+        self.yty = 0.0
+
+    def __iadd__(self, other):
+        self.n += other.n
+        self.xtx += other.xtx
+        self.xty += other.xty
+        self.yty += other.yty
+        return self
+
+    def update(self, x, y):
+        """Adds rows.
+
+        Args:
+            x (ndarray): Array of shape (rows, n_features)
+            y (ndarray): Targets, one per row
+        """
+        self.n += len(y)
+        self.xtx += x.T @ x
+        self.xty += x.T @ y
+        self.yty += float(y @ y)
+
+    def solve(self):
+        """Least squares coefficients of the rows added so far.
+
+        Returns:
+            ndarray: Coefficients b
+        """
+        return np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+
+    def diagnostics(self, b):
+        """Fit quality of coefficients b.
+
+        Args:
+            b (ndarray): Coefficients
+
+        Returns:
+            dict: rows, residual_std and r_squared
+        """
+        sse = max(self.yty - 2*b @ self.xty + b @ self.xtx @ b, 0.0)
+        # The first column is the intercept, so xty[0] is the sum of y
+        sst = self.yty - self.xty[0]**2/self.n if self.n else 0.0
+        dof = self.n - len(b)
+        return {
+            'rows': self.n,
+            'residual_std': float(np.sqrt(sse/dof)) if dof > 0 else None,
+            'r_squared': float(1 - sse/sst) if sst > 0 else None,
+        }
+
+    def to_dict(self):
+        """The statistics as JSON friendly dict."""
+        return {'n': self.n, 'xtx': self.xtx.tolist(), 'xty': self.xty.tolist(), 'yty': self.yty}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Reads statistics written by to_dict.
+
+        Args:
+            data (dict): Statistics
+
+        Returns:
+            LeastSquares: The statistics
+        """
+        stats = cls(len(data['xty']))
+        stats.n = data['n']
+        stats.xtx = np.array(data['xtx'], dtype=float)
+        stats.xty = np.array(data['xty'], dtype=float)
+        stats.yty = float(data['yty'])
+        return stats
+
+def design_matrices(columns):
+    """The rows of every curve piece in a chunk of monsters.
+
+    Args:
+        columns (dict): Float arrays keyed by FIT_FIELDS, NaN for missing values.
+                        Missing fields are treated as all NaN.
+
+    Yields:
+        tuple: (name, x, y) for the pieces with rows in the chunk
+    """
+    n = len(columns['cr'])
+    col = {field: columns.get(field, np.full(n, np.nan)) for field in FIT_FIELDS}
+    cr = col['cr']
+    has_cr = ~np.isnan(cr)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_cr = np.log(cr)
+
+    hp = col['hp_max'] * (1 + np.nan_to_num(col['vri_score'])/100)
+    rows = has_cr & ~np.isnan(hp) & ~np.isnan(col['ac'])
+    x = np.column_stack([np.ones(rows.sum()), hp[rows], col['ac'][rows]])
+    yield 'defensive_cr', x, cr[rows]
+
+    pieces = (
+        ('cr_from_pb', 'pb', cr, None),
+        ('cr_from_hp', 'hp_max', cr, None),
+        ('cr_from_ac', 'ac', cr, col['ac'] > AC_BREAKPOINT),
+        ('cr_from_tohit', 'tohit', cr, col['tohit'] >= TOHIT_BREAKPOINT),
+        ('cr_from_tohit_low', 'tohit', log_cr, (col['tohit'] < TOHIT_BREAKPOINT) & (cr > 0)),
+        ('cr_from_damage', 'damage', cr, col['damage'] >= DAMAGE_BREAKPOINT),
+        ('cr_from_damage_low', 'damage', log_cr, (col['damage'] < DAMAGE_BREAKPOINT) & (cr > 0)),
+    )
+    for name, field, y, piece in pieces:
+        rows = has_cr & ~np.isnan(col[field])
+        if piece is not None:
+            rows &= piece
+        yield name, np.column_stack([np.ones(rows.sum()), col[field][rows]]), y[rows]
+
+class Calibrator():
+    """Accumulates monster data and fits a CoefficientTable.
+
+    Example:
+        calibrator = Calibrator()
+        with open('monsters.csv') as f:
+            calibrator.update_stream(f)
+        calibrator.fit().save('coefficients.json')
+    """
+
+    def __init__(self, table=None, field_map=None):
+        """
+        Args:
+            table (CoefficientTable, optional): Earlier calibration to add data to.
+                            Its statistics are the starting point, and its
+                            coefficients are kept for pieces without enough data.
+                            Defaults to None, i.e. start from the built-in ones.
+            field_map (dict, optional): Extra {input field: field} entries for
+                            update_stream, added to FIT_FIELD_MAP.
+                            Defaults to None.
+        """
+        self.table = CoefficientTable() if table is None else table
+        self.rows = self.table.rows
+        self.statistics = {}
+        for name, coefficients in DEFAULT_COEFFICIENTS.items():
+            if name in self.table.statistics:
+                self.statistics[name] = LeastSquares.from_dict(self.table.statistics[name])
+            else:
+                self.statistics[name] = LeastSquares(len(coefficients))
+        self.field_map = dict(FIT_FIELD_MAP)
+        for name, field in (field_map or {}).items():
+            if field not in FIT_FIELDS:
+                raise ValueError(f'Unknown field {field}')
+            self.field_map[name.lower()] = field
+
+    def update(self, columns):
+        """Adds a chunk of monsters.
+
+        Args:
+            columns (dict): Arrays keyed by FIT_FIELDS, NaN for missing values.
+                            'cr' is required.
+        """
+        columns = {name: np.asarray(values, dtype=float) for name, values in columns.items()}
+        for name, x, y in design_matrices(columns):
+            if len(y):
+                self.statistics[name].update(x, y)
+        self.rows += len(columns['cr'])
+
+    def update_stream(self, stream, fmt=None, chunk_size=50000):
+        """Adds every monster of a CSV, JSON lines or JSON array stream.
+
+        Args:
+            stream (file-like): Text stream, see cr_audit.read_chunks.
+            fmt (str, optional): Input format. Defaults to None, i.e. guessed.
+            chunk_size (int, optional): Records per chunk. Defaults to 50000.
+        """
+        for names, records in cr_audit.read_chunks(stream, fmt, chunk_size):
+            columns = cr_audit.map_columns(names, records, self.field_map, FIT_FIELDS)
+            if 'cr' not in columns:
+                raise ValueError('No input field for cr, pass a field_map')
+            self.update(columns)
+
+    def merge(self, other):
+        """Adds the data of another calibrator, e.g. one that read another file
+        in another process.
+
+        Args:
+            other (Calibrator): The other calibrator
+        """
+        for name, stats in other.statistics.items():
+            self.statistics[name] += stats
+        self.rows += other.rows
+
+    def fit(self, min_rows=30):
+        """Solves every piece.
+
+        Args:
+            min_rows (int, optional): Fewest rows a piece is fitted on. Defaults to 30.
+
+        Returns:
+            CoefficientTable: New table, one version above the starting table.
+        """
+        coefficients, fits = {}, {}
+        for name, stats in self.statistics.items():
+            coefficients[name] = self.table[name]
+            fits[name] = {'rows': stats.n, 'fitted': False}
+            if stats.n < max(min_rows, len(stats.xty) + 1):
+                continue
+            b = stats.solve()
+            if not np.isfinite(b).all() or (b[1:] <= 0).any():
+                fits[name]['reason'] = 'coefficients not positive'
+                continue
+            coefficients[name] = tuple(b.tolist())
+            fits[name] = dict(stats.diagnostics(b), fitted=True)
+        return CoefficientTable(
+            coefficients,
+            version=self.table.version + 1,
+            statistics={name: stats.to_dict() for name, stats in self.statistics.items()},
+            fits=fits,
+            rows=self.rows,
+        )
+
+def main(argv=None):
+    """Runs a calibration from the command line.
+
+    Args:
+        argv (list, optional): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: Exit code
+    """
+    parser = argparse.ArgumentParser(description='Refit the CR curves from monster data.')
+    parser.add_argument('inputs', nargs='+', help='CSV, JSON lines or JSON files, - for stdin.')
+    parser.add_argument('--output', '-o', required=True, help='Coefficient table to write.')
+    parser.add_argument('--update', default=None,
+                        help='Coefficient table whose data the inputs are added to.')
+    parser.add_argument('--format', choices=('csv', 'jsonl', 'json'), default=None,
+                        help='Input format. Defaults to a guess from the content.')
+    parser.add_argument('--map', action='append', metavar='FIELD=NAME',
+                        help='Map an input field, e.g. --map challenge=cr. Repeatable.')
+    parser.add_argument('--min-rows', type=int, default=30,
+                        help='Fewest rows a curve is fitted on. Defaults to 30.')
+    args = parser.parse_args(argv)
+
+    field_map = {}
+    for item in args.map or ():
+        name, sep, field = item.partition('=')
+        if not sep:
+            parser.error(f'Invalid mapping {item!r}, expected FIELD=NAME')
+        field_map[name.strip()] = field.strip()
+    try:
+        table = CoefficientTable.load(args.update) if args.update else None
+        calibrator = Calibrator(table, field_map)
+        for path in args.inputs:
+            if path == '-':
+                calibrator.update_stream(sys.stdin, args.format)
+                continue
+            with open(path, encoding='utf-8', newline='') as f:
+                calibrator.update_stream(f, args.format)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    table = calibrator.fit(args.min_rows)
+    table.save(args.output)
+    print(json.dumps({
+        'version': table.version,
+        'rows': table.rows,
+        'coefficients': table.coefficients,
+        'fits': table.fits,
+    }, indent=1))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Command line entry point that streams generated statblocks.
+
+Examples:
+    python cli.py --cr 5 --count 3
+    python cli.py --cr 1-20 --count 10000000 --format jsonl --lock ac=15 > monsters.jsonl
+    python cli.py --cr 0.5-4 --format csv | head
+"""
+import argparse
+import os
+import sys
+
+from statblock_builder import StatblockBuilder
+import statblock_stream
+
+def make_parser():
+    """Makes the argument parser.
+
+    Returns:
+        ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(description='Stream generated statblocks.')
+    parser.add_argument('--cr', default='1-20',
+                        help='CR of the monsters, a single value like 5 or a range like 1-20 '
+                             'to draw from uniformly. Defaults to 1-20.')
+    parser.add_argument('--count', type=int, default=None,
+                        help='Number of monsters. Defaults to endless output.')
+    parser.add_argument('--lock', action='append', metavar='NAME=VALUE',
+                        help='Lock a stat for every monster, e.g. --lock ac=17. Repeatable.')
+    parser.add_argument('--method', choices=('basic', 'optimize'), default='basic',
+                        help='Generation method. Defaults to basic.')
+    parser.add_argument('--format', choices=statblock_stream.FORMATS, default='compact',
+                        help='Output format. Defaults to compact.')
+    parser.add_argument('--per-row', type=int, default=1,
+                        help='Cards per row for the compact format. Defaults to 1.')
+    parser.add_argument('--output', '-o', default='-',
+                        help='Output file, - for stdout. Defaults to stdout.')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed.')
+    parser.add_argument('--coefficients', default=None,
+                        help='Coefficient table written by calibration.py. '
+                             'Defaults to the built-in curves.')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='Monsters generated at a time. Defaults to 10000.')
+    return parser
+
+def main(argv=None):
+    """Runs the command line interface.
+
+    Args:
+        argv (list, optional): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: Exit code
+    """
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    try:
+        stats = statblock_stream.parse_stats(args.lock)
+        statblock_stream.parse_cr_spec(args.cr)
+        if args.per_row < 1:
+            raise ValueError('--per-row must be at least 1')
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        builder = StatblockBuilder(seed=args.seed, coefficients=args.coefficients)
+        statblock_stream.check_generation(builder, args.cr, args.method, stats)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    chunk_size = args.chunk_size
+    if args.format == 'compact':
+        # Whole grid rows per chunk, so the cards do not depend on the chunk size
+        chunk_size = max(chunk_size // args.per_row, 1) * args.per_row
+    crs = statblock_stream.cr_chunks(args.cr, args.count, chunk_size, builder.np_random)
+    tables = statblock_stream.generate_chunks(crs, builder, args.method, stats)
+    texts = statblock_stream.format_chunks(tables, args.format, args.per_row)
+
+    try:
+        if args.output == '-':
+            try:
+                statblock_stream.write_chunks(texts, sys.stdout)
+                sys.stdout.flush()
+            except BrokenPipeError:
+                # The reader went away, e.g. '| head', which is the normal way to
+                # stop the stream. Point stdout at devnull so the flush at exit
+                # does not fail again.
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 0
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            statblock_stream.write_chunks(texts, f)
+    except ValueError as e:
+        # check_generation samples the CR range, a random draw can still fail.
+        # Output was already written, so no usage text after it.
+        sys.stdout.flush()
+        print(f'{parser.prog}: error: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
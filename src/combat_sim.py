@@ -0,0 +1,315 @@
+"""Monte Carlo combat simulation to check generated monsters against a party.
+"""
+import numpy as np
+
+from abilities import Attack
+from damage_types import DamageType
+from statblock import Statblock
+
+# Attack fields read from the basic attack of every combatant
+_ATTACK_FIELDS = ('tohit', 'n_dice', 'die_size', 'modifier', 'n_attacks')
+
+def reference_party(level, size=4):
+    """Makes a party of generic adventurers of a given level.
+
+    The numbers follow the usual 5e progression: proficiency bonus plus a +3
+    modifier to hit, AC rising from 14 to 18, and hit points and damage growing
+    linearly with the level.
+
+    Args:
+        level (int): Character level, 1 to 20.
+        size (int, optional): Number of characters. Defaults to 4.
+
+    Returns:
+        list: Statblock objects, one per character.
+    """
+    pb = 2 + (level - 1)//4
+    ac = min(14 + level//4, 18)
+    hp = 10 + 7*(level - 1)
+    # 1d8+3 per attack, a second attack from level 5 and dice growing with level
+    n_attacks = 1 if level < 5 else 2
+    n_dice = 1 + level//8
+    party = []
+    for _ in range(size):
+        attack = Attack('Weapon', pb + 3, n_dice, 8, 3, DamageType.SLASHING, n_attacks)
+        party.append(Statblock({
+            'cr': level, 'ac': ac, 'hp_max': hp, 'hp_cur': hp, 'pb': pb,
+            'actions': [attack], 'basic_attack': attack,
+        }))
+    return party
+
+class CombatResult():
+    """Outcome of a simulation, one entry per matchup.
+
+    Attributes:
+        party_win_rate (ndarray): Share of trials where only the party is left.
+        monster_win_rate (ndarray): Share of trials where only the monsters are left.
+        draw_rate (ndarray): Share of trials where both sides fell in the same
+                            round, or nobody won within max_rounds.
+        rounds (ndarray): Histogram of shape (matchups, max_rounds + 2). Entry r
+                            counts the trials that ended in round r, so column 0
+                            is always 0, and the last column counts the trials
+                            that did not end.
+    """
+
+    def __init__(self, party_wins, monster_wins, rounds, trials):
+        self.trials = trials
+        self.party_win_rate = party_wins / trials
+        self.monster_win_rate = monster_wins / trials
+        self.draw_rate = 1 - self.party_win_rate - self.monster_win_rate
+        self.rounds = rounds
+
+    def __len__(self):
+        return len(self.party_win_rate)
+
+    def mean_rounds(self):
+        """Mean number of rounds of the trials that ended.
+
+        Returns:
+            ndarray: One entry per matchup, NaN if no trial ended.
+        """
+        ended = self.rounds[:, :-1]
+        with np.errstate(invalid='ignore'):
+            return (ended * np.arange(ended.shape[1])).sum(axis=1) / ended.sum(axis=1)
+
+    def rounds_percentile(self, q):
+        """Percentile of the rounds a trial lasted, counting unfinished trials as
+        max_rounds + 1.
+
+        Args:
+            q (float): Percentile, 0 to 100.
+
+        Returns:
+            ndarray: One entry per matchup.
+        """
+        cdf = np.cumsum(self.rounds, axis=1) / self.trials
+        return np.argmax(cdf >= q / 100, axis=1)
+
+    def to_dict(self):
+        """Summary as plain Python types.
+
+        Returns:
+            dict: Win rates, draw rate and mean rounds per matchup.
+        """
+        return {
+            'party_win_rate': self.party_win_rate.tolist(),
+            'monster_win_rate': self.monster_win_rate.tolist(),
+            'draw_rate': self.draw_rate.tolist(),
+            'mean_rounds': self.mean_rounds().tolist(),
+        }
+
+class CombatSimulator():
+    """Simulates fights between monsters and a party with NumPy.
+
+    Every combatant makes its basic attack each round against the first enemy
+    still standing. Both sides act at the same time, with the hp at the start of
+    the round. An attack hits on a natural 20 or if d20 + tohit reaches the AC,
+    never on a natural 1, and a natural 20 doubles the dice.
+
+    All trials of all matchups are stacked in one array per stat, so the cost
+    grows with the NumPy work and not with the number of fights. Matchups are
+    processed in chunks of at most chunk_rows trial rows to bound memory.
+    """
+
+    def __init__(self, trials=1000, max_rounds=20, seed=None, chunk_rows=200000):
+        """
+        Args:
+            trials (int, optional): Trials per matchup. Defaults to 1000.
+            max_rounds (int, optional): Rounds after which a fight counts as a
+                                        draw. Defaults to 20.
+            seed (int, optional): Seed for the dice. Defaults to None.
+            chunk_rows (int, optional): Max trials simulated at once.
+                                        Defaults to 200000.
+        """
+        self.trials = trials
+        self.max_rounds = max_rounds
+        self.chunk_rows = chunk_rows
+        self.rng = np.random.default_rng(seed)
+
+    def simulate(self, monsters, party):
+        """Simulates one group of monsters against a party.
+
+        Args:
+            monsters (list): Statblock objects fighting together.
+            party (list): Statblock objects of the party.
+
+        Returns:
+            CombatResult: Result with a single matchup.
+        """
+        return self._run(self._side(monsters), self._side(party))
+
+    def simulate_table(self, table, party):
+        """Simulates every monster of a table alone against the same party.
+
+        Args:
+            table (StatblockTable): The monsters, one matchup per row.
+            party (list): Statblock objects of the party.
+
+        Returns:
+            CombatResult: Result with one matchup per row of the table.
+        """
+        hp_name = 'hp_cur' if 'hp_cur' in table.names else 'hp_max'
+        monsters = {name: table[name][:, None].astype(float) for name in _ATTACK_FIELDS}
+        monsters['hp'] = table[hp_name][:, None].astype(float)
+        monsters['ac'] = table['ac'][:, None].astype(float)
+        return self._run(monsters, self._side(party))
+
+    def simulate_parties(self, monsters, parties):
+        """Simulates one group of monsters against several parties. The parties
+        are stacked as matchups, so they are simulated together like the rows of
+        simulate_table.
+
+        Args:
+            monsters (list): Statblock objects fighting together.
+            parties (list): List of parties, each a list of Statblock objects.
+
+        Returns:
+            CombatResult: Result with one matchup per party.
+        """
+        return self._run(self._side(monsters), self._sides(parties))
+
+    def _side(self, statblocks):
+        return self._sides([statblocks])
+
+    def _sides(self, groups):
+        # One row per group. Smaller groups are padded with combatants at 0 hp,
+        # which never act and are never attacked.
+        width = max((len(group) for group in groups), default=0)
+        side = {name: np.zeros((len(groups), width)) for name in ('hp', 'ac') + _ATTACK_FIELDS}
+        for i, group in enumerate(groups):
+            for j, sb in enumerate(group):
+                side['hp'][i, j] = sb.attributes.get('hp_cur', sb.attributes.get('hp_max', 0))
+                side['ac'][i, j] = sb.attributes.get('ac', 10)
+                attack = sb.get_basic_attack()
+                for name in _ATTACK_FIELDS:
+                    side[name][i, j] = getattr(attack, name)
+        return side
+
+    def _run(self, monsters, party):
+        n_matchups = max(len(monsters['hp']), len(party['hp']))
+        per_chunk = max(self.chunk_rows // self.trials, 1)
+
+        party_wins = np.zeros(n_matchups)
+        monster_wins = np.zeros(n_matchups)
+        rounds = np.zeros((n_matchups, self.max_rounds + 2), dtype=np.int64)
+        for start in range(0, n_matchups, per_chunk):
+            rows = slice(start, min(start + per_chunk, n_matchups))
+            wins = self._run_chunk(self._expand(monsters, rows), self._expand(party, rows))
+            party_wins[rows], monster_wins[rows], rounds[rows] = wins
+        return CombatResult(party_wins, monster_wins, rounds, self.trials)
+
+    def _expand(self, side, rows):
+        # Broadcast a side with one matchup to all matchups, then repeat each
+        # matchup once per trial.
+        expanded = {}
+        for name, values in side.items():
+            values = values if len(values) > 1 else np.repeat(values, rows.stop - rows.start, 0)
+            if len(values) > rows.stop - rows.start:
+                values = values[rows]
+            expanded[name] = np.repeat(values, self.trials, axis=0)
+        return expanded
+
+    def _run_chunk(self, monsters, party):
+        n_rows = len(monsters['hp'])
+        end_round = np.zeros(n_rows, dtype=np.int64)
+        winner = np.zeros(n_rows, dtype=np.int8)  # 1 party, 2 monsters
+
+        # Fights that ended are dropped from the arrays once they make up half
+        # of the rows, so long fights do not pay for the short ones.
+        live = np.arange(n_rows)
+        running = np.ones(n_rows, dtype=bool)
+        m_side, p_side = monsters, party
+        m_hp, p_hp = monsters['hp'].copy(), party['hp'].copy()
+        for r in range(1, self.max_rounds + 1):
+            if len(live) == 0:
+                break
+            to_party = self._round_damage(m_side, m_hp > 0, p_hp, p_side['ac'])
+            to_monsters = self._round_damage(p_side, p_hp > 0, m_hp, m_side['ac'])
+            p_hp -= to_party
+            m_hp -= to_monsters
+
+            party_up = (p_hp > 0).any(axis=1)
+            monsters_up = (m_hp > 0).any(axis=1)
+            ended = running & ~(party_up & monsters_up)
+            end_round[live[ended]] = r
+            winner[live[ended & party_up]] = 1
+            winner[live[ended & monsters_up]] = 2
+            running &= ~ended
+
+            if 2 * running.sum() <= len(live):
+                live = live[running]
+                m_side = {name: values[running] for name, values in m_side.items()}
+                p_side = {name: values[running] for name, values in p_side.items()}
+                m_hp, p_hp = m_hp[running], p_hp[running]
+                running = running[running]
+
+        trials = self.trials
+        n_matchups = n_rows // trials
+        party_wins = (winner == 1).reshape(n_matchups, trials).sum(axis=1)
+        monster_wins = (winner == 2).reshape(n_matchups, trials).sum(axis=1)
+        # Unfinished trials are counted in column max_rounds + 1
+        end_round[end_round == 0] = self.max_rounds + 1
+        width = self.max_rounds + 2
+        matchup = np.repeat(np.arange(n_matchups), trials)
+        rounds = np.bincount(matchup * width + end_round, minlength=n_matchups * width)
+        rounds = rounds.reshape(n_matchups, width)
+        return party_wins, monster_wins, rounds
+
+    def _round_damage(self, attackers, alive, target_hp, target_ac):
+        """Damage every target takes from one round of attacks.
+        """
+        n_rows, n_targets = target_hp.shape
+        standing = target_hp > 0
+        target = np.argmax(standing, axis=1)
+        has_target = standing.any(axis=1)
+        rows = np.arange(n_rows)
+        ac = target_ac[rows, target]
+
+        # Everybody on a side attacks the same target, so the damage of the whole
+        # side can be added up before it is applied.
+        # Dice are only rolled for the rows where the attacker can act, fallen
+        # combatants and the padding of smaller groups are skipped.
+        dealt = np.zeros(n_rows)
+        for j in range(attackers['hp'].shape[1]):
+            acting = np.flatnonzero(alive[:, j] & has_target & (attackers['n_attacks'][:, j] > 0))
+            if len(acting):
+                dealt[acting] += self._attack_damage(attackers, j, ac, acting)
+        damage = np.zeros((n_rows, n_targets))
+        damage[rows, target] = dealt
+        return damage
+
+    def _attack_damage(self, attackers, j, ac, rows):
+        tohit = attackers['tohit'][rows, j]
+        n_dice = attackers['n_dice'][rows, j]
+        die_size = attackers['die_size'][rows, j]
+        modifier = attackers['modifier'][rows, j]
+        n_attacks = attackers['n_attacks'][rows, j]
+        ac = ac[rows]
+        n_rows = len(rows)
+        max_attacks = int(n_attacks.max(initial=0))
+        max_dice = int(n_dice.max(initial=0))
+        if max_attacks == 0:
+            return np.zeros(n_rows)
+
+        d20 = self.rng.integers(1, 21, (n_rows, max_attacks))
+        hit = (d20 == 20) | ((d20 != 1) & (d20 + tohit[:, None] >= ac[:, None]))
+        hit &= np.arange(max_attacks) < n_attacks[:, None]
+        crit = hit & (d20 == 20)
+
+        dice = np.zeros((n_rows, max_attacks))
+        if max_dice > 0:
+            dice[hit] = self._roll(n_dice, die_size, hit, max_dice)
+            # A crit rolls the dice once more
+            if crit.any():
+                dice[crit] += self._roll(n_dice, die_size, crit, max_dice)
+        per_attack = np.maximum(dice + modifier[:, None], 0)
+        return (per_attack * hit).sum(axis=1)
+
+    def _roll(self, n_dice, die_size, mask, max_dice):
+        """Sums of n_dice dice of die_size for the attacks in mask, only rolling
+        for the attacks that hit.
+        """
+        rows = np.nonzero(mask)[0]
+        n_dice, die_size = n_dice[rows], die_size[rows]
+        faces = np.floor(self.rng.random((len(rows), max_dice)) * die_size[:, None]) + 1
+        return (faces * (np.arange(max_dice) < n_dice[:, None])).sum(axis=1)
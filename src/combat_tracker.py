@@ -0,0 +1,365 @@
+"""Contains the CombatTracker class
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from statblock import Statblock
+from statblock_table import StatblockTable
+
+CONDITIONS = (
+    'blinded', 'charmed', 'deafened', 'frightened', 'grappled', 'incapacitated',
+    'invisible', 'paralyzed', 'petrified', 'poisoned', 'prone', 'restrained',
+    'stunned', 'unconscious',
+)
+SAVES = ('strong', 'weak')
+
+# kind: what happened, rows: the creatures it touched, old: {array name: values of
+# those rows before}, info: details such as the damage rolled
+Event = namedtuple('Event', ('kind', 'rows', 'old', 'info'))
+Snapshot = namedtuple('Snapshot', ('arrays', 'log_length'))
+
+class CombatTracker():
+    """Live state of many creatures in one battle, kept in NumPy arrays.
+
+    hp, conditions and initiative of creature i are entries i of hp_cur, hp_max,
+    conditions and initiative. Conditions are bit masks, bit j set meaning
+    CONDITIONS[j]. The statblocks themselves are only read when a card is
+    rendered, so a tracker over a StatblockTable never materializes rows it does
+    not show.
+
+    Every change is recorded in log with the values it overwrote, so undo reverts
+    changes one by one, and snapshot/restore jump back several at once.
+
+    Example:
+        tracker = CombatTracker(builder.make_statblocks_basic([1] * 300), seed=0)
+        tracker.roll_initiative()
+        tracker.area_damage(range(50), 8, 6, save='weak', dc=15) # Fireball
+        tracker.undo()
+        print(tracker.format(0))
+    """
+    # Arrays saved by snapshot, and the only ones events change
+    state_arrays = ('hp_cur', 'hp_max', 'conditions', 'initiative')
+
+    def __init__(self, statblocks, seed=None):
+        """
+        Args:
+            statblocks (list or StatblockTable): The creatures
+            seed (int, optional): Seed for the dice. Defaults to None.
+        """
+        self.rng = np.random.default_rng(seed)
+        if isinstance(statblocks, StatblockTable):
+            self.source = statblocks
+            column = self._table_column
+        else:
+            self.source = list(statblocks)
+            column = self._statblock_column
+        self.hp_max = column('hp_max', 0).astype(np.int64)
+        hp_cur = column('hp_cur', np.nan)
+        self.hp_cur = np.where(np.isnan(hp_cur), self.hp_max, hp_cur).astype(np.int64)
+        self.ac = column('ac', 10).astype(np.int64)
+        self.strong_save = column('strong_save', 0).astype(np.int64)
+        self.weak_save = column('weak_save', 0).astype(np.int64)
+        self.dex_modifier = ((column('Dex', 10) - 10) // 2).astype(np.int64)
+        self.conditions = np.zeros(len(self.source), dtype=np.uint32)
+        self.initiative = np.zeros(len(self.source), dtype=np.int64)
+        self.log = []
+
+    def __len__(self):
+        return len(self.hp_cur)
+
+    def _statblock_column(self, name, default):
+        return np.array([sb.attributes.get(name, default) for sb in self.source], dtype=float)
+
+    def _table_column(self, name, default):
+        if name not in self.source.names:
+            return np.full(len(self.source), default, dtype=float)
+        column = np.asarray(self.source[name], dtype=float)
+        return np.where(np.isnan(column), default, column)
+
+    #region queries
+    def alive(self):
+        """Boolean mask of the creatures with hp left."""
+        return self.hp_cur > 0
+
+    def has_condition(self, condition):
+        """Boolean mask of the creatures with a condition.
+
+        Args:
+            condition (str): One of CONDITIONS
+
+        Returns:
+            ndarray: Mask
+        """
+        return (self.conditions & self._condition_bit(condition)) != 0
+
+    def get_conditions(self, i):
+        """Names of the conditions of one creature.
+
+        Args:
+            i (int): Creature index
+
+        Returns:
+            list: Condition names
+        """
+        bits = int(self.conditions[i])
+        return [name for j, name in enumerate(CONDITIONS) if bits >> j & 1]
+
+    def turn_order(self, living_only=True):
+        """Creature indices from the highest initiative down. Ties go to the
+        higher Dex modifier, then to the lower index.
+
+        Args:
+            living_only (bool, optional): Leave out creatures at 0 hp. Defaults to True.
+
+        Returns:
+            ndarray: Indices
+        """
+        order = np.lexsort((np.arange(len(self)), -self.dex_modifier, -self.initiative))
+        if living_only:
+            order = order[self.hp_cur[order] > 0]
+        return order
+    #endregion
+
+    #region changes
+    def damage(self, targets, amounts, damage_type=None):
+        """Deals damage. hp do not go below 0.
+
+        Args:
+            targets (array_like): Distinct indices or a boolean mask, None for everyone.
+            amounts (int or array_like): Damage, for all targets or per target.
+            damage_type (DamageType, optional): Kept in the log. Defaults to None.
+
+        Returns:
+            ndarray: Damage taken per target, less than amounts for creatures
+                     that drop to 0.
+        """
+        rows = self._rows(targets)
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=np.int64), rows.shape)
+        old = self.hp_cur[rows]
+        new = np.maximum(old - np.maximum(amounts, 0), 0)
+        self._record('damage', rows, {'hp_cur': old}, damage_type=damage_type)
+        self.hp_cur[rows] = new
+        return old - new
+
+    def heal(self, targets, amounts):
+        """Restores hp, up to hp_max.
+
+        Args:
+            targets (array_like): Distinct indices or a boolean mask, None for everyone.
+            amounts (int or array_like): hp, for all targets or per target.
+
+        Returns:
+            ndarray: hp restored per target
+        """
+        rows = self._rows(targets)
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=np.int64), rows.shape)
+        old = self.hp_cur[rows]
+        new = np.minimum(old + np.maximum(amounts, 0), np.maximum(self.hp_max[rows], old))
+        self._record('heal', rows, {'hp_cur': old})
+        self.hp_cur[rows] = new
+        return new - old
+
+    def area_damage(self, targets, n_dice, die_size, modifier=0, save=None, dc=None,
+                    half_on_save=True, damage_type=None, roll_once=True):
+        """Damage to many creatures at once, e.g. a Fireball: 8d6 fire, half on a
+        successful save. Every target rolls d20 + its strong_save or weak_save
+        against dc.
+
+        Args:
+            targets (array_like): Distinct indices or a boolean mask, None for everyone.
+            n_dice (int): Number of damage dice.
+            die_size (int): Sides of the damage dice.
+            modifier (int, optional): Added to the damage. Defaults to 0.
+            save (str, optional): 'strong' or 'weak', which save bonus the targets
+                                  use. Defaults to None, i.e. no save.
+            dc (int, optional): Save DC, required with save.
+            half_on_save (bool, optional): Half damage on a save, no damage if
+                                  False. Defaults to True.
+            damage_type (DamageType, optional): Kept in the log. Defaults to None.
+            roll_once (bool, optional): One damage roll for all targets, as the
+                                  rules do it. False rolls per target. Defaults to True.
+
+        Returns:
+            tuple: (damage taken per target, boolean array of the saves made)
+        """
+        rows = self._rows(targets)
+        size = 1 if roll_once else len(rows)
+        faces = np.floor(self.rng.random((size, n_dice)) * die_size).astype(np.int64) + 1
+        amounts = np.broadcast_to(faces.sum(axis=1) + modifier, rows.shape)
+
+        saved = np.zeros(len(rows), dtype=bool)
+        if save is not None:
+            if save not in SAVES:
+                raise ValueError(f'Unknown save {save}, expected one of {SAVES}')
+            if dc is None:
+                raise ValueError('dc is required with a save')
+            bonus = self.strong_save[rows] if save == 'strong' else self.weak_save[rows]
+            saved = self.rng.integers(1, 21, len(rows)) + bonus >= dc
+            amounts = np.where(saved, amounts // 2 if half_on_save else 0, amounts)
+
+        old = self.hp_cur[rows]
+        new = np.maximum(old - np.maximum(amounts, 0), 0)
+        self._record('area_damage', rows, {'hp_cur': old}, damage_type=damage_type,
+                     dice=(n_dice, die_size, modifier), save=save, dc=dc,
+                     saves=int(saved.sum()))
+        self.hp_cur[rows] = new
+        return old - new, saved
+
+    def add_condition(self, targets, condition):
+        """Gives the targets a condition.
+
+        Args:
+            targets (array_like): Distinct indices or a boolean mask, None for everyone.
+            condition (str): One of CONDITIONS
+        """
+        bit = self._condition_bit(condition)
+        rows = self._rows(targets)
+        self._record('add_condition', rows, {'conditions': self.conditions[rows]},
+                     condition=condition)
+        self.conditions[rows] |= bit
+
+    def remove_condition(self, targets, condition):
+        """Ends a condition on the targets.
+
+        Args:
+            targets (array_like): Distinct indices or a boolean mask, None for everyone.
+            condition (str): One of CONDITIONS
+        """
+        bit = self._condition_bit(condition)
+        rows = self._rows(targets)
+        self._record('remove_condition', rows, {'conditions': self.conditions[rows]},
+                     condition=condition)
+        self.conditions[rows] &= ~bit
+
+    def roll_initiative(self, targets=None):
+        """Rolls d20 + Dex modifier for the targets.
+
+        Args:
+            targets (array_like, optional): Indices or a boolean mask. Defaults to
+                                            None, i.e. everyone.
+
+        Returns:
+            ndarray: The rolls
+        """
+        rows = self._rows(targets)
+        rolls = self.rng.integers(1, 21, len(rows)) + self.dex_modifier[rows]
+        self.set_initiative(rows, rolls)
+        return rolls
+
+    def set_initiative(self, targets, values):
+        """Sets initiative directly, e.g. to values the players rolled.
+
+        Args:
+            targets (array_like): Distinct indices or a boolean mask, None for everyone.
+            values (int or array_like): Initiative, for all targets or per target.
+        """
+        rows = self._rows(targets)
+        self._record('initiative', rows, {'initiative': self.initiative[rows]})
+        self.initiative[rows] = values
+
+    def _rows(self, targets):
+        if targets is None:
+            return np.arange(len(self))
+        targets = np.asarray(targets)
+        if targets.dtype == bool:
+            if targets.shape != self.hp_cur.shape:
+                raise ValueError('A target mask needs one entry per creature')
+            return np.flatnonzero(targets)
+        rows = targets.astype(np.intp).reshape(-1)
+        if len(np.unique(rows)) != len(rows):
+            # A repeated index would be hit once but logged and reported twice
+            raise ValueError('Targets must not repeat, sum the amounts per creature instead')
+        return rows
+
+    @staticmethod
+    def _condition_bit(condition):
+        if condition not in CONDITIONS:
+            raise ValueError(f'Unknown condition {condition}')
+        return np.uint32(1 << CONDITIONS.index(condition))
+
+    def _record(self, kind, rows, old, **info):
+        # Fancy indexing in the callers already made copies of the old values
+        self.log.append(Event(kind, rows, old, info))
+    #endregion
+
+    #region history
+    def undo(self, steps=1):
+        """Reverts the latest changes.
+
+        Args:
+            steps (int, optional): Number of events to revert. Defaults to 1.
+
+        Returns:
+            list: The reverted events, latest first.
+        """
+        undone = []
+        for _ in range(min(steps, len(self.log))):
+            event = self.log.pop()
+            # Reverse order, in case a row appears twice in the event
+            for name, values in event.old.items():
+                getattr(self, name)[event.rows[::-1]] = values[::-1]
+            undone.append(event)
+        return undone
+
+    def snapshot(self):
+        """Copies of the state arrays, a few memcpys for any number of creatures.
+
+        Returns:
+            Snapshot: Pass to restore.
+        """
+        return Snapshot(
+            {name: getattr(self, name).copy() for name in self.state_arrays}, len(self.log))
+
+    def restore(self, snapshot):
+        """Returns to a snapshot. Events logged since are dropped.
+
+        Args:
+            snapshot (Snapshot): From snapshot.
+        """
+        for name, values in snapshot.arrays.items():
+            getattr(self, name)[:] = values
+        del self.log[snapshot.log_length:]
+    #endregion
+
+    #region statblocks
+    def get_statblock(self, i):
+        """A Statblock of creature i with its current hp. The statblock the tracker
+        was made from is not changed.
+
+        Args:
+            i (int): Creature index
+
+        Returns:
+            Statblock: The creature
+        """
+        source = self.source[i]
+        stats = dict(source.attributes)
+        stats['hp_max'] = int(self.hp_max[i])
+        stats['hp_cur'] = int(self.hp_cur[i])
+        stats['actions'] = source.actions
+        stats['abilities'] = source.abilities
+        stats['basic_attack'] = source.basic_attack
+        return Statblock(stats)
+
+    def format(self, i, style='compact'):
+        """Card of creature i with its current hp, see Statblock.format.
+
+        Args:
+            i (int): Creature index
+            style (str, optional): Display style. Defaults to 'compact'.
+
+        Returns:
+            str: The card
+        """
+        return self.get_statblock(i).format(style)
+
+    def write_back(self):
+        """Copies hp_cur and hp_max into the statblocks the tracker was made from.
+        Only for trackers made from a list of Statblock objects."""
+        if isinstance(self.source, StatblockTable):
+            raise TypeError('The rows of a StatblockTable are read-only, use get_statblock')
+        for sb, hp_cur, hp_max in zip(self.source, self.hp_cur.tolist(), self.hp_max.tolist()):
+            sb.attributes['hp_cur'] = hp_cur
+            sb.attributes['hp_max'] = hp_max
+    #endregion
@@ -0,0 +1,364 @@
+"""Streaming audit of the listed CRs of imported monster collections.
+
+Monsters are read in chunks from CSV, JSON lines or a JSON array of objects. The
+input fields are mapped onto audit fields, mostly Statblock.num_attributes:
+
+    cr, hp_max, ac           listed cr and defensive stats, required
+    tohit, damage            attack bonus and average damage per round
+    save_dc                  save DC of the monster's abilities, if any
+    vri_score                vulnerabilities, resistances and immunities, see
+                             StatblockBuilder.defensive_cr. Defaults to 0.
+    name                     passed through to the report
+
+For every chunk StatblockBuilder.defensive_crs and offensive_crs give the CR the
+stats are worth, and the computed CR is their mean, or the one that can be
+computed if offensive stats are missing. Monsters whose listed CR differs from the
+computed one by more than the threshold are written to the report as they are
+found, so memory only depends on the chunk size.
+
+Values like '1/2' and '45 (6d10 + 12)' are read as 0.5 and 45.
+
+Example:
+    python cr_audit.py monsters.csv -o outliers.csv --map challenge=cr --threshold 2
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import re
+import sys
+
+import numpy as np
+
+from statblock_builder import StatblockBuilder
+
+AUDIT_FIELDS = ('cr', 'hp_max', 'ac', 'tohit', 'damage', 'save_dc', 'vri_score')
+REPORT_COLUMNS = (
+    'row', 'name', 'cr', 'defensive_cr', 'offensive_cr', 'computed_cr', 'difference')
+
+# Input field names, compared in lower case, and the audit field they map to
+DEFAULT_FIELD_MAP = {
+    'name': 'name',
+    'cr': 'cr', 'challenge_rating': 'cr', 'challenge': 'cr',
+    'hp': 'hp_max', 'hp_max': 'hp_max', 'hit_points': 'hp_max',
+    'ac': 'ac', 'armor_class': 'ac',
+    'tohit': 'tohit', 'to_hit': 'tohit', 'attack_bonus': 'tohit',
+    'damage': 'damage', 'damage_per_round': 'damage', 'dpr': 'damage',
+    'save_dc': 'save_dc', 'dc': 'save_dc',
+    'vri_score': 'vri_score',
+}
+
+_LEADING_NUMBER = re.compile(r'\s*([-+]?(?:\d+\.?\d*|\.\d+))(?:\s*/\s*(\d+))?')
+
+#region reading
+def read_chunks(stream, fmt=None, chunk_size=10000):
+    """Yields the records of a stream in chunks.
+
+    Args:
+        stream (file-like): Text stream
+        fmt (str, optional): 'csv', 'jsonl' or 'json' (a top level array).
+                             Defaults to None, i.e. guessed from the first character.
+        chunk_size (int, optional): Records per chunk. Defaults to 10000.
+
+    Yields:
+        tuple: (field names, list of records), the records being lists of values
+               ordered as the field names.
+    """
+    if fmt is None:
+        first = stream.read(1)
+        prefix = ''
+        while first.isspace():
+            prefix, first = prefix + first, stream.read(1)
+        fmt = {'[': 'json', '{': 'jsonl'}.get(first, 'csv')
+        stream = _Prefixed(prefix + first, stream)
+
+    if fmt == 'csv':
+        reader = csv.reader(stream)
+        names = next(reader, None)
+        if names is None:
+            return
+        for chunk in iter(lambda: list(itertools.islice(reader, chunk_size)), []):
+            yield names, chunk
+    elif fmt in ('json', 'jsonl'):
+        objects = _json_array(stream) if fmt == 'json' else (
+            json.loads(line) for line in stream if line.strip())
+        for chunk in iter(lambda: list(itertools.islice(objects, chunk_size)), []):
+            names = list({name: None for obj in chunk for name in obj})
+            yield names, [[obj.get(name) for name in names] for obj in chunk]
+    else:
+        raise ValueError(f'Unknown format {fmt}')
+
+class _Prefixed():
+    # Puts the characters read while guessing the format back in front of a stream
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size=-1):
+        prefix, self._prefix = self._prefix, ''
+        return prefix + self._stream.read(size - len(prefix) if size >= 0 else -1)
+
+    def __iter__(self):
+        if self._prefix:
+            prefix, self._prefix = self._prefix, ''
+            yield prefix + self._stream.readline()
+        yield from self._stream
+
+def _json_array(stream, buffer_size=1 << 16):
+    # Yields the elements of a top level JSON array, reading buffer_size
+    # characters at a time instead of the whole array.
+    decoder = json.JSONDecoder()
+    buffer, pos, started = '', 0, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = stream.read(buffer_size), 0
+            if not buffer:
+                raise ValueError('Unexpected end of the JSON array')
+            continue
+        if not started:
+            if buffer[pos] != '[':
+                raise ValueError('Expected a JSON array')
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            obj, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element runs past the end of the buffer
+            more = stream.read(buffer_size)
+            if not more:
+                raise
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        yield obj
+
+def to_number(value):
+    """Reads a number from an input value.
+
+    Args:
+        value: A number, None, or a string like '7', '1/2' or '45 (6d10 + 12)'.
+
+    Returns:
+        float: The number, NaN if there is none.
+    """
+    if value is None or isinstance(value, bool):
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _LEADING_NUMBER.match(str(value))
+    if match is None:
+        return math.nan
+    number, denominator = match.groups()
+    return float(number) / float(denominator) if denominator else float(number)
+
+def map_columns(names, records, field_map, fields):
+    """Picks the input fields that map onto the wanted fields out of a chunk.
+
+    Args:
+        names (list): Input field names
+        records (list): Records, lists of values ordered as names.
+        field_map (dict): {lower case input field: field}, e.g. DEFAULT_FIELD_MAP.
+        fields (tuple): Wanted fields. 'name' is kept as a list of values, every
+                        other field converted to a float array with NaN for
+                        missing values.
+
+    Returns:
+        dict: {field: column} for the wanted fields found in names. The first
+              input field that maps onto a field is used.
+    """
+    index = {}
+    for j, name in enumerate(names):
+        field = field_map.get(str(name).strip().lower())
+        if field in fields:
+            index.setdefault(field, j)
+    columns = {}
+    for field, j in index.items():
+        values = [record[j] if j < len(record) else None for record in records]
+        columns[field] = values if field == 'name' else _number_column(values)
+    return columns
+
+def _number_column(values):
+    # Plain numbers and numeric strings convert in one call, anything else per value
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        return np.array([to_number(value) for value in values], dtype=float)
+#endregion
+
+class CRAudit():
+    """Audits the listed CR of monsters against the CR their stats are worth.
+
+    Example:
+        audit = CRAudit(threshold=2)
+        with open('monsters.csv') as f, open('outliers.csv', 'w', newline='') as out:
+            summary = audit.run(f, out)
+    """
+
+    def __init__(self, builder=None, field_map=None, threshold=2.0):
+        """
+        Args:
+            builder (StatblockBuilder, optional): Builder whose curves are used.
+                            Defaults to a new builder.
+            field_map (dict, optional): Extra {input field: audit field} entries,
+                            added to DEFAULT_FIELD_MAP. Defaults to None.
+            threshold (float, optional): Largest difference between the listed
+                            and the computed cr that is not an outlier. Defaults to 2.
+        """
+        self.builder = StatblockBuilder() if builder is None else builder
+        self.field_map = dict(DEFAULT_FIELD_MAP)
+        for name, field in (field_map or {}).items():
+            if field not in AUDIT_FIELDS + ('name',):
+                raise ValueError(f'Unknown audit field {field}')
+            self.field_map[name.lower()] = field
+        self.threshold = threshold
+
+    def audit_chunk(self, names, records):
+        """Computes the crs of one chunk.
+
+        Args:
+            names (list): Input field names
+            records (list): Records, lists of values ordered as names.
+
+        Returns:
+            dict: Arrays 'cr', 'defensive_cr', 'offensive_cr', 'computed_cr' and
+                  'difference', and 'name', a list or None.
+        """
+        columns = map_columns(names, records, self.field_map, AUDIT_FIELDS + ('name',))
+        missing = [field for field in ('cr', 'hp_max', 'ac') if field not in columns]
+        if missing:
+            raise ValueError(f'No input field for {missing}, pass a field_map')
+        n = len(records)
+        for field in AUDIT_FIELDS:
+            columns.setdefault(field, np.full(n, np.nan))
+        vri_score = np.nan_to_num(columns['vri_score'])
+
+        defensive = self.builder.defensive_crs(columns['hp_max'], columns['ac'], vri_score)
+        # offensive_cr reads its strong_save argument as a save DC
+        offensive = self.builder.offensive_crs(
+            columns['tohit'], columns['damage'], columns['save_dc'])
+        computed = np.where(
+            np.isnan(offensive), defensive,
+            np.where(np.isnan(defensive), offensive, (defensive + offensive)/2))
+        result = {
+            'cr': columns['cr'],
+            'defensive_cr': defensive,
+            'offensive_cr': offensive,
+            'computed_cr': computed,
+            'difference': columns['cr'] - computed,
+            'name': columns.get('name'),
+        }
+        return result
+
+    def run(self, stream, report=None, fmt=None, chunk_size=10000):
+        """Audits every monster of a stream.
+
+        Args:
+            stream (file-like): CSV, JSON lines or JSON array text.
+            report (file-like, optional): Outliers are written here as CSV with
+                            REPORT_COLUMNS. Defaults to None, i.e. summary only.
+            fmt (str, optional): See read_chunks. Defaults to None.
+            chunk_size (int, optional): Records per chunk. Defaults to 10000.
+
+        Returns:
+            dict: Summary with the number of rows, rows audited, rows skipped for
+                  missing values, outliers, the mean and mean absolute difference,
+                  and the outliers above and below the computed cr.
+        """
+        writer = None
+        if report is not None:
+            writer = csv.writer(report, lineterminator='\n')
+            writer.writerow(REPORT_COLUMNS)
+        rows = audited = outliers = too_high = 0
+        total = total_abs = 0.0
+        for names, records in read_chunks(stream, fmt, chunk_size):
+            result = self.audit_chunk(names, records)
+            difference = result['difference']
+            valid = ~np.isnan(difference)
+            outlier = valid & (np.abs(np.where(valid, difference, 0)) > self.threshold)
+
+            audited += int(valid.sum())
+            total += float(difference[valid].sum())
+            total_abs += float(np.abs(difference[valid]).sum())
+            outliers += int(outlier.sum())
+            too_high += int((outlier & (difference > 0)).sum())
+            if writer is not None and outlier.any():
+                i = np.flatnonzero(outlier)
+                name = result['name']
+                writer.writerows(zip(
+                    (i + rows).tolist(),
+                    [name[k] for k in i] if name is not None else [''] * len(i),
+                    *(np.round(result[column][i], 2).tolist() for column in REPORT_COLUMNS[2:]),
+                ))
+            rows += len(records)
+        return {
+            'rows': rows,
+            'audited': audited,
+            'skipped': rows - audited,
+            'outliers': outliers,
+            'listed_too_high': too_high,
+            'listed_too_low': outliers - too_high,
+            'mean_difference': total / audited if audited else None,
+            'mean_abs_difference': total_abs / audited if audited else None,
+            'threshold': self.threshold,
+        }
+
+def main(argv=None):
+    """Runs the audit from the command line.
+
+    Args:
+        argv (list, optional): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: Exit code
+    """
+    parser = argparse.ArgumentParser(description='Find monsters whose CR does not fit their stats.')
+    parser.add_argument('input', help='CSV, JSON lines or JSON array file, - for stdin.')
+    parser.add_argument('--output', '-o', default=None,
+                        help='Outlier report as CSV, - for stdout. Defaults to no report.')
+    parser.add_argument('--format', choices=('csv', 'jsonl', 'json'), default=None,
+                        help='Input format. Defaults to a guess from the content.')
+    parser.add_argument('--map', action='append', metavar='FIELD=AUDIT_FIELD',
+                        help='Map an input field, e.g. --map challenge=cr. Repeatable.')
+    parser.add_argument('--threshold', type=float, default=2.0,
+                        help='CR difference above which a monster is an outlier. '
+                             'Defaults to 2.')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='Records read at a time. Defaults to 10000.')
+    args = parser.parse_args(argv)
+
+    field_map = {}
+    for item in args.map or ():
+        name, sep, field = item.partition('=')
+        if not sep:
+            parser.error(f'Invalid mapping {item!r}, expected FIELD=AUDIT_FIELD')
+        field_map[name.strip()] = field.strip()
+    try:
+        audit = CRAudit(field_map=field_map, threshold=args.threshold)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # pylint: disable=consider-using-with
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8', newline='')
+    report = None
+    if args.output == '-':
+        report = sys.stdout
+    elif args.output is not None:
+        report = open(args.output, 'w', encoding='utf-8', newline='')
+    try:
+        summary = audit.run(source, report, args.format, args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        for f in (source, report):
+            if f not in (None, sys.stdin, sys.stdout):
+                f.close()
+    print(json.dumps(summary, indent=1), file=sys.stderr if report is sys.stdout else sys.stdout)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Contains the CoefficientTable and CalibratedCurves classes
+"""
+import hashlib
+import json
+import math
+import time
+
+import numpy as np
+
+import cr_curves
+
+FORMAT_VERSION = 1
+
+# The regressions behind the CR curves. Linear pieces are (intercept, slope) of
+# cr = intercept + slope*x, the _low pieces (intercept, slope) of
+# log(cr) = intercept + slope*x, and defensive_cr is (intercept, hp, ac) as in
+# StatblockBuilder.defensive_cr. These are the built-in values.
+DEFAULT_COEFFICIENTS = {
+    'defensive_cr': (-3.65, 0.05376286, 0.30206772),
+    'cr_from_pb': (-6.0, 4.0),
+    'cr_from_hp': (-10/15, 1/15),
+    'cr_from_ac': (-37.5, 3.0),
+    'cr_from_tohit': (-0.5, 0.5),
+    'cr_from_tohit_low': (math.log(0.00335), 1.33),
+    'cr_from_damage': (-0.2, 0.2),
+    'cr_from_damage_low': (math.log(0.043), 0.32),
+}
+
+# Where the pieces of the curves meet, as in cr_curves. These are not fitted.
+TOHIT_BREAKPOINT = 5
+DAMAGE_BREAKPOINT = 10
+AC_BREAKPOINT = 12
+# cr of every ac up to AC_BREAKPOINT
+AC_LOW_CR = 0.25
+
+class CoefficientTable():
+    """Versioned set of curve coefficients, as written by calibration.
+
+    Besides the coefficients a table keeps the sufficient statistics they were
+    fitted from, so a later calibration can add data without reading the old
+    data again, and fit diagnostics per curve. Coefficients missing from a table
+    are the built-in ones.
+    """
+
+    def __init__(self, coefficients=None, version=0, statistics=None, fits=None, rows=0,
+                 created=None):
+        """
+        Args:
+            coefficients (dict, optional): {name: coefficients} for names in
+                            DEFAULT_COEFFICIENTS. Defaults to None.
+            version (int, optional): Increases with every calibration. Defaults to 0,
+                            the built-in coefficients.
+            statistics (dict, optional): Sufficient statistics per name, see
+                            calibration.LeastSquares. Defaults to None.
+            fits (dict, optional): Diagnostics per name. Defaults to None.
+            rows (int, optional): Number of monsters the table was fitted on.
+                            Defaults to 0.
+            created (str, optional): Time of the calibration. Defaults to None.
+        """
+        self.coefficients = dict(DEFAULT_COEFFICIENTS)
+        for name, values in (coefficients or {}).items():
+            if name not in DEFAULT_COEFFICIENTS:
+                raise ValueError(f'Unknown curve {name}')
+            if len(values) != len(DEFAULT_COEFFICIENTS[name]):
+                raise ValueError(f'{name} needs {len(DEFAULT_COEFFICIENTS[name])} coefficients')
+            self.coefficients[name] = tuple(float(v) for v in values)
+        self.version = version
+        self.statistics = statistics or {}
+        self.fits = fits or {}
+        self.rows = rows
+        self.created = created
+
+    def __getitem__(self, name):
+        return self.coefficients[name]
+
+    def digest(self):
+        """Short hash of the coefficients, equal for tables with equal coefficients.
+
+        Returns:
+            str: Hex digest
+        """
+        text = json.dumps(self.coefficients, sort_keys=True)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+    def to_dict(self):
+        """The table as JSON friendly dict.
+
+        Returns:
+            dict: Table
+        """
+        return {
+            'format_version': FORMAT_VERSION,
+            'version': self.version,
+            'created': self.created,
+            'rows': self.rows,
+            'coefficients': {name: list(values) for name, values in self.coefficients.items()},
+            'fits': self.fits,
+            'statistics': self.statistics,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Reads a table written by to_dict.
+
+        Args:
+            data (dict): Table
+
+        Returns:
+            CoefficientTable: The table
+        """
+        if data.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f'Unsupported coefficient table format {data.get("format_version")}')
+        return cls(data['coefficients'], data['version'], data.get('statistics'),
+                   data.get('fits'), data.get('rows', 0), data.get('created'))
+
+    def save(self, path):
+        """Writes the table as JSON.
+
+        Args:
+            path (str): File name
+        """
+        if self.created is None:
+            self.created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a table written by save.
+
+        Args:
+            path (str): File name
+
+        Returns:
+            CoefficientTable: The table
+        """
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+class CalibratedCurves():
+    """The cr_from_x curves and their inverses with the coefficients of a table.
+
+    Has the same functions as the cr_curves module, so it can be passed as the
+    curves of a StatblockBuilder. The x_from_cr curves, which follow the DMG table
+    instead of a regression, are taken from cr_curves. scalar_curves and
+    scalar_inverses hold plain float versions for the scalar builder methods, with
+    the cr_slope_from_x derivatives, and the closed form solver.
+    """
+
+    def __init__(self, table=None):
+        """
+        Args:
+            table (CoefficientTable, optional): Coefficients. Defaults to None,
+                                                i.e. the built-in ones.
+        """
+        self.table = CoefficientTable() if table is None else table
+        self._pb = self.table['cr_from_pb']
+        self._hp = self.table['cr_from_hp']
+        self._ac = self.table['cr_from_ac']
+        self._tohit = self.table['cr_from_tohit']
+        self._tohit_low = self.table['cr_from_tohit_low']
+        self._damage = self.table['cr_from_damage']
+        self._damage_low = self.table['cr_from_damage_low']
+        # Lowest cr of the linear pieces, where the inverses switch to the low ones
+        self._tohit_switch = self._tohit[0] + self._tohit[1]*TOHIT_BREAKPOINT
+        self._damage_switch = self._damage[0] + self._damage[1]*DAMAGE_BREAKPOINT
+
+        self.scalar_curves = {
+            'cr_from_pb': self._scalar_cr_from_pb,
+            'cr_from_hp': self._scalar_cr_from_hp,
+            'cr_from_ac': self._scalar_cr_from_ac,
+            'cr_from_tohit': self._scalar_cr_from_tohit,
+            'cr_from_damage': self._scalar_cr_from_damage,
+            'cr_slope_from_hp': lambda hp: self._hp[1],
+            'cr_slope_from_ac': self._scalar_cr_slope_from_ac,
+            'cr_slope_from_tohit': self._scalar_cr_slope_from_tohit,
+            'cr_slope_from_damage': self._scalar_cr_slope_from_damage,
+        }
+        # Ordered as ClosedFormSolver.inverses
+        self.scalar_inverses = (
+            self._scalar_hp_for_cr,
+            self._scalar_ac_for_cr,
+            self._scalar_tohit_for_cr,
+            self._scalar_damage_for_cr,
+            lambda cr: self._scalar_ac_for_cr(cr) - 2,
+            lambda cr: self._scalar_tohit_for_cr(cr) + 7,
+        )
+
+    def __repr__(self):
+        # Part of the solution cache keys, see StatblockBuilder._solver_config
+        return f'CalibratedCurves(version={self.table.version}, digest={self.table.digest()})'
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(cr_curves, name)
+
+    #region cr_from_x
+    def cr_from_pb(self, pb):
+        """cr_curves.cr_from_pb with fitted coefficients"""
+        return self._pb[0] + self._pb[1]*np.asarray(pb, dtype=float)
+
+    def cr_from_hp(self, hp):
+        """cr_curves.cr_from_hp with fitted coefficients"""
+        return self._hp[0] + self._hp[1]*np.asarray(hp, dtype=float)
+
+    def cr_from_ac(self, ac):
+        """cr_curves.cr_from_ac with fitted coefficients"""
+        ac = np.asarray(ac, dtype=float)
+        return np.where(ac <= AC_BREAKPOINT, AC_LOW_CR, self._ac[0] + self._ac[1]*ac)
+
+    def cr_from_tohit(self, tohit):
+        """cr_curves.cr_from_tohit with fitted coefficients"""
+        tohit = np.asarray(tohit, dtype=float)
+        low = np.exp(self._tohit_low[0] + self._tohit_low[1]*np.minimum(tohit, TOHIT_BREAKPOINT))
+        return np.where(tohit >= TOHIT_BREAKPOINT, self._tohit[0] + self._tohit[1]*tohit, low)
+
+    def cr_from_damage(self, damage):
+        """cr_curves.cr_from_damage with fitted coefficients"""
+        damage = np.asarray(damage, dtype=float)
+        low = np.exp(
+            self._damage_low[0] + self._damage_low[1]*np.minimum(damage, DAMAGE_BREAKPOINT))
+        return np.where(
+            damage >= DAMAGE_BREAKPOINT, self._damage[0] + self._damage[1]*damage, low)
+
+    def cr_from_strong_save(self, strong_save):
+        """cr_curves.cr_from_strong_save with fitted coefficients"""
+        return self.cr_from_tohit(np.asarray(strong_save, dtype=float) - 7)
+
+    def cr_from_save_dc(self, save_dc):
+        """cr_curves.cr_from_save_dc with fitted coefficients"""
+        return self.cr_from_ac(np.asarray(save_dc, dtype=float) + 2)
+    #endregion
+
+    #region x_for_cr
+    def hp_for_cr(self, cr):
+        """Inverse of cr_from_hp"""
+        return (np.asarray(cr, dtype=float) - self._hp[0])/self._hp[1]
+
+    def ac_for_cr(self, cr):
+        """Inverse of cr_from_ac, never below AC_BREAKPOINT"""
+        return np.maximum(
+            (np.asarray(cr, dtype=float) - self._ac[0])/self._ac[1], float(AC_BREAKPOINT))
+
+    def tohit_for_cr(self, cr):
+        """Inverse of cr_from_tohit, -5 for non-positive cr"""
+        cr = np.asarray(cr, dtype=float)
+        low = (np.log(np.maximum(cr, 1e-300)) - self._tohit_low[0])/self._tohit_low[1]
+        return np.where(
+            cr >= self._tohit_switch, (cr - self._tohit[0])/self._tohit[1],
+            np.where(cr > 0, np.minimum(low, TOHIT_BREAKPOINT), -5.0))
+
+    def damage_for_cr(self, cr):
+        """Inverse of cr_from_damage, 0 for non-positive cr"""
+        cr = np.asarray(cr, dtype=float)
+        low = (np.log(np.maximum(cr, 1e-300)) - self._damage_low[0])/self._damage_low[1]
+        return np.where(
+            cr >= self._damage_switch, (cr - self._damage[0])/self._damage[1],
+            np.where(cr > 0, np.clip(low, 0.0, DAMAGE_BREAKPOINT), 0.0))
+
+    def save_dc_for_cr(self, cr):
+        """Inverse of cr_from_save_dc"""
+        return self.ac_for_cr(cr) - 2
+
+    def strong_save_for_cr(self, cr):
+        """Inverse of cr_from_strong_save"""
+        return self.tohit_for_cr(cr) + 7
+    #endregion
+
+    #region scalar
+    def _scalar_cr_from_pb(self, pb):
+        return self._pb[0] + self._pb[1]*pb
+
+    def _scalar_cr_from_hp(self, hp):
+        return self._hp[0] + self._hp[1]*hp
+
+    def _scalar_cr_from_ac(self, ac):
+        if ac <= AC_BREAKPOINT:
+            return AC_LOW_CR
+        return self._ac[0] + self._ac[1]*ac
+
+    def _scalar_cr_from_tohit(self, tohit):
+        if tohit >= TOHIT_BREAKPOINT:
+            return self._tohit[0] + self._tohit[1]*tohit
+        return math.exp(self._tohit_low[0] + self._tohit_low[1]*tohit)
+
+    def _scalar_cr_from_damage(self, damage):
+        if damage >= DAMAGE_BREAKPOINT:
+            return self._damage[0] + self._damage[1]*damage
+        return math.exp(self._damage_low[0] + self._damage_low[1]*damage)
+
+    def _scalar_cr_slope_from_ac(self, ac):
+        if ac <= AC_BREAKPOINT:
+            return 0.0
+        return self._ac[1]
+
+    def _scalar_cr_slope_from_tohit(self, tohit):
+        if tohit >= TOHIT_BREAKPOINT:
+            return self._tohit[1]
+        return self._tohit_low[1]*math.exp(self._tohit_low[0] + self._tohit_low[1]*tohit)
+
+    def _scalar_cr_slope_from_damage(self, damage):
+        if damage >= DAMAGE_BREAKPOINT:
+            return self._damage[1]
+        return self._damage_low[1]*math.exp(self._damage_low[0] + self._damage_low[1]*damage)
+
+    def _scalar_hp_for_cr(self, cr):
+        return (cr - self._hp[0])/self._hp[1]
+
+    def _scalar_ac_for_cr(self, cr):
+        return max((cr - self._ac[0])/self._ac[1], float(AC_BREAKPOINT))
+
+    def _scalar_tohit_for_cr(self, cr):
+        if cr >= self._tohit_switch:
+            return (cr - self._tohit[0])/self._tohit[1]
+        if cr > 0:
+            low = (math.log(cr) - self._tohit_low[0])/self._tohit_low[1]
+            return min(low, float(TOHIT_BREAKPOINT))
+        return -5.0
+
+    def _scalar_damage_for_cr(self, cr):
+        if cr >= self._damage_switch:
+            return (cr - self._damage[0])/self._damage[1]
+        if cr > 0:
+            low = (math.log(cr) - self._damage_low[0])/self._damage_low[1]
+            return max(min(low, float(DAMAGE_BREAKPOINT)), 0.0)
+        return 0.0
+    #endregion
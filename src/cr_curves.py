@@ -0,0 +1,191 @@
+"""Vectorized versions of the StatblockBuilder CR curves.
+
+Every function mirrors the scalar method of the same name on StatblockBuilder,
+but takes and returns NumPy arrays. The if/else branches of the scalar methods
+are replaced by np.where, so whole columns of monsters can be computed at once.
+"""
+import numpy as np
+
+#region cr_from_x
+def cr_from_pb(pb):
+    """Challenge rating computed from proficiency bonus
+
+    Args:
+        pb (ndarray): proficiency bonus
+
+    Returns:
+        ndarray: Challenge rating
+    """
+    return np.asarray(pb, dtype=float) * 4 - 6
+
+def cr_from_hp(hp):
+    """Challenge rating computed from HP
+
+    Args:
+        hp (ndarray): health points
+
+    Returns:
+        ndarray: challenge rating
+    """
+    return (np.asarray(hp, dtype=float) - 10)/15
+
+def cr_from_ac(ac):
+    """Challenge rating from armor class
+
+    Args:
+        ac (ndarray): armor class
+
+    Returns:
+        ndarray: challenge rating
+    """
+    ac = np.asarray(ac, dtype=float)
+    return np.where(ac <= 12, 0.25, (ac-12.5) * 3)
+
+def cr_from_tohit(tohit):
+    """Computes CR from tohit stat
+
+    Args:
+        tohit (ndarray): tohit stat of the statblocks
+
+    Returns:
+        ndarray: The CR corresponding to the tohit values
+    """
+    tohit = np.asarray(tohit, dtype=float)
+    return np.where(tohit >= 5, (tohit-1)/2, 0.00335 * np.exp(1.33*np.minimum(tohit, 5)))
+
+def cr_from_damage(damage):
+    """Computes CR from damage
+
+    Args:
+        damage (ndarray): damage stat
+
+    Returns:
+        ndarray: CR corresponding to the damage values
+    """
+    damage = np.asarray(damage, dtype=float)
+    return np.where(damage >= 10, (damage-1)/5, 0.043 * np.exp(0.32*np.minimum(damage, 10)))
+
+def cr_from_strong_save(strong_save):
+    """Computes CR from strong save stat
+
+    Args:
+        strong_save (ndarray): strong save stat
+
+    Returns:
+        ndarray: CR corresponding to the save stats
+    """
+    return cr_from_tohit(np.asarray(strong_save, dtype=float) - 7)
+
+def cr_from_save_dc(save_dc):
+    """Computes CR from save DC
+
+    Args:
+        save_dc (ndarray): save DC (for spells, abilities etc.)
+
+    Returns:
+        ndarray: CR corresponding to the DCs
+    """
+    return cr_from_ac(np.asarray(save_dc, dtype=float) + 2)
+#endregion
+
+#region x_from_cr
+def pb_from_cr(cr):
+    """Proficiency bonus computed from CR
+
+    Args:
+        cr (ndarray): Challenge rating of the monsters
+
+    Returns:
+        ndarray: proficiency bonus
+    """
+    cr = np.asarray(cr, dtype=float)
+    return np.where(cr < 5, 2.0, (cr+7)/4)
+
+def hp_from_cr(cr):
+    """HP computed from challenge rating
+
+    Args:
+        cr (ndarray): challenge rating
+
+    Returns:
+        ndarray: HP of the monsters
+    """
+    return 10 + 15*np.asarray(cr, dtype=float)
+
+def ac_from_cr(cr):
+    """Armor class computed from challenge rating
+
+    Args:
+        cr (ndarray): challenge rating
+
+    Returns:
+        ndarray: armor class
+    """
+    cr = np.asarray(cr, dtype=float)
+    return np.where(cr < 0.5, 12.0, np.where(cr <= 1, 13.0, 13 + 0.35*cr))
+
+def tohit_from_cr(cr):
+    """Computes tohit from cr. The log piece below CR 1 is clamped to -5, the
+    value for CR 0. Negative CRs give NaN.
+    """
+    cr = np.asarray(cr, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        low = np.maximum(0.75 * np.log(300*cr), -5.0)
+    return np.where(cr >= 1, (cr + 7)/2, np.where(cr >= 0, low, np.nan))
+
+def damage_from_cr(cr):
+    """Computes damage from CR. The log piece below CR 1 is clamped to 0, the
+    value for CR 0. Negative CRs give NaN.
+    """
+    cr = np.asarray(cr, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        low = np.maximum(3.125 * np.log(23.3 * cr), 0.0)
+    return np.where(cr >= 1, (cr+1)*5, np.where(cr >= 0, low, np.nan))
+
+def save_dc_from_cr(cr):
+    """Computes save DC from CR
+    """
+    return tohit_from_cr(cr)+7
+
+def strong_save_from_cr(cr):
+    """Computes strong saving throw from CR
+    """
+    return ac_from_cr(cr) - 11
+
+def weak_save_from_cr(cr):
+    """Computes weak saving throw from CR
+    """
+    cr = np.asarray(cr, dtype=float)
+    return np.where(cr <= 2, 0, np.where(cr <= 8, 2, 3))
+#endregion
+
+#region x_for_cr
+# Inverses of the cr_from_x curves, vectorized versions of the ones in cr_solver.
+def hp_for_cr(cr):
+    """Inverse of cr_from_hp"""
+    return 10 + 15*np.asarray(cr, dtype=float)
+
+def ac_for_cr(cr):
+    """Inverse of cr_from_ac, never below 12"""
+    return np.maximum(12.5 + np.asarray(cr, dtype=float)/3, 12.0)
+
+def tohit_for_cr(cr):
+    """Inverse of cr_from_tohit, -5 for non-positive cr"""
+    cr = np.asarray(cr, dtype=float)
+    low = np.log(np.maximum(cr, 1e-300)/0.00335)/1.33
+    return np.where(cr >= 2, 2*cr + 1, np.where(cr > 0, low, -5.0))
+
+def damage_for_cr(cr):
+    """Inverse of cr_from_damage, 0 for non-positive cr"""
+    cr = np.asarray(cr, dtype=float)
+    low = np.clip(np.log(np.maximum(cr, 1e-300)/0.043)/0.32, 0.0, 10.0)
+    return np.where(cr >= 1.8, 5*cr + 1, np.where(cr > 0, low, 0.0))
+
+def save_dc_for_cr(cr):
+    """Inverse of cr_from_save_dc"""
+    return ac_for_cr(cr) - 2
+
+def strong_save_for_cr(cr):
+    """Inverse of cr_from_strong_save"""
+    return tohit_for_cr(cr) + 7
+#endregion
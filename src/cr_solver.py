@@ -0,0 +1,281 @@
+"""Contains the ClosedFormSolver class
+"""
+import math
+
+import numpy as np
+
+class ClosedFormSolver():
+    """Solves the weighted-mean CR constraint of make_statblock_optimize directly.
+
+    The solver starts from the same DMG based guess as the scipy path. Each free
+    stat is converted to its CR with the cr_from_x curves, and all of these CRs are
+    moved by one common relative step, i.e. proportional to each CR, such that the
+    weighted mean hits the target CR. The constraint is linear in the step, so it
+    is solved directly. The stats are then found by inverting the curves, so the
+    monster keeps the shape of the DMG table. If a stat hits its bounds the closed
+    form no longer holds, and the step is found with a bisection instead.
+    Everything is done with plain floats, so a solve takes microseconds.
+
+    The solution vector has the same layout as StatblockBuilder.core_stat_names.
+    """
+    # Search interval for the common step used by the bisection.
+    step_bounds = (-10.0, 1000.0)
+    # Smallest CR used to scale the step, so stats near CR 0 can still move.
+    min_scale = 1e-4
+    max_iterations = 100
+    tolerance = 1e-9
+    # The solution only depends on the fixed stats, see solvers
+    uses_random = False
+
+    def __init__(self, builder):
+        """
+        Args:
+            builder (StatblockBuilder): Builder whose curves, weights and bounds
+                                        are used.
+        """
+        self.builder = builder
+        # One entry per stat in the objective, i.e. core_stat_names[1:7]
+        self.curves = (
+            builder.cr_from_hp,
+            builder.cr_from_ac,
+            builder.cr_from_tohit,
+            builder.cr_from_damage,
+            builder.cr_from_save_dc,
+            builder.cr_from_strong_save,
+        )
+        # Curves with fitted coefficients bring their own inverses
+        self.inverses = getattr(builder.curves, 'scalar_inverses', None) or (
+            hp_for_cr,
+            ac_for_cr,
+            tohit_for_cr,
+            damage_for_cr,
+            save_dc_for_cr,
+            strong_save_for_cr,
+        )
+        self.bounds = builder._optimize_bounds([])[1:7]
+
+    def guess(self, cr):
+        """Deterministic starting point, the DMG curves evaluated at cr.
+
+        Args:
+            cr (float): Challenge rating
+
+        Returns:
+            list: Stat vector ordered as core_stat_names.
+        """
+        hp, ac, strong_save, weak_save = self.builder.get_defensive_stats(cr, random_interval=0)
+        tohit, damage, save_dc = self.builder.get_offensive_stats(cr)
+        return [cr, hp, ac, tohit, damage, save_dc, strong_save, weak_save]
+
+    def solve(self, fixed_index, fixed_value):
+        """Finds the stats not in fixed_index such that the monster has the fixed cr.
+
+        Args:
+            fixed_index (list): Indices into core_stat_names of the fixed stats.
+                                Index 0, the cr, must be among them.
+            fixed_value (list): Values of the fixed stats.
+
+        Returns:
+            list: Full solution vector, ordered as core_stat_names.
+        """
+        fixed = dict(zip(fixed_index, fixed_value))
+        if 0 not in fixed:
+            raise ValueError('The cr must be fixed')
+        weights = self.builder.optimize_weights
+
+        x = self.guess(fixed[0])
+        for i, v in fixed.items():
+            x[i] = v
+
+        goal = fixed[0] * sum(weights)
+        free = {}
+        for j, w in enumerate(weights):
+            cr = self.curves[j](x[j + 1])
+            if j + 1 in fixed:
+                goal -= w * cr
+            else:
+                free[j] = (cr, max(cr, self.min_scale))
+
+        if free:
+            base = sum(weights[j] * cr for j, (cr, _) in free.items())
+            slope = sum(weights[j] * scale for j, (_, scale) in free.items())
+            step = (goal - base)/slope
+            if abs(self._weighted_cr(step, free) - goal) > self.tolerance:
+                step = self._bisect(free, goal)
+            for j, (cr, scale) in free.items():
+                x[j + 1] = self._stat_for_cr(j, cr + step*scale)
+
+        return x
+
+    def _stat_for_cr(self, j, cr):
+        low, high = self.bounds[j]
+        stat = self.inverses[j](cr)
+        if low is not None and stat < low:
+            return low
+        if high is not None and stat > high:
+            return high
+        return stat
+
+    def _weighted_cr(self, step, free):
+        weights = self.builder.optimize_weights
+        return sum(
+            weights[j] * self.curves[j](self._stat_for_cr(j, cr + step*scale))
+            for j, (cr, scale) in free.items()
+        )
+
+    def _bisect(self, free, goal):
+        low, high = self.step_bounds
+        if self._weighted_cr(low, free) >= goal:
+            return low
+        if self._weighted_cr(high, free) <= goal:
+            return high
+        for _ in range(self.max_iterations):
+            mid = (low + high)/2
+            if self._weighted_cr(mid, free) < goal:
+                low = mid
+            else:
+                high = mid
+            if high - low < self.tolerance:
+                break
+        return (low + high)/2
+
+    def solve_batch(self, x):
+        """Vectorized version of solve for many problems at once.
+
+        Every row is its own problem with its own fixed stats. The closed form and
+        the bisection are both done on whole columns, so the cost per row is a few
+        array operations.
+
+        Args:
+            x (ndarray): Array of shape (n, len(core_stat_names)). Fixed stats hold
+                         their value, free stats hold NaN. The cr column must be
+                         fixed in every row.
+
+        Returns:
+            ndarray: Solution array of the same shape as x.
+        """
+        x = np.array(x, dtype=float)
+        if x.ndim != 2 or x.shape[1] != len(self.builder.core_stat_names):
+            raise ValueError('x must have shape (n, len(core_stat_names))')
+        fixed = ~np.isnan(x)
+        if not fixed[:, 0].all():
+            raise ValueError('The cr must be fixed')
+        weights = np.asarray(self.builder.optimize_weights)
+
+        x = np.where(fixed, x, self._guess_batch(x[:, 0]))
+        cr = np.stack([curve(x[:, j + 1]) for j, curve in enumerate(self._batch_curves())], axis=1)
+        free = ~fixed[:, 1:7]
+
+        goal = x[:, 0] * weights.sum() - (weights * cr * ~free).sum(axis=1)
+        scale = np.maximum(cr, self.min_scale)
+        base = (weights * cr * free).sum(axis=1)
+        slope = (weights * scale * free).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(slope > 0, (goal - base)/slope, 0.0)
+
+        unsolved = np.abs(self._weighted_cr_batch(step, cr, scale, free) - goal) > self.tolerance
+        unsolved &= free.any(axis=1)
+        if unsolved.any():
+            step[unsolved] = self._bisect_batch(
+                cr[unsolved], scale[unsolved], free[unsolved], goal[unsolved])
+
+        stats = self._stats_for_cr_batch(cr + step[:, None]*scale)
+        x[:, 1:7] = np.where(free, stats, x[:, 1:7])
+        return x
+
+    def _batch_curves(self):
+        curves = self.builder.curves
+        return (
+            curves.cr_from_hp,
+            curves.cr_from_ac,
+            curves.cr_from_tohit,
+            curves.cr_from_damage,
+            curves.cr_from_save_dc,
+            curves.cr_from_strong_save,
+        )
+
+    def _batch_inverses(self):
+        curves = self.builder.curves
+        return (
+            curves.hp_for_cr,
+            curves.ac_for_cr,
+            curves.tohit_for_cr,
+            curves.damage_for_cr,
+            curves.save_dc_for_cr,
+            curves.strong_save_for_cr,
+        )
+
+    def _guess_batch(self, cr):
+        curves = self.builder.curves
+        return np.stack([
+            cr,
+            curves.hp_from_cr(cr),
+            curves.ac_from_cr(cr),
+            curves.tohit_from_cr(cr),
+            curves.damage_from_cr(cr),
+            curves.save_dc_from_cr(cr * 0.25),
+            curves.strong_save_from_cr(cr),
+            curves.weak_save_from_cr(cr),
+        ], axis=1)
+
+    def _stats_for_cr_batch(self, cr):
+        inverses = self._batch_inverses()
+        stats = np.stack([inverse(cr[:, j]) for j, inverse in enumerate(inverses)], axis=1)
+        low = [-np.inf if low is None else low for low, _ in self.bounds]
+        high = [np.inf if high is None else high for _, high in self.bounds]
+        return np.clip(stats, low, high)
+
+    def _weighted_cr_batch(self, step, cr, scale, free):
+        stats = self._stats_for_cr_batch(cr + step[:, None]*scale)
+        new_cr = np.stack(
+            [curve(stats[:, j]) for j, curve in enumerate(self._batch_curves())], axis=1)
+        return (np.asarray(self.builder.optimize_weights) * new_cr * free).sum(axis=1)
+
+    def _bisect_batch(self, cr, scale, free, goal):
+        low = np.full(len(goal), self.step_bounds[0])
+        high = np.full(len(goal), self.step_bounds[1])
+        for _ in range(self.max_iterations):
+            mid = (low + high)/2
+            below = self._weighted_cr_batch(mid, cr, scale, free) < goal
+            low = np.where(below, mid, low)
+            high = np.where(below, high, mid)
+            if (high - low < self.tolerance).all():
+                break
+        return (low + high)/2
+
+#region x_for_cr
+# Inverses of the StatblockBuilder.cr_from_x curves. Where a curve has no
+# preimage for a CR, the closest stat on the side of the jump is returned.
+def hp_for_cr(cr):
+    """Inverse of cr_from_hp"""
+    return 10 + 15*cr
+
+def ac_for_cr(cr):
+    """Inverse of cr_from_ac, never below 12"""
+    return max(12.5 + cr/3, 12.0)
+
+def tohit_for_cr(cr):
+    """Inverse of cr_from_tohit, -5 for non-positive cr"""
+    if cr >= 2:
+        return 2*cr + 1
+    if cr > 0:
+        return math.log(cr/0.00335)/1.33
+    return -5.0
+
+def damage_for_cr(cr):
+    """Inverse of cr_from_damage, 0 for non-positive cr"""
+    if cr >= 1.8:
+        return 5*cr + 1
+    if cr > 0:
+        return max(min(math.log(cr/0.043)/0.32, 10.0), 0.0)
+    return 0.0
+
+def save_dc_for_cr(cr):
+    """Inverse of cr_from_save_dc"""
+    return ac_for_cr(cr) - 2
+
+def strong_save_for_cr(cr):
+    """Inverse of cr_from_strong_save"""
+    return tohit_for_cr(cr) + 7
+#endregion
+
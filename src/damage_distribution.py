@@ -0,0 +1,216 @@
+"""Exact damage distributions of attacks.
+
+Distributions are probability mass functions over whole damage values. Sums of
+dice are built once per (n_dice, die_size) and cached, so evaluating many attacks
+with the same dice reuses them. Long convolutions are done with an FFT.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+# Above this many outcomes the dice sums are computed with an FFT
+FFT_THRESHOLD = 256
+
+def hit_chance(tohit, ac):
+    """Chance that an attack roll hits. A natural 1 always misses and a natural
+    20 always hits.
+
+    Args:
+        tohit (int): Attack bonus
+        ac (int): Armor class of the target
+
+    Returns:
+        float: Chance to hit, between 0.05 and 0.95.
+    """
+    return min(max((21 + tohit - ac) / 20, 0.05), 0.95)
+
+def _convolve(a, b):
+    if len(a) + len(b) - 1 > FFT_THRESHOLD:
+        n = len(a) + len(b) - 1
+        res = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)
+        # Rounding errors of the FFT can leave tiny negative values
+        return np.maximum(res, 0)
+    return np.convolve(a, b)
+
+@lru_cache(maxsize=1024)
+def dice_pmf(n_dice, die_size):
+    """Distribution of the sum of n_dice dice with die_size faces.
+
+    Args:
+        n_dice (int): Number of dice
+        die_size (int): Faces per die
+
+    Returns:
+        ndarray: Read only array, entry k is the chance to roll a sum of
+                 n_dice + k.
+    """
+    if n_dice <= 0 or die_size <= 0:
+        pmf = np.ones(1)
+    elif n_dice == 1:
+        pmf = np.full(die_size, 1 / die_size)
+    else:
+        # Built from the cached halves, so dice_pmf(2n) reuses dice_pmf(n)
+        half = n_dice // 2
+        pmf = _convolve(dice_pmf(half, die_size), dice_pmf(n_dice - half, die_size))
+        pmf /= pmf.sum()
+    pmf.setflags(write=False)
+    return pmf
+
+class DamageDistribution():
+    """Distribution of a whole number amount of damage.
+
+    Attributes:
+        pmf (ndarray): Entry k is the chance to deal offset + k damage.
+        offset (int): Smallest damage value with an entry in pmf.
+    """
+
+    def __init__(self, pmf, offset=0):
+        self.pmf = np.asarray(pmf, dtype=float)
+        self.offset = offset
+
+    def __add__(self, other):
+        """Distribution of the sum of two independent damage rolls."""
+        return DamageDistribution(_convolve(self.pmf, other.pmf), self.offset + other.offset)
+
+    @property
+    def values(self):
+        """Damage values the entries of pmf belong to"""
+        return np.arange(self.offset, self.offset + len(self.pmf))
+
+    def mean(self):
+        """Expected damage"""
+        return float(self.pmf @ self.values)
+
+    def var(self):
+        """Variance of the damage"""
+        values = self.values
+        return float(self.pmf @ values**2 - (self.pmf @ values)**2)
+
+    def std(self):
+        """Standard deviation of the damage"""
+        return self.var()**0.5
+
+    def cdf(self, damage):
+        """Chance to deal at most damage.
+
+        Args:
+            damage (int): Damage value
+
+        Returns:
+            float: P(X <= damage)
+        """
+        i = int(np.floor(damage)) - self.offset
+        if i < 0:
+            return 0.0
+        return float(self.pmf[:i + 1].sum())
+
+    def sf(self, damage):
+        """Chance to deal at least damage.
+
+        Args:
+            damage (int): Damage value
+
+        Returns:
+            float: P(X >= damage)
+        """
+        i = int(np.ceil(damage)) - self.offset
+        if i <= 0:
+            return 1.0
+        return float(self.pmf[i:].sum())
+
+    def percentile(self, q):
+        """Smallest damage value whose cdf reaches q percent.
+
+        Args:
+            q (float or array): Percentile(s), 0 to 100.
+
+        Returns:
+            int or ndarray: Damage value(s)
+        """
+        cdf = np.cumsum(self.pmf)
+        i = np.searchsorted(cdf, np.asarray(q) / 100 - 1e-12)
+        res = self.offset + np.minimum(i, len(self.pmf) - 1)
+        return int(res) if np.ndim(res) == 0 else res
+
+    def repeat(self, n):
+        """Distribution of the total of n independent rolls, e.g. n rounds.
+
+        Args:
+            n (int): Number of rolls, at least 0.
+
+        Returns:
+            DamageDistribution: The total
+        """
+        res = DamageDistribution(np.ones(1))
+        power = self
+        while n > 0:
+            if n & 1:
+                res = res + power
+            n >>= 1
+            if n:
+                power = power + power
+        return res
+
+    def kill_chance(self, hp, rounds=1):
+        """Chance to deal at least hp damage within a number of rounds.
+
+        Args:
+            hp (int): Hit points of the target
+            rounds (int, optional): Rounds of attacks. Defaults to 1.
+
+        Returns:
+            float: The chance
+        """
+        return self.repeat(rounds).sf(hp)
+
+@lru_cache(maxsize=4096)
+def _attack_pmf(n_dice, die_size, modifier, n_attacks, p_hit, p_crit):
+    base = dice_pmf(n_dice, die_size)
+    # One attack: a miss deals 0, a hit the dice plus modifier and a crit the
+    # dice twice plus modifier, never less than 0.
+    hit_pmfs = [(p_hit - p_crit, base, n_dice)]
+    if p_crit > 0:
+        hit_pmfs.append((p_crit, dice_pmf(2 * n_dice, die_size), 2 * n_dice))
+
+    size = 2 * n_dice * max(die_size, 1) + max(modifier, 0) + 1
+    single = np.zeros(size)
+    single[0] = 1 - p_hit
+    for p, pmf, low in hit_pmfs:
+        damage = np.arange(low, low + len(pmf)) + modifier
+        np.add.at(single, np.maximum(damage, 0), p * pmf)
+
+    total = DamageDistribution(single).repeat(n_attacks).pmf
+    total.setflags(write=False)
+    return total
+
+def attack_distribution(attack, ac=None, crits=True):
+    """Distribution of the damage an Attack deals in one round, with all of its
+    n_attacks.
+
+    Args:
+        attack (Attack): The attack
+        ac (int, optional): Armor class of the target. Defaults to None, every
+                            attack hits, as in Attack.get_avg_damage.
+        crits (bool, optional): Whether a natural 20 doubles the dice. Only used
+                            if ac is given. Defaults to True.
+
+    Returns:
+        DamageDistribution: Damage per round
+    """
+    if ac is None:
+        p_hit, p_crit = 1.0, 0.0
+    else:
+        p_hit, p_crit = hit_chance(attack.tohit, ac), (0.05 if crits else 0.0)
+    pmf = _attack_pmf(
+        int(attack.n_dice), int(attack.die_size), int(attack.modifier),
+        int(attack.n_attacks), p_hit, p_crit
+    )
+    return DamageDistribution(pmf)
+
+def cache_info():
+    """Cache statistics of the dice and attack distributions.
+
+    Returns:
+        dict: {'dice': CacheInfo, 'attacks': CacheInfo}
+    """
+    return {'dice': dice_pmf.cache_info(), 'attacks': _attack_pmf.cache_info()}
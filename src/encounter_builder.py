@@ -0,0 +1,278 @@
+"""Contains the EncounterBuilder class
+"""
+import numpy as np
+
+from statblock_table import StatblockTable
+
+# XP by CR, DMG p.274
+XP_BY_CR = {
+    0: 10, 0.125: 25, 0.25: 50, 0.5: 100, 1: 200, 2: 450, 3: 700, 4: 1100,
+    5: 1800, 6: 2300, 7: 2900, 8: 3900, 9: 5000, 10: 5900, 11: 7200, 12: 8400,
+    13: 10000, 14: 11500, 15: 13000, 16: 15000, 17: 18000, 18: 20000,
+    19: 22000, 20: 25000, 21: 33000, 22: 41000, 23: 50000, 24: 62000,
+    25: 75000, 26: 90000, 27: 105000, 28: 120000, 29: 135000, 30: 155000,
+}
+# XP thresholds per character by level, easy/medium/hard/deadly, DMG p.82
+XP_THRESHOLDS = {
+    1: (25, 50, 75, 100), 2: (50, 100, 150, 200), 3: (75, 150, 225, 400),
+    4: (125, 250, 375, 500), 5: (250, 500, 750, 1100), 6: (300, 600, 900, 1400),
+    7: (350, 750, 1100, 1700), 8: (450, 900, 1400, 2100), 9: (550, 1100, 1600, 2400),
+    10: (600, 1200, 1900, 2800), 11: (800, 1600, 2400, 3600), 12: (1000, 2000, 3000, 4500),
+    13: (1100, 2200, 3400, 5100), 14: (1250, 2500, 3800, 5700), 15: (1400, 2800, 4300, 6400),
+    16: (1600, 3200, 4800, 7200), 17: (2000, 3900, 5900, 8800), 18: (2100, 4200, 6300, 9500),
+    19: (2400, 4900, 7300, 10900), 20: (2800, 5700, 8500, 12700),
+}
+DIFFICULTIES = ('easy', 'medium', 'hard', 'deadly')
+# Encounter multipliers by number of monsters, DMG p.82. The first entry is the
+# extra step for parties of 6 or more, the last for parties of fewer than 3.
+MULTIPLIERS = (0.5, 1, 1.5, 2, 2.5, 3, 4, 5)
+
+_CRS = np.array(list(XP_BY_CR), dtype=float)
+_XPS = np.array(list(XP_BY_CR.values()), dtype=float)
+
+def xp_from_cr(cr):
+    """XP of a monster. CRs between the table entries are interpolated, as
+    generated monsters do not always have one of the standard CRs.
+
+    Args:
+        cr (float or ndarray): Challenge rating
+
+    Returns:
+        float or ndarray: XP
+    """
+    return np.interp(cr, _CRS, _XPS)
+
+def encounter_multiplier(n_monsters, party_size=4):
+    """Multiplier for the XP of an encounter with several monsters.
+
+    Args:
+        n_monsters (int): Number of monsters
+        party_size (int, optional): Number of characters. Defaults to 4.
+
+    Returns:
+        float: The multiplier
+    """
+    if n_monsters <= 1:
+        step = 1
+    elif n_monsters == 2:
+        step = 2
+    elif n_monsters <= 6:
+        step = 3
+    elif n_monsters <= 10:
+        step = 4
+    elif n_monsters <= 14:
+        step = 5
+    else:
+        step = 6
+    if party_size < 3:
+        step += 1
+    elif party_size >= 6:
+        step -= 1
+    return MULTIPLIERS[step]
+
+def xp_thresholds(party_levels):
+    """XP thresholds of a party.
+
+    Args:
+        party_levels (list): Level of every character.
+
+    Returns:
+        dict: {difficulty: XP threshold}
+    """
+    totals = np.sum([XP_THRESHOLDS[level] for level in party_levels], axis=0)
+    return dict(zip(DIFFICULTIES, totals.tolist()))
+
+class Encounter():
+    """A group of monsters from the pool of an EncounterBuilder.
+
+    Attributes:
+        rows (list): Rows of the monsters in the pool, repeated for monsters that
+                     appear more than once.
+        xp (float): Total XP of the monsters.
+        adjusted_xp (float): XP times the encounter multiplier.
+        difficulty (str): Difficulty for the party, 'trivial' below easy.
+    """
+
+    def __init__(self, rows, xp, adjusted_xp, difficulty, pool):
+        self.rows = rows
+        self.xp = xp
+        self.adjusted_xp = adjusted_xp
+        self.difficulty = difficulty
+        self.pool = pool
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return (f'<Encounter of {len(self.rows)} monsters, {self.adjusted_xp:.0f} adjusted XP, '
+                f'{self.difficulty}>')
+
+    @property
+    def statblocks(self):
+        """The monsters as Statblock objects"""
+        return [self.pool[i] for i in self.rows]
+
+class EncounterBuilder():
+    """Picks groups of monsters from a large pool that fit a party's XP budget.
+
+    The pool is bucketed by XP once. A query filters the pool, then runs a
+    knapsack style dynamic program over the XP buckets: for every number of
+    monsters it finds which totals of XP are reachable. The totals closest to the
+    budget, after the encounter multiplier, give the top-k encounters, and every
+    slot is filled with a monster drawn from its bucket. The work depends on the
+    budget resolution and the number of distinct XP values, not on the size of
+    the pool.
+
+    Example:
+        builder = EncounterBuilder(table)
+        builder.build([5, 5, 5, 5], 'hard', k=3, damage_types=[DamageType.FIRE])
+    """
+
+    def __init__(self, pool, tags=None, resolution=400):
+        """
+        Args:
+            pool (StatblockTable or list): The monsters to choose from.
+            tags (list, optional): A set of tags per monster, e.g. {'undead'}.
+                                   Defaults to None, no tags.
+            resolution (int, optional): Number of steps the XP budget is divided
+                                   into for the search. Defaults to 400.
+        """
+        if not isinstance(pool, StatblockTable):
+            pool = StatblockTable.from_statblocks(pool)
+        self.pool = pool
+        self.resolution = resolution
+        self.xp = xp_from_cr(pool['cr'].astype(float))
+        self.damage_type = pool['damage_type'] if 'damage_type' in pool.names else None
+
+        self.tag_index = {}
+        if tags is not None:
+            if len(tags) != len(pool):
+                raise ValueError('tags must have one entry per monster')
+            for i, monster_tags in enumerate(tags):
+                for tag in monster_tags:
+                    self.tag_index.setdefault(tag, []).append(i)
+            self.tag_index = {tag: np.array(rows) for tag, rows in self.tag_index.items()}
+
+    def candidates(self, damage_types=None, tags=None, cr_range=None):
+        """Rows of the pool that pass the filters.
+
+        Args:
+            damage_types (list, optional): DamageType values of the basic attack.
+            tags (list, optional): Tags every monster must have.
+            cr_range (tuple, optional): Inclusive (low, high) CR bounds.
+
+        Returns:
+            ndarray: Row indices
+        """
+        mask = np.ones(len(self.pool), dtype=bool)
+        if damage_types is not None:
+            codes = [self.pool.damage_types.index(dt) for dt in damage_types]
+            mask &= np.isin(self.damage_type, codes)
+        for tag in tags or ():
+            tagged = np.zeros(len(self.pool), dtype=bool)
+            tagged[self.tag_index.get(tag, [])] = True
+            mask &= tagged
+        if cr_range is not None:
+            cr = self.pool['cr']
+            mask &= (cr >= cr_range[0]) & (cr <= cr_range[1])
+        return np.flatnonzero(mask)
+
+    def build(self, party_levels, difficulty='medium', k=5, max_monsters=8, seed=None, **filters):
+        """Finds the k encounters whose adjusted XP is closest to the party's
+        threshold for a difficulty.
+
+        Args:
+            party_levels (list): Level of every character.
+            difficulty (str, optional): One of DIFFICULTIES. Defaults to 'medium'.
+            k (int, optional): Number of encounters. Defaults to 5.
+            max_monsters (int, optional): Most monsters per encounter. Defaults to 8.
+            seed (int, optional): Seed for picking monsters within a bucket.
+            **filters: damage_types, tags and cr_range, see candidates.
+
+        Returns:
+            list: Up to k Encounter objects, best first. Each has a different
+                  number of monsters or total XP.
+        """
+        thresholds = xp_thresholds(party_levels)
+        budget = thresholds[difficulty]
+        # Encounters at or above the next threshold are of a harder difficulty
+        harder = DIFFICULTIES[DIFFICULTIES.index(difficulty) + 1:]
+        ceiling = thresholds[harder[0]] if harder else np.inf
+        rows = self.candidates(**filters)
+        if len(rows) == 0:
+            return []
+
+        # XP in units of the budget resolution. Monsters above twice the budget
+        # can never be a good fit.
+        unit = budget / self.resolution
+        weights = np.maximum(np.rint(self.xp[rows] / unit).astype(np.int64), 1)
+        keep = weights <= 2 * self.resolution
+        rows, weights = rows[keep], weights[keep]
+        if len(rows) == 0:
+            return []
+        bucket_weights, bucket_of_row = np.unique(weights, return_inverse=True)
+
+        reach = self._reachable(bucket_weights, max_monsters, 2 * self.resolution)
+        multipliers = np.array([encounter_multiplier(n, len(party_levels))
+                                for n in range(1, max_monsters + 1)])
+
+        # Every reachable (number of monsters, total) pair, ranked by distance to
+        # the budget after the multiplier. Pairs of the requested difficulty come
+        # first, then easier ones, and pairs of a harder difficulty last.
+        n_idx, totals = np.nonzero(reach)
+        adjusted = totals * unit * multipliers[n_idx]
+        # The XP of the drawn monsters differs from the bucket XP by up to half a
+        # unit, so a few more candidates are built and ranked again.
+        best = np.lexsort((np.abs(adjusted - budget), adjusted < budget,
+                           adjusted >= ceiling))[:2 * k]
+
+        rng = np.random.default_rng(seed)
+        bucket_rows = [rows[bucket_of_row == b] for b in range(len(bucket_weights))]
+        encounters = []
+        for i in best.tolist():
+            buckets = self._backtrack(reach, bucket_weights, n_idx[i], totals[i])
+            chosen = [int(rng.choice(bucket_rows[b])) for b in buckets]
+            xp = float(self.xp[chosen].sum())
+            adjusted_xp = xp * multipliers[n_idx[i]]
+            encounters.append(Encounter(
+                chosen, xp, adjusted_xp, self._difficulty(adjusted_xp, thresholds), self.pool))
+        encounters.sort(key=lambda e: (e.adjusted_xp >= ceiling, e.adjusted_xp < budget,
+                                       abs(e.adjusted_xp - budget)))
+        return encounters[:k]
+
+    @staticmethod
+    def _reachable(bucket_weights, max_monsters, capacity):
+        # reach[n - 1, s] is True if n monsters can be worth s. Adding a monster is
+        # a convolution with the indicator of the bucket weights.
+        indicator = np.zeros(capacity + 1)
+        indicator[bucket_weights] = 1
+        reach = np.zeros((max_monsters, capacity + 1), dtype=bool)
+        previous = indicator > 0
+        for n in range(max_monsters):
+            if n > 0:
+                previous = np.convolve(previous, indicator)[:capacity + 1] > 0.5
+            reach[n] = previous
+        return reach
+
+    @staticmethod
+    def _backtrack(reach, bucket_weights, n_idx, total):
+        # At every step takes the bucket closest to an even share of the rest
+        # that still leaves a reachable rest, so monsters are of similar strength
+        buckets = []
+        for n in range(n_idx, 0, -1):
+            rest = total - bucket_weights
+            ok = (rest >= 0) & reach[n - 1][np.maximum(rest, 0)]
+            share = np.where(ok, np.abs(bucket_weights - total / (n + 1)), np.inf)
+            b = np.argmin(share)
+            buckets.append(int(b))
+            total = rest[b]
+        buckets.append(int(np.searchsorted(bucket_weights, total)))
+        return buckets
+
+    @staticmethod
+    def _difficulty(adjusted_xp, thresholds):
+        label = 'trivial'
+        for difficulty in DIFFICULTIES:
+            if adjusted_xp >= thresholds[difficulty]:
+                label = difficulty
+        return label
@@ -0,0 +1,261 @@
+"""Contains the Instrumentation class
+"""
+import cProfile
+import functools
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+from statblock import Statblock
+
+class Instrumentation():
+    """Opt-in timers and counters for the hot paths of a StatblockBuilder.
+
+    While attached, the builder's split_cr, get_defensive_stats,
+    get_offensive_stats, make_attack and make_statblock methods, the solve methods
+    of its solvers and Statblock.format are wrapped with timers. For the scipy
+    solver the iterations, function evaluations, largest cr error and convergence
+    status of every solve are counted as well. Nothing is wrapped while detached, so builders
+    that are not instrumented run at full speed.
+
+    Statblock.format is patched on the class, so it is timed for every Statblock
+    while attached, not only the ones made by the instrumented builder.
+
+    With profile=True the attached period also runs under cProfile, and with
+    trace_memory=True under tracemalloc. Both slow the code down considerably,
+    so timings taken with them are only useful relative to each other.
+
+    Example:
+        with Instrumentation(builder) as inst:
+            for cr in range(1, 21):
+                builder.make_statblock_optimize(cr, solver='scipy').format()
+        print(inst.to_json())
+    """
+    builder_methods = (
+        'split_cr', 'get_defensive_stats', 'get_offensive_stats', 'make_attack',
+        'make_statblock_basic', 'make_statblock_optimize',
+        'make_statblocks_basic', 'make_statblocks_optimize',
+    )
+
+    def __init__(self, builder=None, profile=False, trace_memory=False, top=20):
+        """
+        Args:
+            builder (StatblockBuilder, optional): Builder attached by the with
+                                    statement. Defaults to None.
+            profile (bool, optional): Run cProfile while attached. Defaults to False.
+            trace_memory (bool, optional): Run tracemalloc while attached.
+                                    Defaults to False.
+            top (int, optional):    Number of functions and allocation sites in
+                                    the summary. Defaults to 20.
+        """
+        self.builder = builder
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.top = top
+        self.timers = {}
+        self.solver_stats = {}
+        self.reset()
+        self._patched = []
+        self._profiler = None
+        self._started_tracemalloc = False
+        self._memory = None
+        self._start_time = None
+
+    def reset(self):
+        """Clears all timers and counters. Works while attached, too."""
+        # The wrappers hold on to their entries, so they are cleared in place.
+        # Timers are name: [calls, total seconds, max seconds]
+        for stats in self.timers.values():
+            stats[:] = [0, 0.0, 0.0]
+        for counts in self.solver_stats.values():
+            counts.update(solves=0, failures=0, iterations=0, function_evaluations=0,
+                          max_iterations=0, max_cr_error=0.0, messages={})
+        self.elapsed = 0.0
+        self._profile_stats = None
+
+    def __enter__(self):
+        if self.builder is None:
+            raise ValueError('No builder to attach')
+        self.attach(self.builder)
+        return self
+
+    def __exit__(self, *exc):
+        self.detach()
+
+    #region attaching
+    def attach(self, builder):
+        """Starts timing the builder's methods. Call detach to stop.
+
+        Args:
+            builder (StatblockBuilder): The builder
+        """
+        if self._patched:
+            raise RuntimeError('Instrumentation is already attached')
+        self.builder = builder
+        for name in self.builder_methods:
+            self._patch(builder, name, self._timed(name, getattr(builder, name)))
+        for name, solver in builder._solvers.items():
+            self._patch_solver(name, solver)
+        get_solver = builder.get_solver
+        @functools.wraps(get_solver)
+        def instrumented_get_solver(name):
+            known = name in builder._solvers
+            solver = get_solver(name)
+            if not known:
+                self._patch_solver(name, solver)
+            return solver
+        self._patch(builder, 'get_solver', instrumented_get_solver)
+        self._patch(Statblock, 'format', self._timed('Statblock.format', Statblock.format))
+
+        if self.trace_memory:
+            self._started_tracemalloc = not tracemalloc.is_tracing()
+            if self._started_tracemalloc:
+                tracemalloc.start()
+            if hasattr(tracemalloc, 'reset_peak'): # Python 3.9+
+                tracemalloc.reset_peak()
+            self._memory = tracemalloc.get_traced_memory()[0]
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start_time = time.perf_counter()
+
+    def detach(self):
+        """Stops timing and restores the original methods."""
+        if not self._patched:
+            return
+        self.elapsed += time.perf_counter() - self._start_time
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profile_stats = self._profile_summary(self._profiler)
+            self._profiler = None
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self._memory = {
+                'net_bytes': current - self._memory,
+                'peak_bytes': peak - self._memory,
+                'top_allocations': [
+                    {'where': str(stat.traceback[0]), 'bytes': stat.size, 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:self.top]
+                ],
+            }
+        # Undo in reverse, so a method patched twice ends up as the original
+        for owner, name, original in reversed(self._patched):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._patched = []
+
+    def _patch(self, owner, name, replacement):
+        # Instance attributes that shadow a class method are removed on detach
+        # instead of being set to the bound method.
+        original = owner.__dict__.get(name)
+        self._patched.append((owner, name, original))
+        setattr(owner, name, replacement)
+
+    def _patch_solver(self, name, solver):
+        solve = self._timed(f'solve.{name}', solver.solve)
+        if not hasattr(solver, 'last_result'):
+            self._patch(solver, 'solve', solve)
+            return
+        counts = self.solver_stats.setdefault(name, {
+            'solves': 0, 'failures': 0, 'iterations': 0, 'function_evaluations': 0,
+            'max_iterations': 0, 'max_cr_error': 0.0, 'messages': {},
+        })
+        @functools.wraps(solve)
+        def solve_with_result(*args, **kwargs):
+            x = solve(*args, **kwargs)
+            result = solver.last_result
+            nit = int(getattr(result, 'nit', 0))
+            counts['solves'] += 1
+            counts['failures'] += not result.success
+            counts['iterations'] += nit
+            counts['function_evaluations'] += int(getattr(result, 'nfev', 0))
+            counts['max_iterations'] = max(counts['max_iterations'], nit)
+            cr_error = abs(float(getattr(result, 'cr_error', 0.0)))
+            counts['max_cr_error'] = max(counts['max_cr_error'], cr_error)
+            message = str(result.message)
+            counts['messages'][message] = counts['messages'].get(message, 0) + 1
+            return x
+        self._patch(solver, 'solve', solve_with_result)
+
+    def _timed(self, name, func):
+        stats = self.timers.setdefault(name, [0, 0.0, 0.0])
+        perf_counter = time.perf_counter
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+        return wrapper
+    #endregion
+
+    #region summary
+    def summary(self):
+        """Summary of the timers and counters since the last reset.
+
+        Times are inclusive, e.g. make_statblock_basic includes the time spent
+        in split_cr. Timers that were never called are left out.
+
+        Returns:
+            dict: {'elapsed_s', 'timers': {name: {'calls', 'total_s', 'mean_us',
+                  'max_us'}}, 'solvers': {name: counts}}, plus 'profile' and
+                  'memory' in the capture modes.
+        """
+        summary = {
+            'elapsed_s': self.elapsed,
+            'timers': {
+                name: {
+                    'calls': calls,
+                    'total_s': total,
+                    'mean_us': total / calls * 1e6,
+                    'max_us': longest * 1e6,
+                }
+                for name, (calls, total, longest) in self.timers.items() if calls
+            },
+            'solvers': {
+                name: dict(counts, mean_iterations=counts['iterations'] / counts['solves'])
+                for name, counts in self.solver_stats.items() if counts['solves']
+            },
+        }
+        if self._profile_stats is not None:
+            summary['profile'] = self._profile_stats
+        if isinstance(self._memory, dict):
+            summary['memory'] = self._memory
+        return summary
+
+    def to_json(self, indent=1):
+        """The summary as a JSON string.
+
+        Args:
+            indent (int, optional): JSON indent. Defaults to 1.
+
+        Returns:
+            str: JSON text
+        """
+        return json.dumps(self.summary(), indent=indent)
+
+    def _profile_summary(self, profiler):
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            rows.append({
+                'function': f'{filename}:{line}({function})',
+                'calls': calls,
+                'own_s': own,
+                'cumulative_s': cumulative,
+            })
+        rows.sort(key=lambda row: row['cumulative_s'], reverse=True)
+        return rows[:self.top]
+    #endregion
@@ -11,8 +11,10 @@ print(sb.format())
 # Create a statblock using the optimization feature, this one has an AC of 17
 sb = SBB.make_statblock_optimize(11, {'ac':17})
 
-# This uses scipy's optimization library to make a suitable statblock.
-# Tends to not make very balanced stats.
+# By default the cr constraint is solved directly, which keeps the stats close
+# to the DMG table. solver='scipy' uses scipy's optimization library instead,
+# which trades the cr error against the distance from the DMG table, see
+# StatblockBuilder.optimize_balance.
 
 # print(sb)
 # print(sb.attributes)
@@ -0,0 +1,137 @@
+"""Contains the SolutionCache class
+"""
+from collections import OrderedDict
+import shelve
+import threading
+
+class SolutionCache():
+    """Memoizes solved stat vectors of StatblockBuilder.make_statblock_optimize.
+
+    Entries are kept in a bounded in-memory LRU. If a path is given, every solved
+    vector is also written to a shelve file, which is checked on a memory miss, so
+    a restarted process can skip the solver for anything it has seen before.
+
+    Only the stat vectors are stored. The Statblock and Attack objects are built
+    fresh for every call, so callers never share mutable state.
+    """
+
+    def __init__(self, maxsize=1024, path=None):
+        """
+        Args:
+            maxsize (int, optional): Max number of entries kept in memory.
+                                     Defaults to 1024.
+            path (str, optional):    File for the persistent store. Defaults to
+                                     None, i.e. memory only.
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = shelve.open(path) if path is not None else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def make_key(solver, fixed_index, fixed_value, seed=None, config=None):
+        """Normalized cache key for one optimize call.
+
+        Args:
+            solver (str): Name of the solver used.
+            fixed_index (list): Indices into core_stat_names of the fixed stats.
+            fixed_value (list): Values of the fixed stats.
+            seed (int, optional): Seed of the call. Defaults to None.
+            config (tuple, optional): Builder and solver settings that change the
+                                      solution, e.g. the curves and weights.
+                                      Its repr must be stable. Defaults to None.
+
+        Returns:
+            str: Key that is equal for equal problems, e.g. for 5 and 5.0.
+        """
+        fixed = sorted((int(i), float(v)) for i, v in zip(fixed_index, fixed_value))
+        return repr((solver, tuple(fixed), seed, config))
+
+    def get(self, key):
+        """Looks up a solution vector, first in memory and then on disk.
+
+        Args:
+            key (str): Key from make_key
+
+        Returns:
+            list: Copy of the stored solution vector, or None on a miss.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(self._entries[key])
+
+            if self._store is not None and key in self._store:
+                value = self._store[key]
+                self._insert(key, value)
+                self.disk_hits += 1
+                return list(value)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Stores a solution vector.
+
+        Args:
+            key (str): Key from make_key
+            value (list): Solution vector, ordered as core_stat_names.
+        """
+        value = tuple(float(v) for v in value)
+        with self._lock:
+            self._insert(key, value)
+            if self._store is not None:
+                self._store[key] = value
+
+    def _insert(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the in-memory cache and resets the counters. The on-disk store
+        is left as is.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def info(self):
+        """Summary of the cache usage.
+
+        Returns:
+            dict: hits, disk_hits, misses, size and maxsize.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+    def close(self):
+        """Closes the on-disk store, if any.
+        """
+        if self._store is not None:
+            self._store.close()
+            self._store = None
@@ -0,0 +1,153 @@
+"""Registry of solver backends for StatblockBuilder.make_statblock_optimize.
+
+A backend is registered under a name with a factory that takes the builder and
+returns an object with a solve(fixed_index, fixed_value) method. solve returns the
+full solution vector, ordered as StatblockBuilder.core_stat_names. A solver whose
+result does not depend on the builder's random draws sets uses_random = False, so
+its solutions are cached for any seed. Solvers without the attribute are treated
+as random.
+
+Heavy dependencies must be imported inside the backend, never at module level,
+so importing the builder stays fast for callers that never use them.
+"""
+import numpy as np
+
+from cr_solver import ClosedFormSolver
+
+_solver_factories = {}
+
+def register_solver(name, factory):
+    """Registers a solver backend.
+
+    Args:
+        name (str): Name used for the solver argument of make_statblock_optimize.
+        factory (callable): Called with the builder, returns the solver.
+    """
+    _solver_factories[name] = factory
+
+def solver_names():
+    """Names of all registered solvers.
+
+    Returns:
+        list: Solver names
+    """
+    return list(_solver_factories)
+
+def make_solver(name, builder):
+    """Makes the solver registered under name for a builder.
+
+    Args:
+        name (str): Solver name
+        builder (StatblockBuilder): Builder the solver works for.
+
+    Returns:
+        object: Solver with a solve(fixed_index, fixed_value) method.
+    """
+    if name not in _solver_factories:
+        raise ValueError(f'Unknown solver {name}')
+    return _solver_factories[name](builder)
+
+class ScipySolver():
+    """Solves make_statblock_optimize with scipy.optimize.minimize, starting from
+    the builder's DMG based guess. scipy is imported when the solver is made.
+
+    By default it minimizes the builder's smooth objective, the squared cr error
+    plus a pull towards the guess, with its exact gradient. objective='abs'
+    minimizes the absolute cr error with finite difference gradients instead.
+
+    The OptimizeResult of the latest solve is kept in last_result, with the
+    remaining cr error in last_result.cr_error, so callers can check the
+    iterations, function evaluations and convergence status, see diagnostics.
+    """
+    # The guess deviates randomly, see StatblockBuilder.get_defensive_stats
+    uses_random = True
+
+    def __init__(self, builder, objective='smooth'):
+        """
+        Args:
+            builder (StatblockBuilder): Builder whose curves, guess and bounds
+                                        are used.
+            objective (str, optional): 'smooth' or 'abs'. Defaults to 'smooth'.
+        """
+        from scipy import optimize # pylint: disable=import-outside-toplevel
+        if objective not in ('smooth', 'abs'):
+            raise ValueError(f'Unknown objective {objective}')
+        self.optimize = optimize
+        self.builder = builder
+        self.objective = objective
+        self.last_result = None
+
+    def solve(self, fixed_index, fixed_value):
+        """Finds the stats not in fixed_index such that the monster has the fixed cr.
+
+        Args:
+            fixed_index (list): Indices into core_stat_names of the fixed stats.
+                                Index 0, the cr, must be among them.
+            fixed_value (list): Values of the fixed stats.
+
+        Returns:
+            list: Full solution vector, ordered as core_stat_names.
+        """
+        builder = self.builder
+        cr = fixed_value[fixed_index.index(0)]
+        guess = builder._optimize_guess(cr)
+        x = list(guess)
+        for i in sorted(fixed_index, reverse=True):
+            del x[i]
+        bounds = builder._optimize_bounds(fixed_index)
+
+        if self.objective == 'smooth':
+            # Steps are taken relative to the guess, so hp and ac are on a
+            # similar scale, which saves most of the iterations.
+            x = np.array(x)
+            scale = np.maximum(np.abs(x), 1.0)
+            def objective(z):
+                value, grad = builder._optimize_smooth_objective(
+                    x + scale*z, fixed_index, fixed_value, guess)
+                return value, grad*scale
+            bounds = [
+                (None if lo is None else (lo - v)/step, None if hi is None else (hi - v)/step)
+                for (lo, hi), v, step in zip(bounds, x, scale)
+            ]
+            sol = self.optimize.minimize(
+                objective, np.zeros(len(x)), method='L-BFGS-B', jac=True, bounds=bounds,
+                tol=1e-12)
+            sol.x = x + scale*sol.x
+        else:
+            sol = self.optimize.minimize(
+                builder._optimize_objective_function,
+                x,
+                (fixed_index, fixed_value),
+                bounds=bounds,
+                tol=0.0001
+            )
+        sol.cr_error = builder._optimize_cr_error(sol.x, fixed_index, fixed_value)
+        self.last_result = sol
+        sol = list(sol.x)
+        for i, v in zip(fixed_index, fixed_value):
+            sol.insert(i, v)
+        return sol
+
+    def diagnostics(self):
+        """Convergence of the latest solve.
+
+        Returns:
+            dict: success, message, iterations, function_evaluations,
+                  gradient_evaluations, objective and cr_error, the target cr
+                  minus the cr of the solution. None before the first solve.
+        """
+        result = self.last_result
+        if result is None:
+            return None
+        return {
+            'success': bool(result.success),
+            'message': str(result.message),
+            'iterations': int(getattr(result, 'nit', 0)),
+            'function_evaluations': int(getattr(result, 'nfev', 0)),
+            'gradient_evaluations': int(getattr(result, 'njev', 0)),
+            'objective': float(result.fun),
+            'cr_error': float(result.cr_error),
+        }
+
+register_solver('closed_form', ClosedFormSolver)
+register_solver('scipy', ScipySolver)
@@ -0,0 +1,187 @@
+"""Contains the StatGrid class
+"""
+import numpy as np
+
+from statblock_builder import StatblockBuilder
+
+class StatGrid():
+    """Precomputed balanced stat vectors for nearest neighbor lookups.
+
+    The grid covers CRs in fine steps. For every CR it holds the balanced vector
+    of the closed form solver and a number of solutions with one or two stats
+    locked to values around the DMG guess. A query with locked stats is answered
+    by the grid point closest to them, using a KD-tree over the cr and the locked
+    stats, instead of solving the problem.
+
+    Stats are scaled by their spread over the grid, and the cr by an extra factor,
+    so matches stay close in cr first. Trees are built on first use for every set
+    of locked stats, which takes some tens of milliseconds. scipy is needed for
+    the trees and imported when the first one is built.
+
+    Example:
+        grid = StatGrid.build(seed=0)
+        grid.save('grid.npz')
+        grid = StatGrid.load('grid.npz')
+        sb = grid.make_statblock(11, {'ac': 17, 'damage': 60})
+    """
+    stat_names = StatblockBuilder.core_stat_names
+    # Stats that are locked to make the variations of the balanced vector
+    varied_stats = ('hp', 'ac', 'tohit', 'damage', 'save_dc')
+    # The CRs of the DMG, every one of them is a grid cr
+    dmg_crs = (0, 0.125, 0.25, 0.5) + tuple(range(1, 31))
+
+    def __init__(self, points, balanced, cr_weight=4.0):
+        """
+        Args:
+            points (ndarray): Array of shape (n, len(stat_names)) of solutions.
+            balanced (ndarray): Boolean mask of the points without locked stats.
+            cr_weight (float, optional): Extra weight of the cr in the distance.
+                                         Defaults to 4.
+        """
+        self.points = np.asarray(points, dtype=float)
+        self.balanced = np.asarray(balanced, dtype=bool)
+        self.cr_weight = cr_weight
+        self.scales = self.points.std(axis=0)
+        self.scales[self.scales == 0] = 1
+        self.scales[0] /= cr_weight
+        self._trees = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def build(cls, builder=None, cr_range=(0.125, 30), cr_step=0.05, variations=200, seed=None):
+        """Solves the problems of the grid with the batch closed form solver.
+
+        Args:
+            builder (StatblockBuilder, optional): Builder whose solver and curves
+                            are used. Defaults to a new builder.
+            cr_range (tuple, optional): Lowest and highest cr. Defaults to (0.125, 30).
+            cr_step (float, optional): Largest step between crs. The grid holds
+                            the DMG crs in cr_range and evenly spaced crs between
+                            them. Defaults to 0.05.
+            variations (int, optional): Solutions with locked stats per cr.
+                            Defaults to 200.
+            seed (int, optional): Seed for the locked values. Defaults to None.
+
+        Returns:
+            StatGrid: The grid
+        """
+        builder = StatblockBuilder(seed=seed) if builder is None else builder
+        rng = np.random.default_rng(seed)
+        solver = builder.closed_form_solver
+        crs = cls._grid_crs(cr_range, cr_step)
+        balanced = solver.solve_batch(
+            np.column_stack([crs, np.full((len(crs), len(cls.stat_names) - 1), np.nan)]))
+
+        # Lock one or two stats of every variation to 0.6 to 1.4 times their
+        # balanced value, AC to +-4.
+        n = len(crs) * variations
+        x = np.full((n, len(cls.stat_names)), np.nan)
+        x[:, 0] = np.repeat(crs, variations)
+        base = np.repeat(balanced, variations, axis=0)
+        columns = [cls.stat_names.index(name) for name in cls.varied_stats]
+        for lock in range(2):
+            j = rng.choice(columns, n)
+            rows = np.arange(n) if lock == 0 else np.flatnonzero(rng.random(n) < 0.5)
+            j = j[rows]
+            factor = rng.uniform(0.6, 1.4, len(rows))
+            value = base[rows, j] * factor
+            ac = j == cls.stat_names.index('ac')
+            value[ac] = base[rows[ac], j[ac]] + rng.uniform(-4, 4, ac.sum())
+            x[rows, j] = np.round(value)
+
+        solved = solver.solve_batch(x)
+        points = np.concatenate([balanced, solved])
+        is_balanced = np.arange(len(points)) < len(balanced)
+        # Drop problems without a solution and solutions without a sensible monster
+        valid = ~np.isnan(points).any(axis=1) & (points[:, 1:5] > 0).all(axis=1)
+        return cls(points[valid], is_balanced[valid])
+
+    @classmethod
+    def _grid_crs(cls, cr_range, cr_step):
+        # Exact DMG crs, so queries for them hit a grid point, with sub-steps of
+        # at most cr_step in between.
+        low, high = cr_range
+        anchors = sorted({low, high} | {cr for cr in cls.dmg_crs if low <= cr <= high})
+        crs = [np.array([anchors[0]], dtype=float)]
+        for a, b in zip(anchors, anchors[1:]):
+            steps = max(int(np.ceil((b - a) / cr_step - 1e-9)), 1)
+            crs.append(np.linspace(a, b, steps + 1)[1:])
+        return np.concatenate(crs)
+
+    def save(self, path):
+        """Writes the grid to an .npz file.
+
+        Args:
+            path (str): File name
+        """
+        np.savez(path, points=self.points, balanced=self.balanced, cr_weight=self.cr_weight)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a grid written by save.
+
+        Args:
+            path (str): File name
+
+        Returns:
+            StatGrid: The grid
+        """
+        with np.load(path) as data:
+            return cls(data['points'], data['balanced'], float(data['cr_weight']))
+
+    def query(self, cr, stats=None, k=1):
+        """Finds the grid points closest to a cr and locked stats.
+
+        Args:
+            cr (float): Challenge rating
+            stats (dict, optional): Locked stats, keyed by stat_names. Defaults to None.
+            k (int, optional): Number of points. Defaults to 1.
+
+        Returns:
+            tuple: (points, distances), arrays with k rows ordered from closest.
+                   The distance is in units of the spread of each stat.
+        """
+        stats = stats or {}
+        unknown = set(stats) - set(self.stat_names[1:])
+        if unknown:
+            raise ValueError(f'Unknown stats {sorted(unknown)}')
+        columns = (0,) + tuple(sorted(self.stat_names.index(name) for name in stats))
+        target = [cr] + [stats[self.stat_names[j]] for j in columns[1:]]
+        target = np.asarray(target, dtype=float) / self.scales[list(columns)]
+
+        tree, points = self._tree(columns)
+        distances, rows = tree.query(target, k=k)
+        rows, distances = np.atleast_1d(rows), np.atleast_1d(distances)
+        return points[rows], distances
+
+    def make_statblock(self, cr, stats=None, builder=None):
+        """Makes a Statblock from the closest grid point. The locked stats are set
+        to exactly the requested values.
+
+        Args:
+            cr (float): Challenge rating
+            stats (dict, optional): Locked stats, keyed by stat_names. Defaults to None.
+            builder (StatblockBuilder, optional): Builder that makes the attack.
+                            Defaults to a new builder.
+
+        Returns:
+            Statblock: The monster
+        """
+        stats = stats or {}
+        point = self.query(cr, stats)[0][0].copy()
+        point[0] = cr
+        for name, value in stats.items():
+            point[self.stat_names.index(name)] = value
+        builder = StatblockBuilder() if builder is None else builder
+        return builder._statblock_from_solution(point.tolist())
+
+    def _tree(self, columns):
+        # Without locked stats only the balanced points are searched
+        if columns not in self._trees:
+            from scipy.spatial import cKDTree # pylint: disable=import-outside-toplevel
+            points = self.points if len(columns) > 1 else self.points[self.balanced]
+            scaled = points[:, list(columns)] / self.scales[list(columns)]
+            self._trees[columns] = (cKDTree(scaled), points)
+        return self._trees[columns]
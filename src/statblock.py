@@ -1,6 +1,40 @@
+from collections.abc import MutableMapping
+
 from abilities import Attack, Ability
 
+class _Missing():
+    """Marks an unset attribute slot, None is a valid attribute value."""
+    __slots__ = ()
+
+    def __reduce__(self):
+        # Unpickles as the module's _MISSING, so identity checks keep working
+        return '_MISSING'
+
+    def __repr__(self):
+        return '<missing>'
+
+_MISSING = _Missing()
+
 class Statblock():
+    """Class to hold a monster.
+
+    The numeric attributes are kept in a fixed list with one slot per entry of
+    num_attributes, and the class uses __slots__, so a statblock carries no
+    per-instance dict. The attributes property gives a dict-like view of the slots;
+    other keys set through it go to a dict that is made on first use. The
+    proficiencies, actions, abilities and senses lists are also made on first
+    access.
+    """
+    __slots__ = (
+        '_values',
+        '_extra',
+        '_proficiencies',
+        '_actions',
+        '_abilities',
+        'spellcasting',
+        '_senses',
+        'basic_attack',
+    )
     num_attributes = (
         'cr',
         'ac',
@@ -45,19 +79,23 @@ class Statblock():
         'Persuasion',
     )
 
+    attribute_index = {name: i for i, name in enumerate(num_attributes)}
+
     def __init__(self, stats):
-        self.attributes = {}
-        self.proficiencies = []
-        self.actions = []
-        self.abilities = []
+        self._values = [_MISSING] * len(Statblock.num_attributes)
+        self._extra = None
+        self._proficiencies = None
+        self._actions = None
+        self._abilities = None
         self.spellcasting = None
-        self.senses = []
+        self._senses = None
         self.basic_attack = None
 
         # Unpack kewword arguments
         for k, v in stats.items():
-            if k in Statblock.num_attributes:
-                self.attributes[k] = v
+            i = Statblock.attribute_index.get(k)
+            if i is not None:
+                self._values[i] = v
             elif k == 'actions':
                 self.actions = v
             elif k == 'abilities':
@@ -71,15 +109,75 @@ class Statblock():
             elif k == 'basic_attack':
                 self.basic_attack = v
 
+    @property
+    def attributes(self):
+        """Dict-like view of the attributes that are set."""
+        return StatblockAttributes(self)
+
+    @attributes.setter
+    def attributes(self, attributes):
+        self._values[:] = [_MISSING] * len(Statblock.num_attributes)
+        self._extra = None
+        self.attributes.update(attributes)
+
+    # The lists are only made when they are used, most statblocks never need them
+    @property
+    def proficiencies(self):
+        if self._proficiencies is None:
+            self._proficiencies = []
+        return self._proficiencies
+
+    @proficiencies.setter
+    def proficiencies(self, value):
+        self._proficiencies = value
+
+    @property
+    def actions(self):
+        if self._actions is None:
+            self._actions = []
+        return self._actions
+
+    @actions.setter
+    def actions(self, value):
+        self._actions = value
+
+    @property
+    def abilities(self):
+        if self._abilities is None:
+            self._abilities = []
+        return self._abilities
+
+    @abilities.setter
+    def abilities(self, value):
+        self._abilities = value
+
+    @property
+    def senses(self):
+        if self._senses is None:
+            self._senses = []
+        return self._senses
+
+    @senses.setter
+    def senses(self, value):
+        self._senses = value
 
     def __getitem__(self, key):
-        if key in self.attributes:
-            return self.attributes[key]
-        else:
-            raise AttributeError(self + ' does not have attribute ' + key)
+        value = self._get(key, _MISSING)
+        if value is _MISSING:
+            raise AttributeError(f'Statblock does not have attribute {key}')
+        return value
+
+    def _get(self, key, default):
+        i = Statblock.attribute_index.get(key)
+        if i is not None:
+            value = self._values[i]
+            return default if value is _MISSING else value
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
 
     def is_proficient(self, skill):
-        return skill in self.proficiencies
+        return self._proficiencies is not None and skill in self._proficiencies
 
     def get_basic_attack(self):
         if self.basic_attack:
@@ -93,8 +191,10 @@ class Statblock():
         Args:
             n (int or float): The number to be formatted
             length (int): The max length of the returned string
-            is_integer (bool, optional): Whether n should be treate as in int or float. Defaults to True.
-            fail_case (str, optional): returned string if formatting is nor possible.. Defaults to '?'.
+            is_integer (bool, optional): Whether n should be treate as in int or float.
+                                         Defaults to True.
+            fail_case (str, optional): returned string if formatting is nor possible..
+                                       Defaults to '?'.
 
         Returns:
             str: The formatted number
@@ -127,21 +227,21 @@ class Statblock():
         """
         res = ''
         if style == 'compact':
-            hp_max = self.attributes.get('hp_max', 0)
-            hp_cur = self.attributes.get('hp_cur', 0)
+            hp_max = self._get('hp_max', 0)
+            hp_cur = self._get('hp_cur', 0)
             hp_max = self.format_number(hp_max, 4)
             hp_cur = self.format_number(hp_cur, 4)
 
-            ac = self.attributes.get('ac', 10)
+            ac = self._get('ac', 10)
             ac = self.format_number(ac, 2)
 
-            speed = self.attributes.get('speed', 0)
+            speed = self._get('speed', 0)
             speed = self.format_number(speed, 2)
 
-            strong_save = self.attributes.get('strong_save', 10)
+            strong_save = self._get('strong_save', 10)
             strong_save = self.format_number(strong_save, 2)
 
-            weak_save = self.attributes.get('weak_save', 10)
+            weak_save = self._get('weak_save', 10)
             weak_save = self.format_number(weak_save, 2)
 
             ba = self.get_basic_attack()
@@ -159,7 +259,8 @@ class Statblock():
             res += '|Sav. +{0:<2s}/+{1:<2s}|\n'.format(strong_save, weak_save)
             res += '+============+\n'
             res += '|Atk: {0:1s}x {1:^4s}|\n'.format(n_attacks, damage_type)
-            res += '|+{0:<2s}→{1:>2s}d{2:<2s}+{3:<2s}|\n'.format(tohit, n_dice, die_size, damage_modifier)
+            res += '|+{0:<2s}→{1:>2s}d{2:<2s}+{3:<2s}|\n'.format(
+                tohit, n_dice, die_size, damage_modifier)
             res += '+============+'
             # Example:
             # '+============+'
@@ -171,4 +272,58 @@ class Statblock():
             # '|+6 → 2d6 +3 |'
             # '+============+'
 
-        return res
\ No newline at end of file
+        return res
+
+class StatblockAttributes(MutableMapping):
+    """Dict-like view of the attributes of a Statblock. Names in
+    Statblock.num_attributes are kept in the slots, other names in an extra dict.
+    """
+    __slots__ = ('_statblock',)
+
+    def __init__(self, statblock):
+        self._statblock = statblock
+
+    def __getitem__(self, key):
+        value = self._statblock._get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        sb = self._statblock
+        i = Statblock.attribute_index.get(key)
+        if i is not None:
+            sb._values[i] = value
+            return
+        if sb._extra is None:
+            sb._extra = {}
+        sb._extra[key] = value
+
+    def __delitem__(self, key):
+        sb = self._statblock
+        i = Statblock.attribute_index.get(key)
+        if i is not None and sb._values[i] is not _MISSING:
+            sb._values[i] = _MISSING
+        elif i is None and sb._extra is not None and key in sb._extra:
+            del sb._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        sb = self._statblock
+        for name, value in zip(Statblock.num_attributes, sb._values):
+            if value is not _MISSING:
+                yield name
+        if sb._extra is not None:
+            yield from list(sb._extra)
+
+    def __len__(self):
+        sb = self._statblock
+        n = sum(value is not _MISSING for value in sb._values)
+        return n if sb._extra is None else n + len(sb._extra)
+
+    def get(self, key, default=None):
+        return self._statblock._get(key, default)
+
+    def __repr__(self):
+        return repr(dict(self))
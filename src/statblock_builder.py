@@ -2,20 +2,98 @@
 """
 import random
 import math
+import types
 
-from scipy import optimize
+import numpy as np
 
+import cr_curves
+import solvers
+from solution_cache import SolutionCache
 from damage_types import DamageType
 from statblock import Statblock
+from statblock_table import StatblockTable
 from abilities import Attack
+from attack_index import AttackIndex
+from cr_coefficients import CoefficientTable, CalibratedCurves
 
 class StatblockBuilder():
     """Class to build Statblock instances
     """
     core_stat_names = ['cr', 'hp', 'ac', 'tohit', 'damage', 'save_dc', 'strong_save', 'weak_save']
+    # Weights of hp, ac, tohit, damage, save_dc and strong_save in the optimized cr
+    optimize_weights = (1.0, 0.6, 1.0, 1.0, 0.2, 0.2)
+    # Weight of the pull towards the DMG based guess in the smooth scipy objective
+    optimize_balance = 0.01
+    # Intercept, hp and ac coefficients of defensive_cr
+    defensive_cr_coefficients = (-3.65, 0.05376286, 0.30206772)
+
+    def __init__(self, seed = None, cache: SolutionCache = None, curves=None,
+                 attack_index: AttackIndex = None, coefficients: CoefficientTable = None):
+        """Every builder draws from its own random generators, so builders in
+        different threads do not affect each other. A single builder is not
+        thread-safe, use spawn to get one builder per worker instead.
 
-    def __init__(self, seed = None):
-        pass
+        Args:
+            seed (int or SeedSequence, optional): Seed for the builder's random
+                                    generators. Defaults to None, i.e. fresh
+                                    entropy from the OS.
+            cache (SolutionCache, optional): Cache for the solutions of
+                                    make_statblock_optimize. Defaults to None.
+            curves (optional):      Vectorized curves used by the batch methods,
+                                    the cr_curves module or a CurveTables object.
+                                    The scalar methods do not use them, see
+                                    cr_tables. Defaults to cr_curves.
+            attack_index (AttackIndex, optional): Index used by make_attack and the
+                                    batch methods to pick the dice. Defaults to None,
+                                    i.e. dice are derived by floor division.
+            coefficients (CoefficientTable or str, optional): Curve coefficients
+                                    fitted by calibration, or the path of a saved
+                                    table. They replace the built-in ones in
+                                    defensive_cr, the cr_from_x curves and the
+                                    solvers. Cannot be combined with curves.
+                                    Defaults to None.
+        """
+        if isinstance(seed, np.random.SeedSequence):
+            self.seed_sequence = seed
+        else:
+            self.seed_sequence = np.random.SeedSequence(seed)
+        # NumPy generator for the batch methods, Python generator for the scalar ones
+        self.np_random = np.random.default_rng(self.seed_sequence)
+        self.random = random.Random(int(self.np_random.integers(2**63)))
+
+        self.curves = cr_curves if curves is None else curves
+        if isinstance(coefficients, str):
+            coefficients = CoefficientTable.load(coefficients)
+        self.coefficients = coefficients
+        if coefficients is not None:
+            if curves is not None:
+                raise ValueError('Pass either curves or coefficients')
+            self.curves = CalibratedCurves(coefficients)
+            self.defensive_cr_coefficients = coefficients['defensive_cr']
+            # The instance attributes shadow the built-in scalar curves
+            for name, curve in self.curves.scalar_curves.items():
+                setattr(self, name, curve)
+        self.cache = cache
+        self.attack_index = attack_index
+        self._solvers = {}
+
+    def spawn(self, n_children):
+        """Makes builders with independent, reproducible random streams,
+        e.g. one per worker. They share the cache, curves, attack index and
+        coefficients of this builder.
+
+        Args:
+            n_children (int): Number of builders to make.
+
+        Returns:
+            list: List of StatblockBuilder objects.
+        """
+        return [
+            StatblockBuilder(seed=child, cache=self.cache,
+                             curves=self.curves if self.coefficients is None else None,
+                             attack_index=self.attack_index, coefficients=self.coefficients)
+            for child in self.seed_sequence.spawn(n_children)
+        ]
 
     def make_statblock_basic(self, cr, stats: dict = None, offense_ratio: float = None, seed=None):
         """Makes a Statblock object based losely on the DMG p.274 table.
@@ -28,12 +106,13 @@ class StatblockBuilder():
             offence_ratio (float):  A number [0, 1] describing how much of the cr
                                     "budget" should be used of offensive stats as opposed
                                     to defensive stats.
-            seed (int):             Seed for random generation.
+            seed (int):             Reseeds the builder's generator if given.
 
         Returns:
             Statblock: A Statblock object of the created monster.
         """
-        random.seed(seed)
+        if seed is not None:
+            self.random.seed(seed)
 
         if stats is None:
             stats = dict()
@@ -95,11 +174,19 @@ class StatblockBuilder():
             attack: Attack object with apprx. the desired damage.
         """
         if die_size is None:
-            die_size = random.choice((4,6,8,12))
+            die_size = self.random.choice((4,6,8,12))
             if damage_target > 50 and die_size == 4:
                 die_size = 8
 
         assert die_size in [1,2,4,6,8,12,20]
+        # Attacks the index does not cover, e.g. d20s, use the search below
+        index = self.attack_index
+        if index is not None and die_size in index.die_sizes and (
+                n_attacks is None or n_attacks <= index.max_attacks):
+            n_attacks, n_dice, die_size, modifier = index.lookup(
+                damage_target, die_size=die_size, n_attacks=n_attacks)
+            return Attack(name, tohit, n_dice, die_size, modifier, damage_type, n_attacks)
+
         die_avg_damage = die_size//2 + 0.5
         if n_attacks is None:
             n_dice = damage_target//die_avg_damage
@@ -125,7 +212,7 @@ class StatblockBuilder():
             (off_cr, def_cr): Tuple of offensive_cr and defensive_cr
         """
         if offense_ratio is None:
-            offense_ratio = random.random()/2 - 0.5
+            offense_ratio = self.random.random()/2 - 0.5
         return (cr * (1 + offense_ratio), cr * (1-offense_ratio))
 
     def defensive_cr(self, hp, ac, vri_score):
@@ -143,8 +230,7 @@ class StatblockBuilder():
         Returns:
             cr (Float): Defensive cr of the monster
         """
-        b = -3.65
-        a = [0.05376286, 0.30206772]
+        b, *a = self.defensive_cr_coefficients
         cr = b + hp * a[0] * (1 + vri_score/100) + ac * a[1]
         return cr
 
@@ -178,7 +264,7 @@ class StatblockBuilder():
         """
         if ac is None and hp is None:
             if random_interval:
-                a = (random.random() - 0.5)*random_interval
+                a = (self.random.random() - 0.5)*random_interval
                 b = random_interval - a
             else:
                 a, b = 0, 0
@@ -199,13 +285,7 @@ class StatblockBuilder():
             ac = self.ac_from_cr(cr_ac)
 
         strong_save = self.strong_save_from_cr(cr)
-
-        if cr <= 2:
-            weak_save = 0
-        elif cr <= 8:
-            weak_save = 2
-        else:
-            weak_save = 3
+        weak_save = self.weak_save_from_cr(cr)
 
         return hp, ac, strong_save, weak_save
 
@@ -256,13 +336,13 @@ class StatblockBuilder():
             tohit = self.tohit_from_cr(cr)
             damage = self.damage_from_cr(cr)
 
-        elif tohit is None:
+        elif damage is None:
             cr_tohit = self.cr_from_tohit(tohit)
             cr_damage = 2*cr - cr_tohit
             damage = self.damage_from_cr(cr_damage)
 
-        elif damage is None:
-            cr_damage = self.cr_from_damage(cr_damage)
+        elif tohit is None:
+            cr_damage = self.cr_from_damage(damage)
             cr_tohit = 2*cr - cr_damage
             tohit = self.tohit_from_cr(cr_tohit)
 
@@ -361,6 +441,58 @@ class StatblockBuilder():
         return self.cr_from_ac(save_dc+2)
     #endregion
 
+    #region cr_slope_from_x
+    def cr_slope_from_hp(self, hp): # pylint: disable=unused-argument
+        """Derivative of cr_from_hp
+
+        Args:
+            hp (float): health points
+
+        Returns:
+            float: Change of challenge rating per hp
+        """
+        return 1/15
+
+    def cr_slope_from_ac(self, ac):
+        """Derivative of cr_from_ac
+
+        Args:
+            ac (float): armor class
+
+        Returns:
+            float: Change of challenge rating per ac
+        """
+        if ac <= 12:
+            return 0.0
+        return 3.0
+
+    def cr_slope_from_tohit(self, tohit):
+        """Derivative of cr_from_tohit
+
+        Args:
+            tohit (float): tohit stat of the statblock
+
+        Returns:
+            float: Change of challenge rating per tohit
+        """
+        if tohit >= 5:
+            return 0.5
+        return 0.00335 * 1.33 * math.e**(1.33*tohit)
+
+    def cr_slope_from_damage(self, damage):
+        """Derivative of cr_from_damage
+
+        Args:
+            damage (float): damage stat
+
+        Returns:
+            float: Change of challenge rating per damage
+        """
+        if damage >= 10:
+            return 0.2
+        return 0.043 * 0.32 * math.e**(0.32*damage)
+    #endregion
+
     #region x_from_cr
     def pb_from_cr(self, cr):
         """Proficiency bonus computed from CR
@@ -404,20 +536,24 @@ class StatblockBuilder():
             return 13 + 0.35*cr
 
     def tohit_from_cr(self, cr):
-        """Computes tohit from cr
+        """Computes tohit from cr, at least -5
         """
         if cr >= 1:
             return (cr + 7)/2
+        elif cr == 0:
+            return -5.0
         else:
-            return 0.75 * math.log(300*cr)
+            return max(0.75 * math.log(300*cr), -5.0)
 
     def damage_from_cr(self, cr):
-        """Computes damage from CR
+        """Computes damage from CR, at least 0
         """
         if cr >= 1:
             return (cr+1)*5
+        elif cr == 0:
+            return 0.0
         else:
-            return 3.125 * math.log(23.3 * cr)
+            return max(3.125 * math.log(23.3 * cr), 0.0)
 
     def save_dc_from_cr(self, cr):
         """Computes save DC from CR
@@ -428,6 +564,16 @@ class StatblockBuilder():
         """Computes strong saving throw from CR
         """
         return self.ac_from_cr(cr) -11
+
+    def weak_save_from_cr(self, cr):
+        """Computes weak saving throw from CR
+        """
+        if cr <= 2:
+            return 0
+        elif cr <= 8:
+            return 2
+        else:
+            return 3
     #endregion
 
     #region bounds
@@ -449,15 +595,30 @@ class StatblockBuilder():
     #endregion
 
     #region optimize
-    def make_statblock_optimize(self, cr, stats=None, offense_ratio=None, seed=None):
+    def make_statblock_optimize(self, cr, stats=None, offense_ratio=None, seed=None,
+                                solver='closed_form'):
+        """Makes a Statblock object whose stats average out to the given cr.
+        Stats given in 'stats' are kept fixed and the rest are solved for.
 
+        Args:
+            cr (float):             Challenge rating of the monster, this is required.
+            stats (dict, optional): Fixed stats, keyed by core_stat_names.
+            offense_ratio (float):  Not used yet.
+            seed (int):             Reseeds the builder's generator if given.
+            solver (str, optional): Name of a backend in the solvers registry.
+                                    'closed_form' solves the cr constraint directly,
+                                    'scipy' uses scipy.optimize.minimize.
+                                    Defaults to 'closed_form'.
 
+        Returns:
+            Statblock: A Statblock object of the created monster.
+        """
         # ['cr', 'hp', 'ac', 'tohit', 'damage', 'save_dc', 'strong_save', 'weak_save']
-        random.seed(seed)
+        if seed is not None:
+            self.random.seed(seed)
         fixed_index = []
         fixed_value = []
 
-        x = self._optimize_guess(cr)
         if stats is None:
             stats = {'cr': cr}
         else:
@@ -467,24 +628,66 @@ class StatblockBuilder():
                 fixed_index.append(i)
                 fixed_value.append(stats[name])
 
-        for i in sorted(fixed_index, reverse=True):
-            del x[i]
-
-        sol = optimize.minimize(
-            self._optimize_objective_function,
-            x,
-            (fixed_index, fixed_value),
-            bounds=self._optimize_bounds(fixed_index),
-            tol=0.0001
+        backend = self.get_solver(solver)
+
+        # Deterministic solvers return the same vector for any seed. The result
+        # of a solver that draws random numbers depends on the seed, so it is
+        # part of the key, and unseeded calls to such a solver are not cached.
+        uses_random = getattr(backend, 'uses_random', True)
+        use_cache = self.cache is not None and (seed is not None or not uses_random)
+        sol = None
+        if use_cache:
+            key = self.cache.make_key(solver, fixed_index, fixed_value,
+                                      seed if uses_random else None,
+                                      self._solver_config(backend))
+            sol = self.cache.get(key)
+
+        if sol is None:
+            # Draws made by the solver must not change the attack, otherwise
+            # cached and freshly solved results would differ for the same seed.
+            random_state = self.random.getstate()
+            sol = backend.solve(fixed_index, fixed_value)
+            self.random.setstate(random_state)
+            if use_cache:
+                self.cache.put(key, sol)
+
+        return self._statblock_from_solution(sol)
+
+    def get_solver(self, name):
+        """The solver backend registered under name. Backends are made on first
+        use, so heavy dependencies such as scipy are only imported when needed.
+
+        Args:
+            name (str): Solver name, see solvers.solver_names().
+
+        Returns:
+            object: Solver with a solve(fixed_index, fixed_value) method.
+        """
+        if name not in self._solvers:
+            self._solvers[name] = solvers.make_solver(name, self)
+        return self._solvers[name]
+
+    def _solver_config(self, backend):
+        # Everything besides the fixed stats and the seed that changes what a
+        # solver returns, part of the solution cache keys.
+        curves = self.curves
+        if isinstance(curves, types.ModuleType):
+            curves = curves.__name__
+        return (
+            getattr(backend, 'objective', None),
+            tuple(self.optimize_weights),
+            self.optimize_balance,
+            curves if isinstance(curves, str) else repr(curves),
         )
-        # print(sol)
-        sol = list(sol.x)
-        for i, v in zip(fixed_index, fixed_value):
-            sol.insert(i, v)
 
+    @property
+    def closed_form_solver(self):
+        """The closed form solver, also used by make_statblocks_optimize"""
+        return self.get_solver('closed_form')
+
+    def _statblock_from_solution(self, sol):
         # sol entries:
         # ['cr', 'hp', 'ac', 'tohit', 'damage', 'save_dc', 'strong_save', 'weak_save']
-
         stats = {
             'cr':round(sol[0]),
             'hp_max':round(sol[1]),
@@ -529,6 +732,9 @@ class StatblockBuilder():
         return bounds
 
     def _optimize_objective_function(self, x_var, fixed_index, fixed_value):
+        return abs(self._optimize_cr_error(x_var, fixed_index, fixed_value))
+
+    def _optimize_cr_error(self, x_var, fixed_index, fixed_value):
         x = list(x_var.copy())
         for i, v in zip(fixed_index, fixed_value):
             x.insert(i, v)
@@ -543,15 +749,312 @@ class StatblockBuilder():
         cr.append(self.cr_from_save_dc(x[5]))
         cr.append(self.cr_from_strong_save(x[6]))
 
-        weights = [
-            1.0,
-            0.6,
-            1.0,
-            1.0,
-            0.2,
-            0.2,
-        ]
+        weights = self.optimize_weights
 
         computed_cr = sum(c*w for c, w in zip(cr, weights))/sum(weights)
-        return abs(target_cr - computed_cr)
+        return target_cr - computed_cr
+
+    def _optimize_smooth_objective(self, x_var, fixed_index, fixed_value, guess):
+        """Squared cr error plus optimize_balance times the mean squared relative
+        distance of the free stats from guess, with its gradient. The gradient
+        is built from the cr_slope_from_x derivatives, so scipy can use jac=True.
+
+        Args:
+            x_var (ndarray): Free stats
+            fixed_index (list): Indices into core_stat_names of the fixed stats.
+            fixed_value (list): Values of the fixed stats.
+            guess (list): Full vector the free stats are pulled towards,
+                          see _optimize_guess.
+
+        Returns:
+            (float, ndarray): Objective and its gradient with respect to x_var
+        """
+        x = list(x_var)
+        for i, v in zip(fixed_index, fixed_value):
+            x.insert(i, v)
+        free = [i for i in range(len(x)) if i not in fixed_index]
+
+        weights = self.optimize_weights
+        total = sum(weights)
+        error = self._optimize_cr_error(x_var, fixed_index, fixed_value)
+        slopes = (
+            self.cr_slope_from_hp(x[1]),
+            self.cr_slope_from_ac(x[2]),
+            self.cr_slope_from_tohit(x[3]),
+            self.cr_slope_from_damage(x[4]),
+            self.cr_slope_from_ac(x[5]+2),
+            self.cr_slope_from_tohit(x[6]-7),
+        )
+        # d error/d cr is 1, d error/d weak_save is 0
+        grad = [2*error] + [-2*error*w*s/total for w, s in zip(weights, slopes)] + [0.0]
+        value = error*error
+
+        balance = self.optimize_balance/max(len(free), 1)
+        for i in free:
+            scale = max(abs(guess[i]), 1.0)
+            distance = (x[i] - guess[i])/scale
+            value += balance*distance*distance
+            grad[i] += 2*balance*distance/scale
+
+        return value, np.array([grad[i] for i in free])
+    #endregion
+
+    #region batch
+    def make_statblocks_basic(self, crs, stats: dict = None, offense_ratio=None, seed=None):
+        """Vectorized version of make_statblock_basic for many monsters at once.
+
+        All curves are evaluated on NumPy arrays, so the cost per monster is a few
+        array operations instead of a chain of Python calls. The random draws come
+        from a NumPy generator, so the results for a given seed differ from the
+        ones of make_statblock_basic.
+
+        Args:
+            crs (array_like):       Challenge ratings of the monsters, one per row.
+            stats (dict):           Optional locked stats. Each value is either a
+                                    scalar applied to every row or an array with one
+                                    entry per row, where NaN leaves that row unlocked.
+                                    Supports 'hp', 'ac', 'tohit', 'damage' and 'save_dc'.
+            offense_ratio (float or array_like): Same as for make_statblock_basic,
+                                    either for all rows or per row.
+            seed (int):             Seed for a one-off generator. Defaults to None,
+                                    i.e. the builder's own generator.
+
+        Returns:
+            StatblockTable: Columnar result, rows are turned into Statblock
+            objects on access.
+        """
+        rng = self.np_random if seed is None else np.random.default_rng(seed)
+
+        crs = np.asarray(crs)
+        if crs.ndim != 1:
+            raise ValueError('crs must be one-dimensional')
+        n = len(crs)
+        cr = crs.astype(float)
+
+        if stats is None:
+            stats = {}
+        locked = {
+            name: self._batch_column(stats.get(name), n)
+            for name in ('hp', 'ac', 'tohit', 'damage', 'save_dc')
+        }
+
+        if offense_ratio is None:
+            offense_ratio = rng.random(n)/2 - 0.5
+        offense_ratio = np.broadcast_to(np.asarray(offense_ratio, dtype=float), (n,))
+        off_cr, def_cr = cr * (1 + offense_ratio), cr * (1 - offense_ratio)
+
+        hp, ac, strong_save, weak_save = self._batch_defensive_stats(
+            def_cr, locked['hp'], locked['ac'], rng)
+        tohit, damage, save_dc = self._batch_offensive_stats(
+            off_cr, locked['tohit'], locked['damage'], locked['save_dc'])
+
+        columns = {
+            'cr': crs,
+            'hp_max': hp,
+            'hp_cur': hp,
+            'ac': ac,
+            'tohit': tohit,
+            'damage': damage,
+            'save_dc': save_dc,
+            'strong_save': strong_save,
+            'weak_save': weak_save,
+        }
+        for name, col in columns.items():
+            if name != 'cr' and np.isnan(col).any():
+                raise ValueError(
+                    f'{np.isnan(col).sum()} rows have no valid {name}, check the cr and locked stats'
+                )
+            columns[name] = col if name == 'cr' else np.round(col).astype(np.int64)
+        columns['hp_cur'] = columns['hp_max'].copy()
+        columns['speed'] = np.full(n, 30, dtype=np.int64)
+
+        columns.update(self._batch_attack_columns(columns['damage'], rng))
+        columns['damage_type'] = np.full(
+            n, StatblockTable.damage_types.index(DamageType.BLUDGEONING), dtype=np.int8)
+
+        return StatblockTable(columns)
+
+    def make_statblocks_optimize(self, crs, stats: dict = None, seed=None):
+        """Vectorized version of make_statblock_optimize for many monsters at once.
+
+        All problems are stacked into one array and solved together with
+        ClosedFormSolver.solve_batch, so the cost grows with the NumPy work and not
+        with the number of Python calls.
+
+        Args:
+            crs (array_like):       Challenge ratings of the monsters, one per row.
+            stats (dict):           Optional fixed stats, keyed by core_stat_names.
+                                    Each value is either a scalar applied to every
+                                    row or an array with one entry per row, where
+                                    NaN leaves that row free.
+            seed (int):             Seed for a one-off generator. Defaults to None,
+                                    i.e. the builder's own generator.
+
+        Returns:
+            StatblockTable: Columnar result, rows are turned into Statblock
+            objects on access.
+        """
+        rng = self.np_random if seed is None else np.random.default_rng(seed)
+
+        crs = np.asarray(crs, dtype=float)
+        if crs.ndim != 1:
+            raise ValueError('crs must be one-dimensional')
+        n = len(crs)
+
+        if stats is None:
+            stats = {}
+        x = np.stack(
+            [crs] + [self._batch_column(stats.get(name), n) for name in self.core_stat_names[1:]],
+            axis=1,
+        )
+        sol = self.closed_form_solver.solve_batch(x)
+        if np.isnan(sol).any():
+            raise ValueError(
+                f'{np.isnan(sol).any(axis=1).sum()} rows could not be solved, check the crs'
+            )
+
+        # sol columns:
+        # ['cr', 'hp', 'ac', 'tohit', 'damage', 'save_dc', 'strong_save', 'weak_save']
+        rounded = np.round(sol).astype(np.int64)
+        columns = {
+            'cr': rounded[:, 0],
+            'hp_max': rounded[:, 1],
+            'hp_cur': rounded[:, 1].copy(),
+            'ac': rounded[:, 2],
+            'tohit': rounded[:, 3],
+            'damage': rounded[:, 4],
+            'save_dc': rounded[:, 5],
+            'strong_save': rounded[:, 6],
+            'weak_save': rounded[:, 7],
+            'speed': np.full(n, 30, dtype=np.int64),
+        }
+
+        columns.update(self._batch_attack_columns(columns['damage'], rng))
+        columns['damage_type'] = np.full(
+            n, StatblockTable.damage_types.index(DamageType.BLUDGEONING), dtype=np.int8)
+
+        return StatblockTable(columns)
+
+    def defensive_crs(self, hp, ac, vri_score=0):
+        """Vectorized version of defensive_cr.
+
+        Args:
+            hp (array_like):        hp of the monsters
+            ac (array_like):        ac of the monsters
+            vri_score (array_like): vri_score of the monsters, see defensive_cr.
+                                    Defaults to 0.
+
+        Returns:
+            ndarray: Defensive cr per monster, NaN where hp or ac is NaN.
+        """
+        b, *a = self.defensive_cr_coefficients
+        hp = np.asarray(hp, dtype=float)
+        ac = np.asarray(ac, dtype=float)
+        vri_score = np.asarray(vri_score, dtype=float)
+        return b + hp * a[0] * (1 + vri_score/100) + ac * a[1]
+
+    def offensive_crs(self, tohit, damage, strong_save=None, save_att_ratio=0.25):
+        """Vectorized version of offensive_cr.
+
+        Args:
+            tohit (array_like):     tohit of the monsters
+            damage (array_like):    Average damage per round of the monsters
+            strong_save (array_like, optional): As for offensive_cr. 0 or NaN
+                                    leave the cr of a row at the average of
+                                    tohit and damage. Defaults to None.
+            save_att_ratio (float, optional): As for offensive_cr. Defaults to 0.25.
+
+        Returns:
+            ndarray: Offensive cr per monster, NaN where tohit or damage is NaN.
+        """
+        cr_avg = (self.curves.cr_from_damage(damage) + self.curves.cr_from_tohit(tohit))/2
+        if strong_save is None:
+            return cr_avg
+        strong_save = np.asarray(strong_save, dtype=float)
+        has_save = (strong_save != 0) & ~np.isnan(strong_save)
+        cr_strong_save = self.curves.cr_from_strong_save(np.where(has_save, strong_save, 0))
+        return np.where(
+            has_save, cr_avg*(1-save_att_ratio) + cr_strong_save*save_att_ratio, cr_avg)
+
+    def _batch_column(self, value, n):
+        if value is None:
+            return np.full(n, np.nan)
+        return np.array(np.broadcast_to(np.asarray(value, dtype=float), (n,)))
+
+    def _batch_defensive_stats(self, cr, hp, ac, rng, hp_to_ac_ratio=0.5, random_interval=0.2):
+        hp_free, ac_free = np.isnan(hp), np.isnan(ac)
+        both_free = hp_free & ac_free
+
+        a = (rng.random(len(cr)) - 0.5)*random_interval
+        b = random_interval - a
+        hp_modifier = 2 * hp_to_ac_ratio     + a
+        ac_modifier = 2 * (1-hp_to_ac_ratio) + b
+
+        new_hp = np.where(
+            both_free,
+            self.curves.hp_from_cr(cr * hp_modifier),
+            self.curves.hp_from_cr(2*cr - self.curves.cr_from_ac(ac)),
+        )
+        new_ac = np.where(
+            both_free,
+            self.curves.ac_from_cr(cr * ac_modifier),
+            self.curves.ac_from_cr(2*cr - self.curves.cr_from_hp(hp)),
+        )
+        hp = np.where(hp_free, new_hp, hp)
+        ac = np.where(ac_free, new_ac, ac)
+
+        strong_save = self.curves.strong_save_from_cr(cr)
+        weak_save = self.curves.weak_save_from_cr(cr)
+        return hp, ac, strong_save, weak_save
+
+    def _batch_offensive_stats(self, cr, tohit, damage, save_dc, save_att_ratio=0.25):
+        tohit_free, damage_free = np.isnan(tohit), np.isnan(damage)
+        both_free = tohit_free & damage_free
+
+        new_tohit = np.where(
+            both_free,
+            self.curves.tohit_from_cr(cr),
+            self.curves.tohit_from_cr(2*cr - self.curves.cr_from_damage(damage)),
+        )
+        new_damage = np.where(
+            both_free,
+            self.curves.damage_from_cr(cr),
+            self.curves.damage_from_cr(2*cr - self.curves.cr_from_tohit(tohit)),
+        )
+        tohit = np.where(tohit_free, new_tohit, tohit)
+        damage = np.where(damage_free, new_damage, damage)
+        save_dc = np.where(np.isnan(save_dc), self.curves.save_dc_from_cr(cr * save_att_ratio), save_dc)
+        return tohit, damage, save_dc
+
+    def _batch_attack_columns(self, damage_target, rng):
+        """Vectorized version of make_attack with free die size and number of attacks.
+        """
+        die_size = rng.choice(np.array((4, 6, 8, 12)), len(damage_target))
+        die_size = np.where((damage_target > 50) & (die_size == 4), 8, die_size)
+        if self.attack_index is not None:
+            return self._batch_indexed_attack_columns(damage_target, die_size)
+
+        die_avg_damage = die_size//2 + 0.5
+        n_dice = damage_target//die_avg_damage
+        n_attacks = np.where(n_dice > 8, np.ceil(n_dice/8), 1)
+        n_dice = np.where(n_dice > 8, (damage_target/n_attacks)//die_avg_damage, n_dice)
+        n_dice = np.round(n_dice)
+        modifier = np.round(damage_target/n_attacks - n_dice*die_avg_damage)
+        return {
+            'n_attacks': n_attacks.astype(np.int64),
+            'n_dice': n_dice.astype(np.int64),
+            'die_size': die_size.astype(np.int64),
+            'modifier': modifier.astype(np.int64),
+        }
+
+    def _batch_indexed_attack_columns(self, damage_target, die_size):
+        """Looks the attacks up in the attack index, one searchsorted per die size.
+        """
+        columns = {name: np.empty(len(damage_target), dtype=np.int64) for name in AttackIndex.fields}
+        for size in np.unique(die_size).tolist():
+            rows = die_size == size
+            found = self.attack_index.lookup_batch(damage_target[rows], die_size=size)
+            for name, values in found.items():
+                columns[name][rows] = values
+        return columns
     #endregion
@@ -0,0 +1,198 @@
+"""Contains the CompactRenderer class
+"""
+import io
+from functools import lru_cache
+
+import numpy as np
+
+from statblock_table import StatblockTable
+
+# Attribute, default, max length and alignment of the first six fields, as in
+# Statblock.format
+_ATTRIBUTE_FIELDS = (
+    ('hp_cur', 0, 4, '>4'),
+    ('hp_max', 0, 4, '>4'),
+    ('ac', 10, 2, '>2'),
+    ('speed', 0, 2, '>2'),
+    ('strong_save', 10, 2, '<2'),
+    ('weak_save', 10, 2, '<2'),
+)
+# Attack attribute, max length and alignment of the attack fields
+_ATTACK_FIELDS = (
+    ('n_attacks', 1, '1'),
+    ('tohit', 2, '<2'),
+    ('n_dice', 2, '>2'),
+    ('die_size', 2, '<2'),
+    ('modifier', 2, '<2'),
+)
+_DAMAGE_TYPE_SPEC = '^4'
+
+# The card of Statblock.format('compact') as one template. The fields are
+# hp_cur, hp_max, ac, speed, strong_save, weak_save, n_attacks, damage_type,
+# tohit, n_dice, die_size and modifier, already padded to their width, which is
+# several times faster to fill than format specs.
+COMPACT_TEMPLATE = (
+    '+============+\n'
+    '|hp %s/%s|\n'
+    '|ac %s|Spd %s|\n'
+    '|Sav. +%s/+%s|\n'
+    '+============+\n'
+    '|Atk: %sx %s|\n'
+    '|+%s→%sd%s+%s|\n'
+    '+============+'
+)
+
+@lru_cache(maxsize=4096, typed=True)
+def fit_number(n, length):
+    """Same as Statblock.format_number for integers, memoized since the same
+    numbers show up on many cards.
+
+    Args:
+        n (int or float): The number to be formatted
+        length (int): The max length of the returned string
+
+    Returns:
+        str: The formatted number
+    """
+    n = str(n)
+    if len(n) <= length:
+        return n
+    if len(n)-2 <= length:
+        return n[:-3] + 'k'
+    return '?'
+
+@lru_cache(maxsize=4096, typed=True)
+def _padded(n, length, spec):
+    return format(fit_number(n, length), spec)
+
+class CompactRenderer():
+    """Renders many statblocks in the compact style at once.
+
+    The output is identical to Statblock.format('compact') for every card. Cards
+    are joined by newlines, or laid out side by side in a grid. Statblocks and
+    StatblockTables are both accepted; for tables the fields are read straight
+    from the columns, without creating Statblock objects.
+    """
+
+    def __init__(self, per_row=1, gap='  ', chunk_size=1000):
+        """
+        Args:
+            per_row (int, optional): Cards per row. 1 puts every card below the
+                                     previous one. Defaults to 1.
+            gap (str, optional): Text between cards in a grid row. Defaults to
+                                     two spaces.
+            chunk_size (int, optional): Cards rendered per write when streaming.
+                                     Defaults to 1000.
+        """
+        if per_row < 1:
+            raise ValueError('per_row must be at least 1')
+        self.per_row = per_row
+        self.gap = gap
+        self.chunk_size = chunk_size
+
+    def render(self, statblocks):
+        """Renders all cards into one string.
+
+        Args:
+            statblocks (iterable or StatblockTable): The statblocks to render.
+
+        Returns:
+            str: The cards
+        """
+        buffer = io.StringIO()
+        self.write(statblocks, buffer)
+        return buffer.getvalue()
+
+    def render_bytes(self, statblocks, encoding='utf-8'):
+        """Renders all cards into one bytes buffer.
+
+        Args:
+            statblocks (iterable or StatblockTable): The statblocks to render.
+            encoding (str, optional): Defaults to 'utf-8'.
+
+        Returns:
+            bytes: The encoded cards
+        """
+        return self.render(statblocks).encode(encoding)
+
+    def write(self, statblocks, stream):
+        """Streams the cards to a text stream, chunk_size cards at a time.
+
+        Args:
+            statblocks (iterable or StatblockTable): The statblocks to render.
+            stream (file-like): Anything with a write(str) method.
+        """
+        first = True
+        for fields in self._chunks(statblocks):
+            cards = [COMPACT_TEMPLATE % f for f in fields]
+            text = self._join(cards)
+            if not first:
+                text = ('\n\n' if self.per_row > 1 else '\n') + text
+            stream.write(text)
+            first = False
+
+    def _join(self, cards):
+        if self.per_row == 1:
+            return '\n'.join(cards)
+        rows = []
+        for start in range(0, len(cards), self.per_row):
+            card_lines = [card.split('\n') for card in cards[start:start + self.per_row]]
+            rows.append('\n'.join(self.gap.join(line) for line in zip(*card_lines)))
+        return '\n\n'.join(rows)
+
+    def _chunks(self, statblocks):
+        # Chunks are a multiple of per_row, so grid rows are never split.
+        size = max(self.chunk_size // self.per_row, 1) * self.per_row
+        if isinstance(statblocks, StatblockTable):
+            for start in range(0, len(statblocks), size):
+                yield self._table_fields(statblocks[start:start + size])
+            return
+
+        chunk = []
+        for sb in statblocks:
+            chunk.append(self._statblock_fields(sb))
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _statblock_fields(self, sb):
+        attributes = sb.attributes
+        fields = [
+            _padded(attributes.get(name, default), length, spec)
+            for name, default, length, spec in _ATTRIBUTE_FIELDS
+        ]
+        ba = sb.get_basic_attack()
+        n_attacks, tohit, n_dice, die_size, modifier = (
+            _padded(getattr(ba, name), length, spec) for name, length, spec in _ATTACK_FIELDS
+        )
+        damage_type = format(ba.damage_type.abbr, _DAMAGE_TYPE_SPEC)
+        fields += [n_attacks, damage_type, tohit, n_dice, die_size, modifier]
+        return tuple(fields)
+
+    def _table_fields(self, table):
+        n = len(table)
+        columns = []
+        for name, default, length, spec in _ATTRIBUTE_FIELDS:
+            if name in table.names:
+                columns.append(self._padded_column(table[name], length, spec, default))
+            else:
+                columns.append([_padded(default, length, spec)] * n)
+
+        n_attacks, tohit, n_dice, die_size, modifier = (
+            self._padded_column(table[name], length, spec)
+            for name, length, spec in _ATTACK_FIELDS
+        )
+        damage_type = [format(dt.abbr, _DAMAGE_TYPE_SPEC) for dt in table.damage_types]
+        damage_type = [damage_type[code] for code in table['damage_type'].tolist()]
+        columns += [n_attacks, damage_type, tohit, n_dice, die_size, modifier]
+        return list(zip(*columns))
+
+    def _padded_column(self, column, length, spec, default=None):
+        # Each distinct value is formatted once, most columns only have a few.
+        values, inverse = np.unique(column, return_inverse=True)
+        padded = [
+            _padded(default if v != v else v, length, spec) for v in values.tolist()
+        ]
+        return [padded[i] for i in inverse.ravel().tolist()]
@@ -0,0 +1,519 @@
+"""Local HTTP/JSON service that generates statblocks.
+
+Requests are answered by an asyncio server; the generation itself runs in an
+executor, so a slow solve never blocks the event loop. Two things keep the
+latency down when many clients ask at once:
+
+    coalescing      Seeded requests for the same method, solver, cr, locked stats
+                    and seed that arrive while an identical one is in flight
+                    share its result instead of being solved again.
+    micro-batching  Requests that arrive within batch_window seconds are collected
+                    and handed to the executor together. Unseeded requests with the
+                    basic method or the closed form solver become one call of
+                    make_statblocks_basic or make_statblocks_optimize, the other
+                    closed form and basic requests one loop of scalar calls. Solves
+                    with other solvers, such as scipy, are submitted one by one, so
+                    they spread over the workers.
+
+Unseeded requests ask for a fresh random monster each, so they are batched but
+never coalesced. A seeded request always returns the monster of
+StatblockBuilder(seed=seed).make_statblock_<method>(cr, stats, seed=seed).
+
+Endpoints:
+    POST /statblock     JSON body {"cr": 5, "method": "optimize", "solver": "closed_form",
+                        "stats": {"ac": 17}, "seed": 3}, only cr is required.
+    GET  /statblock     The same as query parameters, locked stats by name:
+                        /statblock?cr=5&method=optimize&ac=17
+    GET  /stats         Request, coalescing and batching counters.
+    GET  /health        {"status": "ok"}
+
+Run on localhost:
+    python statblock_service.py --port 8765
+    curl 'localhost:8765/statblock?cr=5&ac=17'
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import math
+import sys
+import urllib.parse
+
+import numpy as np
+
+import solvers
+from statblock_builder import StatblockBuilder
+
+METHODS = ('basic', 'optimize')
+# Solvers whose problems make_statblocks_optimize can solve in one batch
+BATCH_SOLVERS = ('closed_form',)
+# Largest cr and largest absolute value of a locked stat, far beyond any monster
+MAX_CR = 30
+MAX_STAT = 10000
+# Stats that can be locked per method
+BASIC_STATS = ('hp', 'ac', 'tohit', 'damage', 'save_dc')
+OPTIMIZE_STATS = tuple(StatblockBuilder.core_stat_names[1:])
+MAX_BODY = 1 << 16
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error',
+}
+
+#region requests
+def parse_request(request):
+    """Checks a request and normalizes it into a hashable key.
+
+    Args:
+        request (dict): 'cr' and optionally 'method', 'solver', 'stats' and 'seed'.
+
+    Returns:
+        tuple: (method, solver, cr, stats, seed), stats a sorted tuple of
+               (name, value) pairs. solver is None for the basic method.
+    """
+    if not isinstance(request, dict):
+        raise ValueError('The request must be a JSON object')
+    unknown = set(request) - {'cr', 'method', 'solver', 'stats', 'seed'}
+    if unknown:
+        raise ValueError(f'Unknown fields {sorted(unknown)}')
+    if 'cr' not in request:
+        raise ValueError('cr is required')
+    cr = _number('cr', request['cr'])
+    if not 0 <= cr <= MAX_CR:
+        raise ValueError(f'cr must be between 0 and {MAX_CR}')
+
+    method = request.get('method', 'basic')
+    if method not in METHODS:
+        raise ValueError(f'Unknown method {method}, expected one of {list(METHODS)}')
+    if method == 'basic':
+        solver, allowed = None, BASIC_STATS
+    else:
+        solver, allowed = request.get('solver', 'closed_form'), OPTIMIZE_STATS
+        if solver not in solvers.solver_names():
+            raise ValueError(f'Unknown solver {solver}')
+
+    stats = request.get('stats') or {}
+    if not isinstance(stats, dict):
+        raise ValueError('stats must be an object')
+    unknown = set(stats) - set(allowed)
+    if unknown:
+        raise ValueError(f'Stats {sorted(unknown)} cannot be locked with the {method} method')
+    stats = tuple(sorted((name, _number(name, value)) for name, value in stats.items()))
+    for name, value in stats:
+        if abs(value) > MAX_STAT:
+            raise ValueError(f'{name} must be between -{MAX_STAT} and {MAX_STAT}')
+
+    seed = request.get('seed')
+    if seed is not None:
+        if isinstance(seed, str) and seed.isdigit():
+            seed = int(seed)
+        if isinstance(seed, bool) or not isinstance(seed, int) or seed < 0:
+            raise ValueError('seed must be a non-negative integer')
+    return method, solver, cr, stats, seed
+
+def _number(name, value):
+    if isinstance(value, bool):
+        raise ValueError(f'{name} must be a number')
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number') from None
+    if not math.isfinite(value):
+        raise ValueError(f'{name} must be finite')
+    return value
+
+def statblock_to_dict(statblock):
+    """JSON friendly form of a Statblock.
+
+    Args:
+        statblock (Statblock): The monster
+
+    Returns:
+        dict: {'stats': {name: value}, 'attack': {...} or None, 'text': compact card}
+    """
+    attack = statblock.get_basic_attack()
+    if attack is not None:
+        attack = {
+            'name': attack.name,
+            'tohit': attack.tohit,
+            'n_dice': attack.n_dice,
+            'die_size': attack.die_size,
+            'modifier': attack.modifier,
+            'damage_type': attack.damage_type.name.lower(),
+            'n_attacks': attack.n_attacks,
+            'average_damage': attack.get_avg_damage(),
+        }
+    return {
+        'stats': dict(statblock.attributes),
+        'attack': attack,
+        'text': statblock.format(),
+    }
+#endregion
+
+#region workers
+# The workers are module level functions with picklable arguments, so the
+# service works with a ProcessPoolExecutor too. Each returns (status, value)
+# pairs: ('ok', dict), ('error', message) for invalid problems, which become 400
+# responses, and ('failure', message) for bugs, which become 500 responses.
+
+def generate_one(key):
+    """Makes the monster of one request with a builder seeded for it.
+
+    Args:
+        key (tuple): Key from parse_request.
+
+    Returns:
+        tuple: (status, value)
+    """
+    method, solver, cr, stats, seed = key
+    builder = StatblockBuilder(seed=seed)
+    try:
+        if method == 'basic':
+            statblock = builder.make_statblock_basic(cr, dict(stats), seed=seed)
+        else:
+            statblock = builder.make_statblock_optimize(cr, dict(stats), seed=seed, solver=solver)
+        return 'ok', statblock_to_dict(statblock)
+    except ValueError as e:
+        return 'error', str(e)
+    except Exception as e: # pylint: disable=broad-except
+        return 'failure', repr(e)
+
+def generate_many(keys):
+    """generate_one for several requests in one executor call.
+
+    Args:
+        keys (list): Keys from parse_request.
+
+    Returns:
+        list: (status, value) per key
+    """
+    return [generate_one(key) for key in keys]
+
+def generate_batch(method, keys, seed):
+    """Makes the monsters of unseeded requests with one vectorized call.
+
+    Args:
+        method (str): 'basic' or 'optimize', the same for all keys.
+        keys (list): Keys from parse_request.
+        seed (SeedSequence): Seed for the builder of this batch.
+
+    Returns:
+        list: (status, value) per key
+    """
+    builder = StatblockBuilder(seed=seed)
+    make = builder.make_statblocks_basic if method == 'basic' else builder.make_statblocks_optimize
+    crs = np.array([key[2] for key in keys])
+    names = sorted({name for key in keys for name, _ in key[3]})
+    columns = {name: np.full(len(keys), np.nan) for name in names}
+    for i, key in enumerate(keys):
+        for name, value in key[3]:
+            columns[name][i] = value
+    try:
+        table = make(crs, columns)
+    except ValueError:
+        # One bad row fails the whole call, so the rows are retried one by one
+        # to find it.
+        if len(keys) == 1:
+            raise
+        return [
+            _generate_batch_safe(method, [key], child)[0]
+            for key, child in zip(keys, seed.spawn(len(keys)))
+        ]
+    return [('ok', statblock_to_dict(table[i])) for i in range(len(table))]
+
+def _generate_batch_safe(method, keys, seed):
+    try:
+        return generate_batch(method, keys, seed)
+    except ValueError as e:
+        return [('error', str(e))] * len(keys)
+    except Exception as e: # pylint: disable=broad-except
+        return [('failure', repr(e))] * len(keys)
+#endregion
+
+class StatblockService():
+    """Coalescing, micro-batching front end of StatblockBuilder.
+
+    generate can be awaited directly, serve starts the HTTP server. All methods
+    must be called from the thread running the event loop.
+
+    Example:
+        service = StatblockService()
+        server = await service.serve(port=8765)
+        await server.serve_forever()
+    """
+
+    def __init__(self, executor=None, batch_window=0.002, max_batch=512, seed=None):
+        """
+        Args:
+            executor (Executor, optional): Runs the generation. Defaults to None,
+                                    i.e. a ThreadPoolExecutor owned by the service.
+            batch_window (float, optional): Seconds to wait for more requests
+                                    before a batch is started. Defaults to 0.002.
+            max_batch (int, optional): Requests that start a batch right away.
+                                    Defaults to 512.
+            seed (int, optional):   Seed for the unseeded requests. Defaults to None.
+        """
+        self._owns_executor = executor is None
+        self.executor = concurrent.futures.ThreadPoolExecutor() if executor is None else executor
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.counters = {
+            'requests': 0, 'coalesced': 0, 'batches': 0, 'batched_requests': 0,
+            'errors': 0, 'failures': 0,
+        }
+        self._in_flight = {}
+        self._pending = []
+        self._flush_handle = None
+        self._tasks = set()
+
+    def close(self):
+        """Shuts down the executor if the service made it."""
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    async def generate(self, request):
+        """Makes the monster of one request.
+
+        Args:
+            request (dict): See parse_request.
+
+        Returns:
+            dict: See statblock_to_dict.
+        """
+        key = parse_request(request)
+        self.counters['requests'] += 1
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if key[4] is not None:
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self._enqueue(key, future)
+        # Shielded, so a client that goes away does not cancel the result for
+        # the requests coalesced with it.
+        status, value = await asyncio.shield(future)
+        if status == 'error':
+            self.counters['errors'] += 1
+            raise ValueError(value)
+        if status == 'failure':
+            self.counters['failures'] += 1
+            raise RuntimeError(value)
+        return value
+
+    def stats(self):
+        """Counters of the service.
+
+        Returns:
+            dict: Requests, coalesced requests, batches, mean batch size and errors.
+        """
+        stats = dict(self.counters)
+        stats['mean_batch_size'] = (
+            stats['batched_requests'] / stats['batches'] if stats['batches'] else 0.0)
+        stats['in_flight'] = len(self._in_flight)
+        return stats
+
+    #region batching
+    def _enqueue(self, key, future):
+        self._pending.append((key, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.batch_window, self._flush)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+
+        batches = {method: [] for method in METHODS}
+        scalar = []
+        for key, future in pending:
+            method, solver, _, _, seed = key
+            if method == 'optimize' and solver not in BATCH_SOLVERS:
+                self._submit([future], generate_many, [key])
+            elif seed is None:
+                batches[method].append((key, future))
+            else:
+                scalar.append((key, future))
+        for method, items in batches.items():
+            if items:
+                keys, futures = zip(*items)
+                seed = self.seed_sequence.spawn(1)[0]
+                self._submit(futures, _generate_batch_safe, method, list(keys), seed)
+        if scalar:
+            keys, futures = zip(*scalar)
+            self._submit(futures, generate_many, list(keys))
+
+    def _submit(self, futures, func, *args):
+        self.counters['batches'] += 1
+        self.counters['batched_requests'] += len(futures)
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self._run(futures, loop.run_in_executor(self.executor, func, *args)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _run(futures, job):
+        try:
+            results = await job
+        except Exception as e: # pylint: disable=broad-except
+            results = [('failure', repr(e))] * len(futures)
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+    #endregion
+
+    #region http
+    async def serve(self, host='127.0.0.1', port=8765):
+        """Starts the HTTP server.
+
+        Args:
+            host (str, optional): Interface to listen on. Defaults to localhost.
+            port (int, optional): Port, 0 picks a free one. Defaults to 8765.
+
+        Returns:
+            asyncio.Server: The server, e.g. for serve_forever.
+        """
+        # A large backlog, so bursts of new connections are not refused and
+        # retried by the clients a second later.
+        return await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+
+    async def handle_connection(self, reader, writer):
+        """Answers the requests of one connection, keeping it open between
+        requests unless the client asks to close it.
+
+        Args:
+            reader (StreamReader): Connection reader
+            writer (StreamWriter): Connection writer
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed request'}, False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {'error': 'Request body too large'}, False)
+                    break
+                body = await reader.readexactly(length) if length > 0 else b''
+
+                status, payload = await self._route(method, target, body)
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (
+                    version == 'HTTP/1.1' and connection != 'close')
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        if url.path == '/health':
+            return 200, {'status': 'ok'}
+        if url.path == '/stats':
+            return 200, self.stats()
+        if url.path != '/statblock':
+            return 404, {'error': f'No endpoint {url.path}'}
+        try:
+            if method == 'POST':
+                request = json.loads(body.decode('utf-8') or 'null')
+            elif method == 'GET':
+                request = _query_request(url.query)
+            else:
+                return 405, {'error': f'Method {method} not allowed'}
+            return 200, await self.generate(request)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        except Exception as e: # pylint: disable=broad-except
+            return 500, {'error': str(e)}
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        head = (
+            f'HTTP/1.1 {status} {_REASONS[status]}\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+    #endregion
+
+def _query_request(query):
+    # Query parameters other than the request fields are locked stats
+    request, stats = {}, {}
+    for name, value in urllib.parse.parse_qsl(query):
+        if name in ('cr', 'method', 'solver', 'seed'):
+            request[name] = value
+        else:
+            stats[name] = value
+    if stats:
+        request['stats'] = stats
+    return request
+
+def main(argv=None):
+    """Runs the service until interrupted.
+
+    Args:
+        argv (list, optional): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: Exit code
+    """
+    parser = argparse.ArgumentParser(description='Serve generated statblocks over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='Defaults to 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=8765, help='Defaults to 8765.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Executor workers. Defaults to the executor default.')
+    parser.add_argument('--processes', action='store_true',
+                        help='Use worker processes instead of threads, so scipy solves '
+                             'run in parallel.')
+    parser.add_argument('--batch-window', type=float, default=0.002,
+                        help='Seconds to collect requests into a batch. Defaults to 0.002.')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed.')
+    args = parser.parse_args(argv)
+
+    if args.processes:
+        executor = concurrent.futures.ProcessPoolExecutor(args.workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(args.workers)
+    service = StatblockService(executor, batch_window=args.batch_window, seed=args.seed)
+
+    async def run():
+        server = await service.serve(args.host, args.port)
+        address = server.sockets[0].getsockname()
+        print(f'Serving statblocks on http://{address[0]}:{address[1]}', file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait=False)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Generator pipeline that streams statblocks in chunks.
+
+The stages are plain generators that can be combined freely:
+
+    crs = cr_chunks('1-20', count=10**7, chunk_size=10000, rng=builder.np_random)
+    tables = generate_chunks(crs, builder, method='basic', stats={'ac': 15})
+    write_chunks(format_chunks(tables, 'jsonl'), sys.stdout)
+
+Every stage holds at most one chunk, so memory stays constant however many
+monsters pass through.
+"""
+import csv
+import io
+import itertools
+import json
+
+import numpy as np
+
+from statblock_renderer import CompactRenderer
+
+FORMATS = ('compact', 'jsonl', 'csv')
+# Stats that can be locked, per generation method
+LOCKABLE_STATS = {
+    'basic': ('hp', 'ac', 'tohit', 'damage', 'save_dc'),
+    'optimize': ('hp', 'ac', 'tohit', 'damage', 'save_dc', 'strong_save', 'weak_save'),
+}
+
+def parse_cr_spec(spec):
+    """Parses a CR spec: a single CR like '5' or '0.5', or a range like '1-20'
+    from which CRs are drawn uniformly.
+
+    Args:
+        spec (str): The spec
+
+    Returns:
+        tuple: (low, high), equal for a single CR.
+    """
+    low, sep, high = spec.partition('-')
+    try:
+        low = float(low)
+        high = float(high) if sep else low
+    except ValueError:
+        raise ValueError(f'Invalid CR spec {spec!r}, expected e.g. 5 or 1-20') from None
+    if high < low:
+        raise ValueError(f'Invalid CR spec {spec!r}, the range is empty')
+    return low, high
+
+def parse_stats(items):
+    """Parses locked stats given as 'name=value' strings.
+
+    Args:
+        items (list): Strings like 'ac=17'
+
+    Returns:
+        dict: {name: float}
+    """
+    stats = {}
+    for item in items or ():
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f'Invalid stat {item!r}, expected name=value')
+        stats[name.strip()] = float(value)
+    return stats
+
+def check_generation(builder, spec, method='basic', stats=None, samples=64):
+    """Checks up front that every CR of a spec can be generated with the locked
+    stats, so errors are reported before any output is written. CRs across the
+    range are tried with the extreme offense ratios, using a one-off generator
+    so the builder's random stream is not touched.
+
+    Args:
+        builder (StatblockBuilder): Builder used for the generation.
+        spec (str): CR spec, see parse_cr_spec.
+        method (str, optional): 'basic' or 'optimize'. Defaults to 'basic'.
+        stats (dict, optional): Locked stats. Defaults to None.
+        samples (int, optional): CRs tried. Defaults to 64.
+
+    Raises:
+        ValueError: For unknown methods or stats, and for CRs that cannot be generated.
+    """
+    if method not in LOCKABLE_STATS:
+        raise ValueError(f'Unknown method {method}')
+    unknown = sorted(set(stats or ()) - set(LOCKABLE_STATS[method]))
+    if unknown:
+        raise ValueError(
+            f'Cannot lock {", ".join(unknown)} with the {method} method, '
+            f'choose from {", ".join(LOCKABLE_STATS[method])}')
+    low, high = parse_cr_spec(spec)
+    crs = np.linspace(low, high, samples if high > low else 1)
+    if method == 'basic':
+        builder.make_statblocks_basic(
+            np.repeat(crs, 2), stats, offense_ratio=np.tile([-0.5, 0.0], len(crs)), seed=0)
+    else:
+        builder.make_statblocks_optimize(crs, stats, seed=0)
+
+def cr_chunks(spec, count=None, chunk_size=10000, rng=None):
+    """Yields arrays of CRs.
+
+    Args:
+        spec (str): CR spec, see parse_cr_spec.
+        count (int, optional): Total number of CRs. Defaults to None, endless.
+        chunk_size (int, optional): CRs per array. Defaults to 10000.
+        rng (Generator, optional): NumPy generator for ranges. Defaults to None.
+
+    Yields:
+        ndarray: Up to chunk_size CRs
+    """
+    low, high = parse_cr_spec(spec)
+    rng = np.random.default_rng() if rng is None else rng
+    sizes = itertools.repeat(chunk_size) if count is None else (
+        min(chunk_size, count - start) for start in range(0, count, chunk_size))
+    for size in sizes:
+        if low == high:
+            yield np.full(size, low)
+        else:
+            yield rng.uniform(low, high, size)
+
+def generate_chunks(crs, builder, method='basic', stats=None):
+    """Turns arrays of CRs into StatblockTables.
+
+    Args:
+        crs (iterable): Arrays of CRs, e.g. from cr_chunks.
+        builder (StatblockBuilder): Builder used for every chunk.
+        method (str, optional): 'basic' for make_statblocks_basic, 'optimize' for
+                                make_statblocks_optimize. Defaults to 'basic'.
+        stats (dict, optional): Locked stats for every monster. Defaults to None.
+
+    Yields:
+        StatblockTable: One table per array of CRs
+    """
+    if method == 'basic':
+        make = builder.make_statblocks_basic
+    elif method == 'optimize':
+        make = builder.make_statblocks_optimize
+    else:
+        raise ValueError(f'Unknown method {method}')
+    unknown = set(stats or ()) - set(LOCKABLE_STATS[method])
+    if unknown:
+        raise ValueError(f'Cannot lock {", ".join(sorted(unknown))} with the {method} method')
+    for chunk in crs:
+        yield make(chunk, stats)
+
+def format_chunks(tables, fmt='compact', per_row=1):
+    """Formats StatblockTables as text.
+
+    Args:
+        tables (iterable): StatblockTable objects, e.g. from generate_chunks.
+        fmt (str, optional): One of FORMATS. Defaults to 'compact'.
+        per_row (int, optional): Cards per row for 'compact'. Defaults to 1.
+
+    Yields:
+        str: The text of one table, ending with a newline. Compact grids are
+             joined with the renderer's blank line between rows, so chunks that
+             are a multiple of per_row give the same text as one big table.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt}')
+    renderer = CompactRenderer(per_row=per_row)
+    header = True
+    for table in tables:
+        if fmt == 'compact':
+            separator = '\n' if per_row > 1 and not header else ''
+            header = False
+            yield separator + renderer.render(table) + '\n'
+        elif fmt == 'jsonl':
+            yield _jsonl(table)
+        else:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            if header:
+                writer.writerow(_row_names(table))
+                header = False
+            writer.writerows(_rows(table))
+            yield buffer.getvalue()
+
+def write_chunks(texts, stream, buffer_size=1 << 20):
+    """Writes text chunks to a stream, collecting them into writes of about
+    buffer_size characters.
+
+    Args:
+        texts (iterable): Strings, e.g. from format_chunks.
+        stream (file-like): Anything with a write(str) method.
+        buffer_size (int, optional): Characters per write. Defaults to 1 MiB.
+
+    Returns:
+        int: Number of characters written
+    """
+    pending, pending_size, total = [], 0, 0
+    for text in texts:
+        pending.append(text)
+        pending_size += len(text)
+        if pending_size >= buffer_size:
+            stream.write(''.join(pending))
+            total += pending_size
+            pending, pending_size = [], 0
+    if pending:
+        stream.write(''.join(pending))
+        total += pending_size
+    return total
+
+def _row_names(table):
+    return [name for name in table.names if name != 'damage_type'] + ['damage_type', 'attack']
+
+def _rows(table):
+    names = [name for name in table.names if name != 'damage_type']
+    columns = [table[name].tolist() for name in names]
+    columns.append([dt.name.lower() for dt in table.damage_type_column()])
+    columns.append(table.attack_name_column())
+    return zip(*columns)
+
+def _jsonl(table):
+    # Same output as json.dumps per row, but the keys are encoded once and the
+    # values once per column: repr of ints and finite floats is what json writes.
+    names = _row_names(table)
+    template = '{' + ', '.join(json.dumps(name) + ': %s' for name in names) + '}\n'
+    columns = []
+    for name in names[:-2]:
+        col = table[name]
+        encode = repr if np.isfinite(col).all() else json.dumps
+        columns.append(list(map(encode, col.tolist())))
+    damage_types = [json.dumps(dt.name.lower()) for dt in table.damage_types]
+    columns.append([damage_types[code] for code in table['damage_type'].tolist()])
+    columns.append(list(map(json.dumps, table.attack_name_column())))
+    return ''.join([template % row for row in zip(*columns)])
@@ -0,0 +1,378 @@
+"""Contains the StatblockTable class
+"""
+import numpy as np
+
+from damage_types import DamageType
+from statblock import Statblock
+from abilities import Attack
+
+class StatblockTable():
+    """Column-wise container for many monsters.
+
+    Each stat is stored as one NumPy array with an entry per monster. Statblock
+    objects are only created when a row is accessed, so generating large batches
+    does not pay for Python objects that are never looked at.
+
+    Filtering, slicing and sorting return views: the new table shares the column
+    arrays of the original and only keeps track of which rows it holds.
+
+    Example:
+        table[(table['cr'] >= 5) & (table['ac'] >= 16)]
+        table.where(cr=(5, 8), ac=(16, None)).sort_by('hp_max').mean('damage')
+    """
+    attack_columns = ('tohit', 'n_dice', 'die_size', 'modifier', 'n_attacks')
+    damage_types = tuple(DamageType)
+    aggregates = {
+        'mean': np.nanmean,
+        'median': np.nanmedian,
+        'std': np.nanstd,
+        'min': np.nanmin,
+        'max': np.nanmax,
+        'sum': np.nansum,
+    }
+
+    def __init__(self, columns: dict, attack_name='Slam', rows=None, attack_names=None):
+        """
+        Args:
+            columns (dict): Mapping of column name to array. All arrays must have
+                            the same length. The basic attack is read from the
+                            columns in attack_columns and 'damage_type', which holds
+                            indices into StatblockTable.damage_types.
+            attack_name (str, optional): Name given to the basic attack of every
+                            row. Defaults to 'Slam'.
+            rows (slice or ndarray, optional): Rows of the columns that are in the
+                            table. Defaults to None, i.e. all of them.
+            attack_names (array_like, optional): Name of the basic attack per row of
+                            the columns, used instead of attack_name. Defaults to None.
+        """
+        self._columns = {k: np.asarray(v) for k, v in columns.items()}
+        self.attack_name = attack_name
+        self._attack_names = None
+        if attack_names is not None:
+            self._attack_names = np.asarray(attack_names, dtype=object)
+
+        lengths = {len(v) for v in self._columns.values()}
+        if self._attack_names is not None:
+            lengths.add(len(self._attack_names))
+        if len(lengths) > 1:
+            raise ValueError('All columns must have the same length')
+        self._n_base = lengths.pop() if lengths else 0
+
+        self._rows = rows
+        if rows is None:
+            self._length = self._n_base
+        elif isinstance(rows, slice):
+            self._length = len(range(*rows.indices(self._n_base)))
+        else:
+            self._rows = np.asarray(rows, dtype=np.intp)
+            self._length = len(self._rows)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, (int, np.integer)):
+            return self.get_statblock(key)
+        return self.select(key)
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self.get_statblock(i)
+
+    def __repr__(self):
+        return f'<StatblockTable with {self._length} rows: {", ".join(self.names)}>'
+
+    @property
+    def names(self):
+        """Names of the columns"""
+        return list(self._columns)
+
+    @property
+    def columns(self):
+        """Dict of all columns, restricted to the rows of this table"""
+        return {name: self.column(name) for name in self._columns}
+
+    def column(self, name):
+        """A single column, restricted to the rows of this table. For tables that
+        are not filtered or sorted this is a view of the stored array.
+
+        Args:
+            name (str): Column name
+
+        Returns:
+            ndarray: The column
+        """
+        col = self._columns[name]
+        if self._rows is None:
+            return col
+        return col[self._rows]
+
+    def damage_type_column(self):
+        """The damage type column as DamageType members.
+
+        Returns:
+            list: DamageType of every row's basic attack
+        """
+        return [self.damage_types[code] for code in self.column('damage_type')]
+
+    def attack_name_column(self):
+        """Names of the basic attacks.
+
+        Returns:
+            list: Name of every row's basic attack
+        """
+        if self._attack_names is None:
+            return [self.attack_name] * self._length
+        if self._rows is None:
+            return self._attack_names.tolist()
+        return self._attack_names[self._rows].tolist()
+
+    @classmethod
+    def from_statblocks(cls, statblocks):
+        """Packs Statblock objects into a table. Attributes missing from some of
+        the statblocks are stored as NaN.
+
+        Args:
+            statblocks (iterable): Statblock objects
+
+        Returns:
+            StatblockTable: Table with one row per statblock.
+        """
+        statblocks = list(statblocks)
+        columns = {}
+        for name in Statblock.num_attributes:
+            values = [sb.attributes.get(name) for sb in statblocks]
+            if statblocks and all(v is None for v in values):
+                continue
+            if any(v is None for v in values):
+                columns[name] = np.array([np.nan if v is None else v for v in values], dtype=float)
+            else:
+                columns[name] = np.array(values)
+
+        attacks = [sb.get_basic_attack() for sb in statblocks]
+        attack_name, attack_names = 'Slam', None
+        if attacks and all(attacks):
+            attack_name = attacks[0].name
+            if any(attack.name != attack_name for attack in attacks):
+                attack_names = [attack.name for attack in attacks]
+            for name in cls.attack_columns:
+                columns[name] = np.array([getattr(attack, name) for attack in attacks])
+            columns['damage_type'] = np.array(
+                [cls.damage_types.index(attack.damage_type) for attack in attacks], dtype=np.int8)
+        return cls(columns, attack_name=attack_name, attack_names=attack_names)
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Joins tables with the same columns into one.
+
+        Args:
+            tables (list): StatblockTable objects
+
+        Returns:
+            StatblockTable: Table with the rows of all tables, in order.
+        """
+        tables = list(tables)
+        if not tables:
+            return cls({})
+        columns = {
+            name: np.concatenate([table.column(name) for table in tables])
+            for name in tables[0].names
+        }
+        attack_name, attack_names = tables[0].attack_name, None
+        if any(table._attack_names is not None or table.attack_name != attack_name
+               for table in tables):
+            attack_names = [name for table in tables for name in table.attack_name_column()]
+        return cls(columns, attack_name=attack_name, attack_names=attack_names)
+
+    #region views
+    def select(self, rows):
+        """View of some of the rows of this table.
+
+        Args:
+            rows (slice, ndarray or list): A slice, a boolean mask with one entry
+                            per row, or an array of row indices.
+
+        Returns:
+            StatblockTable: View sharing the columns of this table.
+        """
+        if isinstance(rows, slice):
+            if self._rows is None:
+                return self._view(rows)
+            if isinstance(self._rows, slice):
+                selected = range(*self._rows.indices(self._n_base))[rows]
+                stop = selected.stop if selected.stop >= 0 else None
+                return self._view(slice(selected.start, stop, selected.step))
+            return self._view(self._rows[rows])
+
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            if len(rows) != self._length:
+                raise IndexError('Boolean mask must have one entry per row')
+            rows = np.flatnonzero(rows)
+        if self._rows is None:
+            return self._view(rows)
+        if isinstance(self._rows, slice):
+            return self._view(np.arange(self._n_base)[self._rows][rows])
+        return self._view(self._rows[rows])
+
+    def where(self, **conditions):
+        """View of the rows that satisfy all conditions.
+
+        Each keyword is a column name. The value is either a (low, high) tuple,
+        where both bounds are inclusive and None leaves a side open, or a single
+        value the column must be equal to. For 'damage_type' the value can be a
+        DamageType or a list of them.
+
+        Returns:
+            StatblockTable: View with the matching rows.
+        """
+        mask = np.ones(self._length, dtype=bool)
+        for name, condition in conditions.items():
+            col = self.column(name)
+            if name == 'damage_type' and not isinstance(condition, tuple):
+                if isinstance(condition, DamageType):
+                    condition = [condition]
+                codes = [self.damage_types.index(dt) for dt in condition]
+                mask &= np.isin(col, codes)
+            elif isinstance(condition, tuple):
+                low, high = condition
+                if low is not None:
+                    mask &= col >= low
+                if high is not None:
+                    mask &= col <= high
+            else:
+                mask &= col == condition
+        return self.select(mask)
+
+    def sort_by(self, name, descending=False):
+        """View of the table sorted by one column. Ties keep their order.
+
+        Args:
+            name (str): Column to sort by.
+            descending (bool, optional): Sort from high to low. Defaults to False.
+
+        Returns:
+            StatblockTable: Sorted view.
+        """
+        col = self.column(name)
+        order = np.argsort(-col if descending else col, kind='stable')
+        return self.select(order)
+
+    def _view(self, rows):
+        return StatblockTable(self._columns, attack_name=self.attack_name, rows=rows,
+                              attack_names=self._attack_names)
+
+    def _base_row(self, i):
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError('StatblockTable index out of range')
+        if self._rows is None:
+            return i
+        if isinstance(self._rows, slice):
+            return range(*self._rows.indices(self._n_base))[i]
+        return self._rows[i]
+    #endregion
+
+    #region aggregates
+    def aggregate(self, name, how='mean'):
+        """Aggregates one column, ignoring NaN.
+
+        Args:
+            name (str): Column name
+            how (str, optional): One of StatblockTable.aggregates. Defaults to 'mean'.
+
+        Returns:
+            float: The aggregate, NaN for an empty table.
+        """
+        if self._length == 0:
+            return float('nan')
+        return self.aggregates[how](self.column(name)).item()
+
+    def mean(self, name):
+        """Mean of a column"""
+        return self.aggregate(name, 'mean')
+
+    def min(self, name):
+        """Minimum of a column"""
+        return self.aggregate(name, 'min')
+
+    def max(self, name):
+        """Maximum of a column"""
+        return self.aggregate(name, 'max')
+
+    def sum(self, name):
+        """Sum of a column"""
+        return self.aggregate(name, 'sum')
+
+    def describe(self, names=None):
+        """Summary statistics of several columns.
+
+        Args:
+            names (list, optional): Columns to describe. Defaults to all columns
+                            except 'damage_type'.
+
+        Returns:
+            dict: {column: {aggregate: value}}
+        """
+        if names is None:
+            names = [name for name in self._columns if name != 'damage_type']
+        return {
+            name: {how: self.aggregate(name, how) for how in self.aggregates}
+            for name in names
+        }
+
+    def damage_type_counts(self):
+        """Number of rows per damage type.
+
+        Returns:
+            dict: {DamageType: count} for the damage types that occur.
+        """
+        counts = np.bincount(self.column('damage_type'), minlength=len(self.damage_types))
+        return {dt: int(c) for dt, c in zip(self.damage_types, counts) if c}
+    #endregion
+
+    def get_statblock(self, i):
+        """Materializes a single row as a Statblock.
+
+        Args:
+            i (int): Row index
+
+        Returns:
+            Statblock: A new Statblock object for the row.
+        """
+        i = self._base_row(i)
+        columns = self._columns
+
+        stats = {}
+        for name in Statblock.num_attributes:
+            if name in columns:
+                value = columns[name][i].item()
+                # NaN marks an attribute missing from this row
+                if value == value:
+                    stats[name] = value
+
+        if all(name in columns for name in self.attack_columns):
+            attack = Attack(
+                self.attack_name if self._attack_names is None else self._attack_names[i],
+                columns['tohit'][i].item(),
+                columns['n_dice'][i].item(),
+                columns['die_size'][i].item(),
+                columns['modifier'][i].item(),
+                self.damage_types[columns['damage_type'][i]],
+                columns['n_attacks'][i].item(),
+            )
+            stats['actions'] = [attack]
+            stats['basic_attack'] = attack
+
+        return Statblock(stats)
+
+    def to_statblocks(self):
+        """Materializes every row.
+
+        Returns:
+            list: List of Statblock objects
+        """
+        return list(self)